@@ -7,14 +7,93 @@
   const PORT = 8766;
   let ws;
 
+  const nowMs = () => performance.timeOrigin + performance.now();
+
+  // Commands carry a "trace" of hop marks (epoch ms); hops that forward
+  // without decoding add top-level "trace_<mark>" keys, folded in here.
+  function startTrace(message) {
+    if (!message.trace) return null;
+    const trace = { ...message.trace };
+    for (const key of Object.keys(message)) {
+      if (key.startsWith("trace_")) trace[key.slice(6)] = message[key];
+    }
+    trace.page_in = nowMs();
+    return trace;
+  }
+
+  // Relays that set "envelope" on a command route replies by a one-line
+  // "@<request_id> <kind>" header and never decode the body: raw text for
+  // deltas, JSON for results. Older relays get plain JSON messages.
+  function envelopeSender(requestId) {
+    return {
+      delta: (content) => ws.send(`@${requestId} delta\n${content}`),
+      result: (reply) =>
+        ws.send(`@${requestId} result\n${JSON.stringify(reply)}`),
+    };
+  }
+
+  function jsonSender(requestId) {
+    return {
+      delta: (content) =>
+        ws.send(
+          JSON.stringify({
+            type: "delta",
+            content: content,
+            request_id: requestId,
+          }),
+        ),
+      result: (reply) =>
+        ws.send(JSON.stringify({ ...reply, request_id: requestId })),
+    };
+  }
+
+  async function readTurnStream(messageResponse, emitDelta, mark) {
+    const reader = messageResponse.body.getReader();
+    const decoder = new TextDecoder();
+    let fullResponse = "";
+    let pending = "";
+    let firstChunk = true;
+
+    while (true) {
+      const result = await reader.read();
+      if (result.done) break;
+      if (firstChunk) {
+        mark("fetch_ttfb");
+        firstChunk = false;
+      }
+
+      pending += decoder.decode(result.value, { stream: true });
+      const lines = pending.split("\n");
+      pending = lines.pop();
+
+      for (const line of lines) {
+        if (line.startsWith("data: ") && !line.includes("[DONE]")) {
+          const data = line.slice(6);
+          try {
+            const parsed = JSON.parse(data);
+            const content = parsed.choices?.[0]?.delta?.content;
+            if (content) {
+              fullResponse += content;
+              if (emitDelta) emitDelta(content);
+            }
+          } catch (e) {}
+        }
+      }
+    }
+
+    mark("fetch_end");
+    return fullResponse;
+  }
+
   const commandHandlers = {
-    createConversation: async (params) => {
+    createConversation: async (params, emitDelta, mark) => {
       const { prompt, model, systemMessage } = params;
       const baseUrl = "https://app.outlier.ai/internal/experts/assistant";
 
       const csrfMatch = document.cookie.match(/_csrf=([^;]+)/);
       const csrfToken = csrfMatch ? decodeURIComponent(csrfMatch[1]) : "";
 
+      mark("fetch_start");
       const createResponse = await fetch(baseUrl + "/conversations", {
         method: "POST",
         headers: {
@@ -65,29 +144,11 @@
         throw new Error("Failed to send message: " + messageResponse.status);
       }
 
-      const reader = messageResponse.body.getReader();
-      const decoder = new TextDecoder();
-      let fullResponse = "";
-
-      while (true) {
-        const result = await reader.read();
-        if (result.done) break;
-
-        const chunk = decoder.decode(result.value);
-        const lines = chunk.split("\n");
-
-        for (const line of lines) {
-          if (line.startsWith("data: ") && !line.includes("[DONE]")) {
-            const data = line.slice(6);
-            try {
-              const parsed = JSON.parse(data);
-              if (parsed.choices?.[0]?.delta?.content) {
-                fullResponse += parsed.choices[0].delta.content;
-              }
-            } catch (e) {}
-          }
-        }
-      }
+      const fullResponse = await readTurnStream(
+        messageResponse,
+        emitDelta,
+        mark,
+      );
 
       return {
         success: true,
@@ -96,13 +157,14 @@
       };
     },
 
-    sendMessage: async (params) => {
+    sendMessage: async (params, emitDelta, mark) => {
       const { conversationId, prompt, model, systemMessage } = params;
       const baseUrl = "https://app.outlier.ai/internal/experts/assistant";
 
       const csrfMatch = document.cookie.match(/_csrf=([^;]+)/);
       const csrfToken = csrfMatch ? decodeURIComponent(csrfMatch[1]) : "";
 
+      mark("fetch_start");
       const messageResponse = await fetch(
         baseUrl + "/conversations/" + conversationId + "/turn-streaming",
         {
@@ -132,29 +194,11 @@
         throw new Error("Failed to send message: " + messageResponse.status);
       }
 
-      const reader = messageResponse.body.getReader();
-      const decoder = new TextDecoder();
-      let fullResponse = "";
-
-      while (true) {
-        const result = await reader.read();
-        if (result.done) break;
-
-        const chunk = decoder.decode(result.value);
-        const lines = chunk.split("\n");
-
-        for (const line of lines) {
-          if (line.startsWith("data: ") && !line.includes("[DONE]")) {
-            const data = line.slice(6);
-            try {
-              const parsed = JSON.parse(data);
-              if (parsed.choices?.[0]?.delta?.content) {
-                fullResponse += parsed.choices[0].delta.content;
-              }
-            } catch (e) {}
-          }
-        }
-      }
+      const fullResponse = await readTurnStream(
+        messageResponse,
+        emitDelta,
+        mark,
+      );
 
       return { success: true, response: fullResponse };
     },
@@ -174,25 +218,33 @@
         message = JSON.parse(event.data);
 
         if (message.command && commandHandlers[message.command]) {
+          const params = message.params || {};
+          const trace = startTrace(message);
+          const mark = (name) => {
+            if (trace) trace[name] = nowMs();
+          };
+          const withTrace = (reply) => {
+            if (trace) {
+              mark("page_out");
+              reply.trace = trace;
+            }
+            return reply;
+          };
+          const send = message.envelope
+            ? envelopeSender(message.request_id)
+            : jsonSender(message.request_id);
+          const emitDelta = params.stream
+            ? (content) => send.delta(content)
+            : null;
           try {
             const result = await commandHandlers[message.command](
-              message.params || {},
-            );
-            ws.send(
-              JSON.stringify({
-                success: true,
-                result: result,
-                request_id: message.request_id,
-              }),
+              params,
+              emitDelta,
+              mark,
             );
+            send.result(withTrace({ success: true, result: result }));
           } catch (error) {
-            ws.send(
-              JSON.stringify({
-                success: false,
-                error: error.message,
-                request_id: message.request_id,
-              }),
-            );
+            send.result(withTrace({ success: false, error: error.message }));
           }
         } else {
           ws.send(
@@ -1,6 +1,22 @@
 import asyncio
 import websockets
 import os
+import time
+
+
+def add_trace_mark(message, name):
+    """Stamp traced messages on their way through without decoding them."""
+    if not isinstance(message, str) or not message.endswith("}"):
+        return message
+    if message.startswith("@"):
+        # Envelope frame: only results carry a JSON body to stamp, and the
+        # header says which kind this is.
+        header = message[: message.find("\n")]
+        if not header.endswith(" result"):
+            return message
+    elif '"trace":' not in message:
+        return message
+    return f'{message[:-1]},"trace_{name}":{time.time() * 1000}}}'
 
 
 async def proxy_handler(client_websocket):
@@ -15,14 +31,16 @@ async def proxy_handler(client_websocket):
             async def client_to_server():
                 try:
                     async for message in client_websocket:
-                        await server_websocket.send(message)
+                        await server_websocket.send(add_trace_mark(message, "proxy_up"))
                 except websockets.exceptions.ConnectionClosed:
                     pass
 
             async def server_to_client():
                 try:
                     async for message in server_websocket:
-                        await client_websocket.send(message)
+                        await client_websocket.send(
+                            add_trace_mark(message, "proxy_down")
+                        )
                 except websockets.exceptions.ConnectionClosed:
                     pass
 
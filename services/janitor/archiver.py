@@ -0,0 +1,310 @@
+#!/usr/bin/env python3
+"""
+Incremental janitor for the data directory.
+
+Replaces the du/tar sweep of cleanup.sh with a single pass that:
+
+- lists the top level of DATA_DIR once and only re-walks entries whose
+  mtime changed, resuming from a persisted cursor when JANITOR_SCAN_LIMIT
+  caps how many are re-walked per run
+- streams conversations older than MAX_FILE_AGE_DAYS, and old log
+  segments, into one zstd (or gzip) tar per run, next to a JSON index of
+  what went into it
+- enforces MAX_DATA_SIZE_MB from the cached per-entry sizes, archiving the
+  oldest conversations until the total fits
+- removes raw dumps older than MAX_FILE_AGE_DAYS, response cache entries
+  older than CACHE_MAX_AGE_HOURS and archives older than
+  ARCHIVE_RETENTION_DAYS
+
+Sizes and cursor are kept in ARCHIVE_DIR/.janitor_state.json.
+"""
+
+import json
+import os
+import shutil
+import sys
+import tarfile
+import time
+from datetime import datetime
+from pathlib import Path
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+DATA_DIR = Path(os.getenv("DATA_DIR", "/app/data"))
+ARCHIVE_DIR = Path(os.getenv("ARCHIVE_DIR", "/app/archives"))
+MAX_DATA_SIZE_MB = int(os.getenv("MAX_DATA_SIZE_MB", "1024"))
+MAX_FILE_AGE_DAYS = int(os.getenv("MAX_FILE_AGE_DAYS", "30"))
+ARCHIVE_RETENTION_DAYS = int(os.getenv("ARCHIVE_RETENTION_DAYS", "90"))
+CACHE_MAX_AGE_HOURS = int(os.getenv("CACHE_MAX_AGE_HOURS", "24"))
+SCAN_LIMIT = int(os.getenv("JANITOR_SCAN_LIMIT", "0"))
+LOG_FILE = os.getenv("LOG_FILE", "/var/log/janitor/cleanup.log")
+STATE_FILE = ARCHIVE_DIR / ".janitor_state.json"
+
+# Top-level entries the OAI service owns that are not conversations.
+SPECIAL_DIRS = {"raw_dumps", "logs", "cache"}
+ARCHIVE_SUFFIXES = (".tar.zst", ".tar.gz", ".index.json")
+
+
+def log(message):
+    line = f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] {message}"
+    print(line, flush=True)
+    try:
+        with open(LOG_FILE, "a", encoding="utf-8") as f:
+            f.write(line + "\n")
+    except OSError:
+        pass
+
+
+def tree_size(path: Path) -> int:
+    total = 0
+    stack = [path]
+    while stack:
+        try:
+            with os.scandir(stack.pop()) as entries:
+                for entry in entries:
+                    if entry.is_dir(follow_symlinks=False):
+                        stack.append(entry.path)
+                    else:
+                        total += entry.stat(follow_symlinks=False).st_size
+        except OSError:
+            pass
+    return total
+
+
+def load_state() -> dict:
+    try:
+        return json.loads(STATE_FILE.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return {"cursor": "", "entries": {}}
+
+
+def save_state(state: dict):
+    tmp_path = STATE_FILE.with_suffix(".tmp")
+    tmp_path.write_text(json.dumps(state), encoding="utf-8")
+    os.replace(tmp_path, STATE_FILE)
+
+
+class ArchiveWriter:
+    """One streamed tar per run, opened on the first member."""
+
+    def __init__(self, folder: Path):
+        stamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        suffix = ".tar.zst" if zstandard else ".tar.gz"
+        self.path = folder / f"conversations_{stamp}{suffix}"
+        self.index_path = folder / f"conversations_{stamp}.index.json"
+        self.index = []
+        self._raw = None
+        self._stream = None
+        self._tar = None
+
+    def add(self, path: Path, arcname: str, kind: str):
+        if self._tar is None:
+            self._raw = open(self.path, "wb")
+            if zstandard:
+                self._stream = zstandard.ZstdCompressor(level=10).stream_writer(
+                    self._raw
+                )
+                self._tar = tarfile.open(fileobj=self._stream, mode="w|")
+            else:
+                self._tar = tarfile.open(fileobj=self._raw, mode="w|gz")
+        self._tar.add(str(path), arcname=arcname)
+        self.index.append(
+            {
+                "name": arcname,
+                "kind": kind,
+                "bytes": tree_size(path) if path.is_dir() else path.stat().st_size,
+                "mtime": path.stat().st_mtime,
+            }
+        )
+
+    def close(self) -> bool:
+        if self._tar is None:
+            return False
+        self._tar.close()
+        if self._stream is not None:
+            self._stream.close()
+        else:
+            self._raw.close()
+        self.index_path.write_text(json.dumps(self.index, indent=2), encoding="utf-8")
+        return True
+
+
+def scan(state: dict) -> dict:
+    """Refresh cached sizes for entries whose mtime changed since last run."""
+    cached = state.get("entries", {})
+    listing = {}
+    with os.scandir(DATA_DIR) as entries:
+        for entry in entries:
+            try:
+                stat = entry.stat(follow_symlinks=False)
+            except OSError:
+                continue
+            listing[entry.name] = (entry.is_dir(follow_symlinks=False), stat)
+
+    names = sorted(listing)
+    cursor = state.get("cursor", "")
+    ordered = [n for n in names if n > cursor] + [n for n in names if n <= cursor]
+    rescanned = 0
+    refreshed = {}
+    for name in ordered:
+        is_dir, stat = listing[name]
+        previous = cached.get(name)
+        if previous and previous["mtime"] == stat.st_mtime:
+            refreshed[name] = previous
+            continue
+        if SCAN_LIMIT and rescanned >= SCAN_LIMIT:
+            if previous:
+                refreshed[name] = previous
+            continue
+        if name == "raw_dumps":
+            # Measured while pruning, which walks it anyway.
+            refreshed[name] = previous or {"bytes": 0, "mtime": None, "dir": True}
+            continue
+        size = tree_size(DATA_DIR / name) if is_dir else stat.st_size
+        # Special directories change mtime only when subfolders are added,
+        # so they are always re-measured; mark them with mtime None.
+        mtime = None if name in SPECIAL_DIRS else stat.st_mtime
+        refreshed[name] = {"bytes": size, "mtime": mtime, "dir": is_dir}
+        rescanned += 1
+        state["cursor"] = name
+    if not SCAN_LIMIT or rescanned < SCAN_LIMIT:
+        state["cursor"] = ""
+    log(f"Scanned {len(listing)} entries, re-measured {rescanned}")
+    state["entries"] = refreshed
+    return listing
+
+
+def is_conversation(name: str, entry: dict) -> bool:
+    return entry.get("dir") and name not in SPECIAL_DIRS
+
+
+def archive_conversation(writer, state, name) -> bool:
+    path = DATA_DIR / name
+    try:
+        writer.add(path, name, "conversation")
+    except OSError as e:
+        log(f"WARNING: Failed to archive {name}: {e}")
+        return False
+    state["entries"].pop(name, None)
+    return True
+
+
+def archive_old_segments(writer, cutoff) -> list:
+    logs_dir = DATA_DIR / "logs"
+    archived = []
+    if not logs_dir.is_dir():
+        return archived
+    segments = sorted(logs_dir.glob("segment-*"))
+    # The newest segment may still be open for appends.
+    for segment in segments[:-1]:
+        if segment.stat().st_mtime < cutoff:
+            writer.add(segment, f"logs/{segment.name}", "segment")
+            archived.append(segment)
+    return archived
+
+
+def prune_files(folder: Path, cutoff: float, suffixes) -> tuple:
+    """Delete matching files older than cutoff; returns (deleted, bytes kept)."""
+    deleted = kept = 0
+    if not folder.is_dir():
+        return deleted, kept
+    for root, _, files in os.walk(folder):
+        for file_name in files:
+            path = Path(root) / file_name
+            try:
+                stat = path.stat()
+                if file_name.endswith(suffixes) and stat.st_mtime < cutoff:
+                    path.unlink()
+                    deleted += 1
+                else:
+                    kept += stat.st_size
+            except OSError:
+                pass
+    return deleted, kept
+
+
+def main() -> int:
+    if not DATA_DIR.is_dir():
+        log(f"ERROR: Data directory {DATA_DIR} does not exist")
+        return 1
+    ARCHIVE_DIR.mkdir(parents=True, exist_ok=True)
+    now = time.time()
+    age_cutoff = now - MAX_FILE_AGE_DAYS * 86400
+    budget = MAX_DATA_SIZE_MB * 1024 * 1024
+
+    log("==========================================")
+    log("Starting incremental cleanup")
+    state = load_state()
+    listing = scan(state)
+    entries = state["entries"]
+
+    writer = ArchiveWriter(ARCHIVE_DIR)
+    archived = []
+    for name, entry in sorted(entries.items()):
+        if is_conversation(name, entry) and listing[name][1].st_mtime < age_cutoff:
+            if archive_conversation(writer, state, name):
+                archived.append(name)
+    log(f"Archived {len(archived)} old conversation(s)")
+
+    total = sum(entry["bytes"] for entry in state["entries"].values())
+    log(f"Current data size: {total // (1024 * 1024)}MB / {MAX_DATA_SIZE_MB}MB")
+    if total > budget:
+        log("WARNING: Data size exceeds limit, archiving oldest conversations...")
+        oldest_first = sorted(
+            (
+                (listing[name][1].st_mtime, name)
+                for name, entry in state["entries"].items()
+                if is_conversation(name, entry)
+            )
+        )
+        for _, name in oldest_first:
+            if total <= budget:
+                break
+            size = state["entries"][name]["bytes"]
+            if archive_conversation(writer, state, name):
+                archived.append(name)
+                total -= size
+        log(f"New data size: {total // (1024 * 1024)}MB")
+
+    segments = archive_old_segments(writer, age_cutoff)
+    if writer.close():
+        # Only delete sources once the archive and its index are complete.
+        for name in archived:
+            shutil.rmtree(DATA_DIR / name, ignore_errors=True)
+        for segment in segments:
+            segment.unlink(missing_ok=True)
+        log(f"Wrote {writer.path.name} ({len(writer.index)} members)")
+
+    deleted_dumps, dumps_bytes = prune_files(
+        DATA_DIR / "raw_dumps", age_cutoff, (".md", ".jsonl")
+    )
+    if "raw_dumps" in state["entries"]:
+        state["entries"]["raw_dumps"]["bytes"] = dumps_bytes
+    log(f"Deleted {deleted_dumps} old raw dump file(s)")
+
+    cache_cutoff = now - CACHE_MAX_AGE_HOURS * 3600
+    deleted_cache, cache_bytes = prune_files(
+        DATA_DIR / "cache", cache_cutoff, (".json", ".tmp")
+    )
+    if "cache" in state["entries"]:
+        state["entries"]["cache"]["bytes"] = cache_bytes
+    log(f"Deleted {deleted_cache} expired cache file(s)")
+
+    retention_cutoff = now - ARCHIVE_RETENTION_DAYS * 86400
+    deleted_archives, _ = prune_files(ARCHIVE_DIR, retention_cutoff, ARCHIVE_SUFFIXES)
+    log(f"Deleted {deleted_archives} old archive file(s)")
+
+    save_state(state)
+    conversations = sum(
+        1 for name, entry in state["entries"].items() if is_conversation(name, entry)
+    )
+    log(f"Active conversations: {conversations}")
+    log("Cleanup process completed successfully")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -7,8 +7,17 @@ ARCHIVE_DIR="${ARCHIVE_DIR:-/app/archives}"
 MAX_DATA_SIZE_MB="${MAX_DATA_SIZE_MB:-1024}"
 MAX_FILE_AGE_DAYS="${MAX_FILE_AGE_DAYS:-30}"
 ARCHIVE_RETENTION_DAYS="${ARCHIVE_RETENTION_DAYS:-90}"
+CACHE_MAX_AGE_HOURS="${CACHE_MAX_AGE_HOURS:-24}"
 LOG_FILE="${LOG_FILE:-/var/log/janitor/cleanup.log}"
 
+# Top-level directories of the OAI service that are not conversations
+is_special_dir() {
+    case "$1" in
+        raw_dumps|logs|cache) return 0 ;;
+        *) return 1 ;;
+    esac
+}
+
 log() {
     echo "[$(date '+%Y-%m-%d %H:%M:%S')] $*" | tee -a "$LOG_FILE"
 }
@@ -27,6 +36,7 @@ log "Archive dir: $ARCHIVE_DIR"
 log "Max size: ${MAX_DATA_SIZE_MB}MB"
 log "Max age: ${MAX_FILE_AGE_DAYS} days"
 log "Archive retention: ${ARCHIVE_RETENTION_DAYS} days"
+log "Cache max age: ${CACHE_MAX_AGE_HOURS} hours"
 
 get_dir_size_mb() {
     du -sm "$1" 2>/dev/null | cut -f1 || echo 0
@@ -40,7 +50,7 @@ archive_old_conversations() {
     local archive_file="${ARCHIVE_DIR}/conversations_${timestamp}.tar.gz"
 
     while IFS= read -r -d '' conv_dir; do
-        if [ -d "$conv_dir" ] && [ "$(basename "$conv_dir")" != "raw_dumps" ]; then
+        if [ -d "$conv_dir" ] && [ "$conv_dir" != "$DATA_DIR" ] && ! is_special_dir "$(basename "$conv_dir")"; then
             local mod_time=$(stat -c %Y "$conv_dir" 2>/dev/null || stat -f %m "$conv_dir" 2>/dev/null || echo 0)
             local current_time=$(date +%s)
             local age_days=$(( (current_time - mod_time) / 86400 ))
@@ -90,11 +100,27 @@ cleanup_raw_dumps() {
             rm -f "$file"
             deleted_count=$((deleted_count + 1))
         fi
-    done < <(find "$raw_dumps_dir" -type f -name "*.md" -print0 2>/dev/null)
+    done < <(find "$raw_dumps_dir" -type f \( -name "*.md" -o -name "*.jsonl" \) -print0 2>/dev/null)
 
     log "Deleted $deleted_count old raw dump file(s)"
 }
 
+cleanup_cache() {
+    log "Cleaning up expired response cache entries..."
+
+    local cache_dir="${DATA_DIR}/cache"
+
+    if [ ! -d "$cache_dir" ]; then
+        log "No cache directory found, skipping"
+        return
+    fi
+
+    local deleted_count=$(find "$cache_dir" -type f \( -name "*.json" -o -name "*.tmp" \) -mmin +$((CACHE_MAX_AGE_HOURS * 60)) -print -delete 2>/dev/null | wc -l)
+    find "$cache_dir" -mindepth 1 -type d -empty -delete 2>/dev/null || true
+
+    log "Deleted $deleted_count expired cache file(s)"
+}
+
 enforce_size_limit() {
     log "Checking data directory size..."
 
@@ -110,7 +136,7 @@ enforce_size_limit() {
 
     local removed_count=0
     while [ "$(get_dir_size_mb "$DATA_DIR")" -gt "$MAX_DATA_SIZE_MB" ]; do
-        local oldest_dir=$(find "$DATA_DIR" -maxdepth 1 -type d ! -name "raw_dumps" ! -path "$DATA_DIR" -printf '%T+ %p\n' 2>/dev/null | \
+        local oldest_dir=$(find "$DATA_DIR" -maxdepth 1 -type d ! -name "raw_dumps" ! -name "logs" ! -name "cache" ! -path "$DATA_DIR" -printf '%T+ %p\n' 2>/dev/null | \
                           sort | head -n 1 | cut -d' ' -f2-)
 
         if [ -z "$oldest_dir" ] || [ ! -d "$oldest_dir" ]; then
@@ -163,7 +189,7 @@ generate_report() {
     log "Data directory size: $(get_dir_size_mb "$DATA_DIR")MB"
     log "Archive directory size: $(get_dir_size_mb "$ARCHIVE_DIR")MB"
 
-    local conv_count=$(find "$DATA_DIR" -maxdepth 1 -type d ! -path "$DATA_DIR" ! -name "raw_dumps" 2>/dev/null | wc -l)
+    local conv_count=$(find "$DATA_DIR" -maxdepth 1 -type d ! -path "$DATA_DIR" ! -name "raw_dumps" ! -name "logs" ! -name "cache" 2>/dev/null | wc -l)
     log "Active conversations: $conv_count"
 
     local archive_count=$(find "$ARCHIVE_DIR" -type f -name "*.tar.gz" 2>/dev/null | wc -l)
@@ -184,6 +210,8 @@ main() {
 
     cleanup_raw_dumps
 
+    cleanup_cache
+
     enforce_size_limit
 
     cleanup_old_archives
@@ -3,6 +3,9 @@ set -e
 
 LOG_DIR="/var/log/janitor"
 CLEANUP_SCRIPT="/app/cleanup.sh"
+if [ "${JANITOR_MODE:-shell}" = "python" ]; then
+    CLEANUP_SCRIPT="/app/archiver.py"
+fi
 DATA_DIR="${DATA_DIR:-/app/data}"
 ARCHIVE_DIR="${ARCHIVE_DIR:-/app/archives}"
 CLEANUP_INTERVAL_HOURS="${CLEANUP_INTERVAL_HOURS:-24}"
@@ -14,9 +17,11 @@ echo "[$(date '+%Y-%m-%d %H:%M:%S')] Configuration:" | tee -a "$LOG_DIR/janitor.
 echo "  - Data directory: $DATA_DIR" | tee -a "$LOG_DIR/janitor.log"
 echo "  - Archive directory: $ARCHIVE_DIR" | tee -a "$LOG_DIR/janitor.log"
 echo "  - Cleanup interval: ${CLEANUP_INTERVAL_HOURS}h" | tee -a "$LOG_DIR/janitor.log"
+echo "  - Mode: ${JANITOR_MODE:-shell} ($CLEANUP_SCRIPT)" | tee -a "$LOG_DIR/janitor.log"
 echo "  - Max data size: ${MAX_DATA_SIZE_MB:-1024}MB" | tee -a "$LOG_DIR/janitor.log"
 echo "  - Max file age: ${MAX_FILE_AGE_DAYS:-30} days" | tee -a "$LOG_DIR/janitor.log"
 echo "  - Archive retention: ${ARCHIVE_RETENTION_DAYS:-90} days" | tee -a "$LOG_DIR/janitor.log"
+echo "  - Cache max age: ${CACHE_MAX_AGE_HOURS:-24}h" | tee -a "$LOG_DIR/janitor.log"
 
 mkdir -p "$DATA_DIR" "$ARCHIVE_DIR"
 
@@ -45,7 +50,7 @@ CRON_FILE="/tmp/janitor-cron"
 cat > "$CRON_FILE" <<EOF
 # Janitor cleanup cron job
 # Runs cleanup script at configured interval
-${CRON_SCHEDULE} /app/cleanup.sh >> ${LOG_DIR}/cleanup.log 2>&1
+${CRON_SCHEDULE} ${CLEANUP_SCRIPT} >> ${LOG_DIR}/cleanup.log 2>&1
 
 # Logrotate runs daily at 3 AM
 0 3 * * * /usr/sbin/logrotate -f /etc/logrotate.d/outlier-data >> ${LOG_DIR}/logrotate.log 2>&1
@@ -1,35 +1,69 @@
+import os
 import re
 import json
-import uuid
-from pathlib import Path
+import time
+import tracing
+from app_log import get_log, payload
+from metrics import CACHE_LOOKUPS, PARSE_SECONDS, TEMPLATE_SECONDS
 from send import send_script_async
-from template_composer import TemplateComposer
+from stream_parser import parse_response
+from template_composer import PromptDelta, TemplateComposer
 from prompt_utils import (
     to_tool_calling_prompt,
     extract_client_instructions,
     extract_context_tag,
 )
 
+FINAL_ANSWER_TAG_RE = re.compile(r"<final_answer>", re.IGNORECASE)
+
+log = get_log("agent")
+
 
 class AgentWorkflow:
-    def __init__(
-        self, get_conversation_callback, set_conversation_callback, log_callback
-    ):
-        print("[Agent] Initializing with smolagents pattern")
-        self.get_conversation_id = get_conversation_callback
-        self.set_conversation_id = set_conversation_callback
+    def __init__(self, log_callback, response_cache=None):
+        log.debug("Initializing with smolagents pattern")
         self.log_callback = log_callback
+        self.response_cache = response_cache
         self.composer = TemplateComposer()
         self.max_steps = 20
-        self.step_number = 0
+        self.prompt_delta = os.getenv("oai_prompt_delta", "true").lower() == "true"
+
+    async def _cache_lookup(
+        self, use_cache, model, prompt, system_message, conversation_id=None
+    ):
+        if not (use_cache and self.response_cache):
+            return None, None
+        key = self.response_cache.make_key(
+            model, prompt, system_message, conversation_id
+        )
+        cached = await self.response_cache.get(key)
+        CACHE_LOOKUPS.labels("hit" if cached else "miss").inc()
+        return key, cached
 
     async def get_or_create_conversation(
-        self, model, first_prompt=None, first_system=None
+        self,
+        session,
+        model,
+        first_prompt=None,
+        first_system=None,
+        on_delta=None,
+        delta=None,
+    ):
+        async with session.lock:
+            return await self._get_or_create_conversation(
+                session, model, first_prompt, first_system, on_delta, delta
+            )
+
+    async def _get_or_create_conversation(
+        self, session, model, first_prompt, first_system, on_delta, delta
     ):
-        conversation_id = self.get_conversation_id()
+        # Creation is never served from the response cache: a cached
+        # conversationId would bind unrelated sessions to one Outlier
+        # conversation and mix their histories.
+        conversation_id = session.conversation_id
 
         if conversation_id:
-            print(f"[Agent Workflow] Using existing conversation: {conversation_id}")
+            log.debug("Using existing conversation: %s", conversation_id)
             return conversation_id, None
 
         input_data = {
@@ -38,9 +72,11 @@ class AgentWorkflow:
             "systemMessage": first_system or "",
         }
 
-        print(f"[Agent Workflow] Creating new conversation for model: {model}")
-        result = await send_script_async("create_conversation.js", input_data)
-        print(f"[Agent Workflow] Create conversation result: {result}")
+        log.info("Creating new conversation for model: %s", model)
+        started = time.perf_counter()
+        result = await send_script_async("create_conversation.js", input_data, on_delta)
+        latency = time.perf_counter() - started
+        log.debug("Create conversation result: %s", payload(result))
 
         if result.get("success"):
             parsed_result = result.get("result")
@@ -56,11 +92,23 @@ class AgentWorkflow:
                 and parsed_result.get("conversationId")
             ):
                 conversation_id = parsed_result["conversationId"]
-                self.set_conversation_id(conversation_id)
-                print(f"[Agent] Created and cached conversation ID: {conversation_id}")
+                session.conversation_id = conversation_id
+                log.info("Created conversation: %s", conversation_id)
+                if delta:
+                    delta.commit()
+                if parsed_result.get("response"):
+                    self.log_callback(
+                        conversation_id,
+                        input_data["prompt"],
+                        input_data["systemMessage"],
+                        parsed_result["response"],
+                        model=model,
+                        latency=latency,
+                        timing=tracing.spans(result.get("trace")),
+                    )
                 return conversation_id, parsed_result.get("response")
 
-        print(f"[Agent Workflow] Failed to create conversation: {result}")
+        log.warning("Failed to create conversation: %s", payload(result))
         return None, None
 
     async def send_to_outlier(
@@ -69,6 +117,9 @@ class AgentWorkflow:
         prompt,
         model,
         system_message="",
+        on_delta=None,
+        use_cache=True,
+        delta=None,
     ):
         input_data = {
             "conversationId": conversation_id,
@@ -77,8 +128,20 @@ class AgentWorkflow:
             "systemMessage": system_message,
         }
 
-        print(f"[Agent] Sending prompt ({len(prompt)} chars) to Outlier")
-        result = await send_script_async("send_message.js", input_data)
+        cache_key, cached = await self._cache_lookup(
+            use_cache, model, prompt, system_message, conversation_id
+        )
+        if cached:
+            # Nothing went upstream, so the prompt delta is not committed.
+            log.info("Cache hit (%d chars)", len(cached["response"]))
+            if on_delta:
+                await on_delta(cached["response"])
+            return cached["response"], cached
+
+        log.info("Sending prompt (%d chars) to Outlier", len(prompt))
+        started = time.perf_counter()
+        result = await send_script_async("send_message.js", input_data, on_delta)
+        latency = time.perf_counter() - started
 
         if result.get("success"):
             parsed_result = result.get("result")
@@ -90,66 +153,62 @@ class AgentWorkflow:
 
             if parsed_result and isinstance(parsed_result, dict):
                 response = parsed_result.get("response", "")
-                print(f"[Agent] Got response ({len(response)} chars) from Outlier")
-
-                self.log_callback(conversation_id, prompt, system_message, response)
+                log.info("Got response (%d chars) from Outlier", len(response))
+                if delta:
+                    delta.commit()
+
+                self.log_callback(
+                    conversation_id,
+                    prompt,
+                    system_message,
+                    response,
+                    model=model,
+                    latency=latency,
+                    timing=tracing.spans(result.get("trace")),
+                )
+                if cache_key and response:
+                    await self.response_cache.put(
+                        cache_key,
+                        {"conversationId": conversation_id, "response": response},
+                    )
 
                 return response, parsed_result
 
-        print(f"[Agent] Failed: {result} sending prompt to Outlier")
+        log.warning("Failed sending prompt to Outlier: %s", payload(result))
         return None, None
 
-    def parse_tool_call(self, response_text):
-        invoke_pattern = r'<invoke name="([^"]+)">(.*?)</invoke>'
-        match = re.search(invoke_pattern, response_text, re.DOTALL)
-
-        if not match:
-            return None, None
-
-        tool_name, params_block = match.groups()
-        param_pattern = r'<parameter name="([^"]+)">(.*?)</parameter>'
-        params = re.findall(param_pattern, params_block, re.DOTALL)
-
-        arguments = {param_name: param_value for param_name, param_value in params}
-
-        tool_call = {
-            "id": f"call_{uuid.uuid4().hex[:24]}",
-            "type": "function",
-            "function": {"name": tool_name, "arguments": json.dumps(arguments)},
-        }
-
-        print(f"[Agent] Parsed tool call: {tool_name}")
-
-        remaining_text = response_text[: match.start()] + response_text[match.end() :]
-        return remaining_text, tool_call
-
-    def extract_final_answer(self, response_text):
-        invoke_final_pattern = r'<invoke name="final_answer">\s*<parameter name="answer">(.*?)</parameter>\s*</invoke>'
-        match = re.search(invoke_final_pattern, response_text, re.DOTALL)
-        if match:
-            return match.group(1)
-
-        final_answer_pattern = r"<final_answer>(.*?)</final_answer>"
-        match = re.search(
-            final_answer_pattern, response_text, re.DOTALL | re.IGNORECASE
-        )
-        if match:
-            return match.group(1)
-
-        cleaned = re.sub(
-            r"<final_answer>|</final_answer>|\[FINAL ANSWER\]|FINAL:",
-            "",
-            response_text,
-            flags=re.IGNORECASE,
-        )
-        return cleaned
+    def interpret_response(self, response_text):
+        with PARSE_SECONDS.time():
+            parsed = parse_response(response_text)
+        if parsed.final_answer is not None:
+            log.debug("Final answer detected (%d chars)", len(parsed.final_answer))
+            return parsed.final_answer, None
+        if parsed.tool_calls:
+            log.debug(
+                "Parsed %d tool call(s): %s",
+                len(parsed.tool_calls),
+                ", ".join(call["function"]["name"] for call in parsed.tool_calls),
+            )
+            return parsed.text, parsed.tool_calls
+        return parsed.text, None
 
     def has_final_answer_marker(self, response_text):
         return (
             'name="final_answer"' in response_text
-            or "<final_answer>" in response_text.lower()
+            or FINAL_ANSWER_TAG_RE.search(response_text) is not None
         )
 
+    def prompt_delta_for(self, session) -> PromptDelta:
+        return PromptDelta(session.sent_blocks, enabled=self.prompt_delta)
+
+    def _log_delta(self, delta, prompt):
+        if delta.elided_chars:
+            log.debug(
+                "Prompt delta: %d unchanged chars elided, sending %d chars",
+                delta.elided_chars,
+                len(prompt),
+            )
+
     def initialize_system_prompt(
         self,
         tools,
@@ -158,28 +217,26 @@ class AgentWorkflow:
         context="",
         custom_instructions="",
         is_first=False,
+        delta=None,
     ):
-        rules_path = Path("templates/rules.mdx")
-        rules_content = (
-            rules_path.read_text(encoding="utf-8") if rules_path.exists() else ""
-        )
-
-        return self.composer.initialize_system_prompt(
-            tools=tools,
-            managed_agents=None,
-            custom_instructions=custom_instructions,
-            rules=rules_content,
-            attachments=attachments,
-            context=context,
-            user_request=user_request,
-            is_first=is_first,
-        )
+        with TEMPLATE_SECONDS.time():
+            return self.composer.initialize_system_prompt(
+                tools=tools,
+                managed_agents=None,
+                custom_instructions=custom_instructions,
+                rules=self.composer.get_rules(),
+                attachments=attachments,
+                context=context,
+                user_request=user_request,
+                is_first=is_first,
+                delta=delta,
+            )
 
-    async def step(self, conversation_id, model):
-        self.step_number += 1
+    async def step(self, session, model):
+        session.step_number += 1
 
-        if self.step_number >= self.max_steps:
-            print(f"[Agent] Max steps ({self.max_steps}) reached")
+        if session.step_number >= self.max_steps:
+            log.warning("Max steps (%d) reached", self.max_steps)
             return "Maximum steps reached. Task could not be completed.", None, True
 
         return None, None, False
@@ -187,46 +244,28 @@ class AgentWorkflow:
     async def execute_agent_loop(
         self,
         conversation_id,
-        user_request,
+        prompt,
         model,
-        tools,
-        attachments="",
-        context="",
-        custom_instructions="",
-        is_first=False,
+        on_delta=None,
+        use_cache=True,
+        delta=None,
     ):
-
-        prompt = self.initialize_system_prompt(
-            tools, user_request, attachments, context, custom_instructions, is_first
-        )
-
         system_message = self.composer.get_system()
 
         response_text, _ = await self.send_to_outlier(
-            conversation_id, prompt, model, system_message
+            conversation_id, prompt, model, system_message, on_delta, use_cache, delta
         )
 
         if response_text is None:
             return "Error: Failed to get response from model", None
 
-        print(f"[Agent Loop] Raw response: {response_text[:100]}...")
-
-        if self.has_final_answer_marker(response_text):
-            final_text = self.extract_final_answer(response_text)
-            print(f"[Agent Loop] Final answer detected: {final_text[:100]}...")
-            return final_text, None
+        log.debug("Raw response: %s", payload(response_text))
 
-        clean_text, tool_call = self.parse_tool_call(response_text)
-
-        if tool_call:
-            print(f"[Agent Loop] Tool call detected: {tool_call['function']['name']}")
-            return clean_text, [tool_call]
-        else:
-            print(f"[Agent Loop] No tool call or final answer detected")
-            return response_text, None
+        return self.interpret_response(response_text)
 
     async def handle_initial_tool_request(
         self,
+        session,
         model,
         user_request,
         tools,
@@ -234,20 +273,27 @@ class AgentWorkflow:
         context,
         raw_system,
         is_first=False,
+        on_delta=None,
+        use_cache=True,
+        system_tags=None,
     ):
-        print(
-            f"[Agent] handle_initial_tool_request: model={model}, tools={len(tools)}, is_first={is_first}"
+        log.debug(
+            "handle_initial_tool_request: model=%s, tools=%d, is_first=%s",
+            model,
+            len(tools),
+            is_first,
         )
 
-        custom_instructions = extract_client_instructions(raw_system)
+        custom_instructions = extract_client_instructions(raw_system, system_tags)
         if custom_instructions:
-            print(
-                f"[Agent] Extracted custom instructions: {len(custom_instructions)} chars"
+            log.debug(
+                "Extracted custom instructions: %d chars", len(custom_instructions)
             )
 
         if context:
-            print(f"[Agent] Received context: {len(context)} chars")
+            log.debug("Received context: %d chars", len(context))
 
+        delta = self.prompt_delta_for(session)
         prompt = self.initialize_system_prompt(
             tools,
             user_request,
@@ -255,152 +301,186 @@ class AgentWorkflow:
             context,
             custom_instructions,
             is_first=is_first,
+            delta=delta,
         )
+        self._log_delta(delta, prompt)
 
         system_message = self.composer.get_system()
 
         conversation_id, first_response = await self.get_or_create_conversation(
-            model, prompt, system_message
+            session, model, prompt, system_message, on_delta, delta
         )
 
         if not conversation_id:
-            print("[Agent] Failed to get or create conversation")
+            log.warning("Failed to get or create conversation")
             return None, None, None
 
         if first_response:
-            self.log_callback(
-                conversation_id,
-                prompt,
-                system_message,
-                first_response,
-            )
-            if self.has_final_answer_marker(first_response):
-                clean_text = self.extract_final_answer(first_response)
-                tool_calls = None
-            else:
-                clean_text, tool_call = self.parse_tool_call(first_response)
-                tool_calls = [tool_call] if tool_call else None
-                if not clean_text and not tool_call:
-                    clean_text = first_response
+            clean_text, tool_calls = self.interpret_response(first_response)
         else:
             clean_text, tool_calls = await self.execute_agent_loop(
                 conversation_id,
-                user_request,
+                prompt,
                 model,
-                tools,
-                attachments,
-                context,
-                custom_instructions,
-                is_first=is_first,
+                on_delta=on_delta,
+                use_cache=use_cache,
+                delta=delta,
             )
 
-        print(
-            f"[Agent] Returning: text={bool(clean_text)}, tools={len(tool_calls) if tool_calls else 0}"
+        log.debug(
+            "Returning: text=%s, tools=%d",
+            bool(clean_text),
+            len(tool_calls) if tool_calls else 0,
         )
         return clean_text, tool_calls, conversation_id
 
-    async def handle_tool_response(self, model, messages, raw_system):
-        print(f"[Agent] handle_tool_response: model={model}, messages={len(messages)}")
+    async def handle_tool_response(
+        self,
+        session,
+        model,
+        messages,
+        raw_system,
+        on_delta=None,
+        use_cache=True,
+        system_tags=None,
+    ):
+        log.debug("handle_tool_response: model=%s, messages=%d", model, len(messages))
 
-        context = extract_context_tag(raw_system)
+        context = extract_context_tag(raw_system, system_tags)
         if context:
-            print(f"[Agent] Extracted context for tool response: {len(context)} chars")
+            log.debug("Extracted context for tool response: %d chars", len(context))
 
-        tool_output_parts = []
-        last_assistant_msg = None
-
-        for msg in reversed(messages):
-            if msg.get("role") == "assistant" and msg.get("tool_calls"):
-                last_assistant_msg = msg
-                break
-
-        if last_assistant_msg:
-            tool_calls_in_msg = last_assistant_msg.get("tool_calls", [])
-            for tc in tool_calls_in_msg:
-                func = tc.get("function", {})
-                tool_output_parts.append(
-                    f"You called: {func.get('name')}({func.get('arguments')})"
-                )
-
-        collecting_responses = False
-        for msg in messages:
-            if msg == last_assistant_msg:
-                collecting_responses = True
-                continue
-            if collecting_responses and msg.get("role") == "tool":
-                tool_name = msg.get("name", "unknown_tool")
-                content = msg.get("content", "")
-                tool_output_parts.append(f"Tool '{tool_name}' returned: {content}")
-
-        tool_output = "\n\n".join(tool_output_parts)
-        prompt = self.composer.compose_tool_response(tool_output, context)
+        tool_output = self.fold_tool_results(messages)
+        delta = self.prompt_delta_for(session)
+        with TEMPLATE_SECONDS.time():
+            prompt = self.composer.compose_tool_response(tool_output, context, delta)
+        self._log_delta(delta, prompt)
 
         system_message = self.composer.get_system()
 
         conversation_id, _ = await self.get_or_create_conversation(
-            model, prompt, system_message
+            session, model, prompt, system_message
         )
         if not conversation_id:
-            print("[Agent] Failed to get conversation for tool response")
+            log.warning("Failed to get conversation for tool response")
             return None, None, None
 
         response_text, _ = await self.send_to_outlier(
-            conversation_id, prompt, model, system_message
+            conversation_id, prompt, model, system_message, on_delta, use_cache, delta
         )
 
         if response_text is None:
             clean_text = "Error: Failed to get response from model"
             tool_calls = None
-        elif self.has_final_answer_marker(response_text):
-            clean_text = self.extract_final_answer(response_text)
-            tool_calls = None
         else:
-            clean_text, tool_call = self.parse_tool_call(response_text)
-            tool_calls = [tool_call] if tool_call else None
+            clean_text, tool_calls = self.interpret_response(response_text)
 
-        print(
-            f"[Agent] Returning: text={bool(clean_text)}, tools={len(tool_calls) if tool_calls else 0}"
+        log.debug(
+            "Returning: text=%s, tools=%d",
+            bool(clean_text),
+            len(tool_calls) if tool_calls else 0,
         )
         return clean_text, tool_calls, conversation_id
 
+    def fold_tool_results(self, messages):
+        """Render the latest assistant tool calls and their results as one prompt."""
+        tool_output_parts = []
+        last_assistant_index = None
+
+        for index in range(len(messages) - 1, -1, -1):
+            msg = messages[index]
+            if msg.get("role") == "assistant" and msg.get("tool_calls"):
+                last_assistant_index = index
+                break
+
+        if last_assistant_index is not None:
+            calls = messages[last_assistant_index].get("tool_calls", [])
+            results = {}
+            unmatched = []
+            for msg in messages[last_assistant_index + 1 :]:
+                if msg.get("role") != "tool":
+                    continue
+                if msg.get("tool_call_id"):
+                    results[msg["tool_call_id"]] = msg
+                else:
+                    unmatched.append(msg)
+            for tc in calls:
+                func = tc.get("function", {})
+                tool_name = func.get("name", "unknown_tool")
+                tool_output_parts.append(
+                    f"You called: {tool_name}({func.get('arguments')})"
+                )
+                result = results.pop(tc.get("id"), None)
+                if result is not None:
+                    tool_output_parts.append(
+                        f"Tool '{result.get('name') or tool_name}' returned: "
+                        f"{result.get('content', '')}"
+                    )
+            for result in [*results.values(), *unmatched]:
+                tool_output_parts.append(
+                    f"Tool '{result.get('name', 'unknown_tool')}' returned: "
+                    f"{result.get('content', '')}"
+                )
+            log.debug("Folding %d tool call(s) into one follow-up prompt", len(calls))
+
+        return "\n\n".join(tool_output_parts)
+
     async def handle_simple_user_message(
-        self, model, user_request, attachments, raw_system, is_first=False
+        self,
+        session,
+        model,
+        user_request,
+        attachments,
+        raw_system,
+        is_first=False,
+        on_delta=None,
+        use_cache=True,
+        system_tags=None,
     ):
-        print(f"[Agent Workflow] handling user message to {model}, is_first={is_first}")
+        log.debug("Handling user message to %s, is_first=%s", model, is_first)
 
         system_content = self.composer.get_system()
 
-        context = extract_context_tag(raw_system)
+        context = extract_context_tag(raw_system, system_tags)
         if context:
-            print(f"[Agent] Extracted context: {len(context)} chars")
-
-        prompt = self.composer.compose_simple_user(
-            system=system_content,
-            attachments=attachments,
-            context=context,
-            user_request=user_request,
-            is_first=is_first,
-        )
+            log.debug("Extracted context: %d chars", len(context))
+
+        delta = self.prompt_delta_for(session)
+        with TEMPLATE_SECONDS.time():
+            prompt = self.composer.compose_simple_user(
+                system=system_content,
+                attachments=attachments,
+                context=context,
+                user_request=user_request,
+                is_first=is_first,
+                delta=delta,
+            )
+        self._log_delta(delta, prompt)
 
         system_message = self.composer.get_system()
 
         conversation_id, first_response = await self.get_or_create_conversation(
-            model, prompt, system_message
+            session, model, prompt, system_message, on_delta, delta
         )
         if not conversation_id:
-            print("[Agent Workflow] Failed to get or create conversation")
+            log.warning("Failed to get or create conversation")
             return None, None, None
 
         if first_response:
-            self.log_callback(conversation_id, prompt, system_message, first_response)
             clean_text = first_response
             tool_calls = None
         else:
             response_text, _ = await self.send_to_outlier(
-                conversation_id, prompt, model, system_message
+                conversation_id,
+                prompt,
+                model,
+                system_message,
+                on_delta,
+                use_cache,
+                delta,
             )
             if response_text is None:
-                print("[Agent Workflow] Failed to get response from Outlier")
+                log.warning("Failed to get response from Outlier")
                 return None, None, None
             clean_text = response_text
             tool_calls = None
@@ -0,0 +1,180 @@
+"""
+Leveled service logging for the OAI app, on top of the stdlib logging module.
+
+Every category ("request", "agent", "relay", ...) is a child of the
+"wormhole" logger and writes one line per event to stdout, either as text
+or as JSON (oai_log_format), tagged with the id of the HTTP request being
+served. Messages use %-style arguments so nothing is formatted unless the
+record is emitted, and request or prompt bodies go through payload(), which
+truncates or hashes them (oai_log_payloads) only when the line is written.
+
+    oai_log_level          DEBUG | INFO | WARNING | ERROR   (default INFO)
+    oai_log_format         text | json                      (default text)
+    oai_log_payloads       truncate | hash | full           (default truncate)
+    oai_log_payload_chars  characters kept by truncate      (default 200)
+    oai_log_sample_rates   per-category keep rates below WARNING,
+                           e.g. "request=0.1,agent=0.5"
+
+Sampling is decided per request id, so a sampled request keeps all of its
+lines.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import random
+import sys
+import time
+import uuid
+from contextvars import ContextVar
+
+ROOT = "wormhole"
+PAYLOAD_MODES = ("truncate", "hash", "full")
+
+_request_id = ContextVar("wormhole_request_id", default=None)
+
+
+def new_request_id(incoming: str = None) -> str:
+    """Bind a request id to the current context and return it."""
+    request_id = (incoming or "")[:64] or uuid.uuid4().hex[:16]
+    _request_id.set(request_id)
+    return request_id
+
+
+class payload:
+    """
+    Defers rendering a request or response body until a log line that
+    includes it is actually written.
+    """
+
+    __slots__ = ("value",)
+
+    def __init__(self, value):
+        self.value = value
+
+    def __str__(self):
+        value = self.value
+        if not isinstance(value, str):
+            try:
+                value = json.dumps(value, default=str)
+            except (TypeError, ValueError):
+                value = repr(value)
+        if PAYLOAD_MODE == "full":
+            return value
+        if PAYLOAD_MODE == "hash":
+            digest = hashlib.sha256(value.encode("utf-8", "replace")).hexdigest()
+            return f"<{len(value)} chars sha256:{digest[:12]}>"
+        if len(value) <= PAYLOAD_CHARS:
+            return value
+        return f"{value[:PAYLOAD_CHARS]}... <{len(value)} chars>"
+
+
+class _ContextFilter(logging.Filter):
+    """Tags records with category and request id and applies sampling."""
+
+    def __init__(self, sample_rates: dict):
+        super().__init__()
+        self.sample_rates = sample_rates
+
+    def filter(self, record):
+        record.category = record.name.rpartition(".")[2]
+        record.request_id = _request_id.get()
+        rate = self.sample_rates.get(record.category)
+        if rate is None or record.levelno >= logging.WARNING:
+            return True
+        if record.request_id is None:
+            return random.random() < rate
+        bucket = int(hashlib.md5(record.request_id.encode()).hexdigest()[:8], 16)
+        return bucket / 0xFFFFFFFF < rate
+
+
+class _StdoutHandler(logging.StreamHandler):
+    """Writes to whatever sys.stdout is at emit time, like print() does."""
+
+    @property
+    def stream(self):
+        return sys.stdout
+
+    @stream.setter
+    def stream(self, value):
+        pass
+
+
+class _TextFormatter(logging.Formatter):
+    def format(self, record):
+        line = (
+            f"{self.formatTime(record, '%H:%M:%S')} {record.levelname:<7} "
+            f"[{record.category}] {record.getMessage()}"
+        )
+        if record.request_id:
+            line += f" rid={record.request_id}"
+        if record.exc_info:
+            line += "\n" + self.formatException(record.exc_info)
+        return line
+
+
+class _JSONFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            "ts": round(record.created, 3),
+            "level": record.levelname,
+            "category": record.category,
+            "request_id": record.request_id,
+            "message": record.getMessage(),
+        }
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+def parse_sample_rates(spec: str) -> dict:
+    rates = {}
+    for part in (spec or "").split(","):
+        category, _, rate = part.partition("=")
+        if not category.strip():
+            continue
+        try:
+            rates[category.strip()] = min(1.0, max(0.0, float(rate)))
+        except ValueError:
+            get_log("logging").warning("Ignoring bad sample rate: %r", part)
+    return rates
+
+
+_payload_mode_setting = os.getenv("oai_log_payloads", "truncate").lower()
+PAYLOAD_MODE = (
+    _payload_mode_setting if _payload_mode_setting in PAYLOAD_MODES else "truncate"
+)
+PAYLOAD_CHARS = int(os.getenv("oai_log_payload_chars", "200"))
+
+
+def configure():
+    root = logging.getLogger(ROOT)
+    if root.handlers:
+        return root
+    handler = _StdoutHandler()
+    context = _ContextFilter({})
+    handler.addFilter(context)
+    if os.getenv("oai_log_format", "text").lower() == "json":
+        handler.setFormatter(_JSONFormatter())
+    else:
+        handler.setFormatter(_TextFormatter())
+    root.addHandler(handler)
+    root.setLevel(os.getenv("oai_log_level", "INFO").upper())
+    root.propagate = False
+    # Parsed once the handler is in place so bad settings can be logged.
+    context.sample_rates = parse_sample_rates(os.getenv("oai_log_sample_rates"))
+    if _payload_mode_setting != PAYLOAD_MODE:
+        get_log("logging").warning(
+            "Unknown oai_log_payloads %r, using truncate", _payload_mode_setting
+        )
+    return root
+
+
+def get_log(category: str) -> logging.Logger:
+    configure()
+    return logging.getLogger(f"{ROOT}.{category}")
+
+
+def elapsed_ms(started: float) -> float:
+    return round((time.perf_counter() - started) * 1000, 1)
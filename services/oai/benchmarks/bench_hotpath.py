@@ -0,0 +1,311 @@
+"""
+Times each stage of the OAI request hot path in isolation on realistic
+fixtures (100 KB context, 60 tools, multi-invoke responses, long tool
+histories, a multi-megabyte request body) and compares the results
+against a JSON baseline. Runs offline; no relay, bridge or browser is
+involved.
+
+    python benchmarks/bench_hotpath.py [--stage compose] [--rounds 3]
+        [--processes 5] [--baseline benchmarks/baseline.json]
+        [--threshold 0.25] [--floor-us 5] [--update]
+
+Each stage is timed as the best of --rounds runs of an auto-sized loop
+in each of --processes fresh interpreters, and the median across them is
+reported; timings of one process can sit well off another's. The
+committed benchmarks/baseline.json is the reference; --update rewrites
+it, and a run with no baseline file writes one. Runs exit with status 1
+when a stage is slower than its baseline by more than --threshold (a
+fraction, 0.25 = 25%) and by more than --floor-us microseconds. Stages
+that look slower are measured again in new processes, and the median
+over all of their runs is what counts.
+
+Every process also times a fixed calibration loop that runs no service
+code. When that loop runs slower than it did when the baseline was
+written, the baseline is scaled up to match, so a busy or throttled
+machine does not read as a regression.
+"""
+
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import timeit
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+import fixtures
+
+DEFAULT_BASELINE = Path(__file__).resolve().parent / "baseline.json"
+CALIBRATION = "calibration"
+
+
+def load_app(workdir: Path):
+    """Import wormhole-oai.py with its data folder inside workdir."""
+    import importlib.util
+
+    (workdir / "templates").symlink_to(ROOT / "templates")
+    (workdir / "agent_prompts.yaml").symlink_to(ROOT / "agent_prompts.yaml")
+    os.environ.setdefault("oai_response_cache", "false")
+    os.environ.setdefault("oai_log_index", "false")
+    os.chdir(workdir)
+    spec = importlib.util.spec_from_file_location(
+        "wormhole_oai", ROOT / "wormhole-oai.py"
+    )
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def build_stages(app) -> dict:
+    from prompt_utils import (
+        ToolPromptCache,
+        extract_client_instructions,
+        extract_context_tag,
+        find_tags,
+        scan_messages,
+    )
+    from stream_parser import ToolCallStreamParser, parse_response
+    import codec
+
+    workflow = app.agent_workflow
+    composer = workflow.composer
+    messages = fixtures.agent_request()
+    raw_system = messages[0]["content"]
+    context = extract_context_tag(raw_system)
+    attachments = fixtures.attachments_block()
+    tools = fixtures.tools(60)
+    rules = composer.get_rules()
+    history = fixtures.tool_history(rounds=40, calls_per_round=6)
+    tool_output = workflow.fold_tool_results(history)
+    response = fixtures.multi_invoke_response(8)
+    deltas = [response[i : i + 16] for i in range(0, len(response), 16)]
+    payload = json.dumps(fixtures.completion_body(history_rounds=200)).encode()
+    loop = asyncio.new_event_loop()
+
+    def stream_parse():
+        parser = ToolCallStreamParser()
+        for delta in deltas:
+            parser.feed(delta)
+        parser.close()
+
+    async def run_workflow(on_delta):
+        for delta in deltas:
+            await on_delta(delta)
+        return None, None, "conv-benchmark"
+
+    async def drain(body):
+        async for _ in body:
+            pass
+
+    def generate():
+        streamed = app.stream_upstream_completion(
+            "claude-sonnet-4-5-20250929", run_workflow, parse_tools=True
+        )
+        loop.run_until_complete(drain(streamed.body_iterator))
+
+    def extract():
+        tags = find_tags(raw_system)
+        extract_client_instructions(raw_system, tags)
+        extract_context_tag(raw_system, tags)
+
+    stages = {
+        "decode/stdlib_json": lambda: json.loads(payload),
+    }
+    if codec.msgspec is not None:
+        decoder = codec.msgspec.json.Decoder(codec.ChatRequest)
+        stages["decode/typed_msgspec"] = lambda: decoder.decode(payload)
+    return {
+        **stages,
+        "scan/agent_request": lambda: scan_messages(
+            messages, workflow.has_final_answer_marker
+        ),
+        "extract/system_tags": extract,
+        "tools/render_cold_60": lambda: ToolPromptCache().render(tools),
+        "compose/first_system_60_tools": lambda: composer.initialize_system_prompt(
+            tools=tools,
+            rules=rules,
+            attachments=attachments,
+            context=context,
+            user_request="Refactor the relay module",
+            is_first=True,
+        ),
+        "compose/system_60_tools": lambda: composer.initialize_system_prompt(
+            tools=tools,
+            rules=rules,
+            attachments=attachments,
+            context=context,
+            user_request="Refactor the relay module",
+        ),
+        "compose/tool_response": lambda: composer.compose_tool_response(
+            tool_output, context
+        ),
+        "compose/simple_user": lambda: composer.compose_simple_user(
+            system=composer.get_system(),
+            attachments=attachments,
+            context=context,
+            user_request="Now add tests for it",
+            is_first=True,
+        ),
+        "fold/long_tool_history": lambda: workflow.fold_tool_results(history),
+        "parse/multi_invoke": lambda: parse_response(response),
+        "parse/stream_deltas": stream_parse,
+        "generate/stream_tools": generate,
+    }
+
+
+def calibration_work():
+    """Plain string, dict and JSON work that no change to the service affects."""
+    text = "wormhole relay " * 300
+    data = {f"key{i}": [i, str(i), text[i : i + 24]] for i in range(300)}
+    json.loads(json.dumps(data))
+    return text.replace("relay", "bridge").split()
+
+
+def measure(function, rounds) -> float:
+    """Best seconds per call over rounds of an auto-sized (>= 0.2s) loop."""
+    timer = timeit.Timer(function)
+    number, _ = timer.autorange()
+    return min(timer.repeat(repeat=rounds, number=number)) / number
+
+
+def regressed(seconds, baseline, threshold, floor) -> bool:
+    return seconds / baseline - 1 > threshold and seconds - baseline > floor
+
+
+def format_seconds(seconds) -> str:
+    if seconds >= 1e-3:
+        return f"{seconds * 1e3:9.2f}ms"
+    return f"{seconds * 1e6:9.1f}us"
+
+
+def measure_stages(stage, only, rounds) -> dict:
+    """Time the selected stages in this process."""
+    results = {CALIBRATION: measure(calibration_work, rounds)}
+    with tempfile.TemporaryDirectory(prefix="wormhole-bench-") as workdir:
+        # The app and workflow log every step; keep that out of the report.
+        with open(os.devnull, "w") as devnull:
+            with contextlib.redirect_stdout(devnull):
+                stages = build_stages(load_app(Path(workdir)))
+                for name, function in stages.items():
+                    if stage and stage not in name or only and name not in only:
+                        continue
+                    results[name] = measure(function, rounds)
+    # Load can change while the stages run; keep the faster of both ends.
+    results[CALIBRATION] = min(results[CALIBRATION], measure(calibration_work, rounds))
+    return results
+
+
+def measure_in_workers(args, only=None) -> dict:
+    """Times per stage from --processes fresh interpreters, one per process."""
+    command = [sys.executable, __file__, "--worker", "--rounds", str(args.rounds)]
+    if args.stage:
+        command += ["--stage", args.stage]
+    for name in only or ():
+        command += ["--only", name]
+    samples = {}
+    for _ in range(args.processes):
+        output = subprocess.run(
+            command, check=True, capture_output=True, text=True
+        ).stdout
+        for name, seconds in json.loads(output.splitlines()[-1]).items():
+            samples.setdefault(name, []).append(seconds)
+    return samples
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--stage", help="Only run stages containing this text")
+    parser.add_argument("--only", action="append", help=argparse.SUPPRESS)
+    parser.add_argument("--rounds", type=int, default=3)
+    parser.add_argument("--processes", type=int, default=5)
+    parser.add_argument("--baseline", default=str(DEFAULT_BASELINE))
+    parser.add_argument("--threshold", type=float, default=0.25)
+    parser.add_argument(
+        "--floor-us",
+        type=float,
+        default=5.0,
+        help="Ignore slowdowns smaller than this many microseconds",
+    )
+    parser.add_argument("--update", action="store_true", help="Rewrite the baseline")
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        print(json.dumps(measure_stages(args.stage, args.only, args.rounds)))
+        return
+
+    samples = measure_in_workers(args)
+    calibration = statistics.median(samples.pop(CALIBRATION))
+    results = {name: statistics.median(runs) for name, runs in samples.items()}
+
+    baseline_path = Path(args.baseline).resolve()
+    baseline = {}
+    if baseline_path.exists():
+        saved = json.loads(baseline_path.read_text())
+        # Baselines written before calibration existed compare unscaled.
+        speed = calibration / saved.get(CALIBRATION, calibration)
+        print(f"Calibration loop time vs baseline: {speed:.2f}x", flush=True)
+        # A quiet machine only makes the gate stricter; don't scale down.
+        speed = max(speed, 1.0)
+        baseline = {name: seconds * speed for name, seconds in saved["stages"].items()}
+    compare = baseline if not args.update else {}
+    floor = args.floor_us / 1e6
+
+    def slower(name, seconds):
+        return name in compare and regressed(
+            seconds, compare[name], args.threshold, floor
+        )
+
+    suspects = [name for name, seconds in results.items() if slower(name, seconds)]
+    if suspects:
+        # Confirm in fresh processes before failing the gate.
+        confirm = measure_in_workers(args, suspects)
+        drift = calibration / statistics.median(confirm.pop(CALIBRATION))
+        for name, runs in confirm.items():
+            runs = [seconds * drift for seconds in runs]
+            results[name] = statistics.median(samples[name] + runs)
+
+    regressions = []
+    for name, seconds in results.items():
+        line = f"{name:<32} {format_seconds(seconds)}"
+        if name in compare:
+            change = seconds / compare[name] - 1
+            line += f"  baseline {format_seconds(compare[name])} {change:+7.1%}"
+            if slower(name, seconds):
+                regressions.append(name)
+                line += "  REGRESSION"
+        print(line, flush=True)
+
+    if args.update or not baseline_path.exists():
+        stages = {**baseline, **results}
+        baseline_path.write_text(
+            json.dumps(
+                {
+                    "python": platform.python_version(),
+                    "machine": platform.machine(),
+                    CALIBRATION: calibration,
+                    "stages": stages,
+                },
+                indent=2,
+            )
+            + "\n"
+        )
+        print(f"Baseline written to {baseline_path}")
+    if regressions:
+        print(
+            f"{len(regressions)} stage(s) regressed more than "
+            f"{args.threshold:.0%} and {args.floor_us:g}us: {', '.join(regressions)}"
+        )
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
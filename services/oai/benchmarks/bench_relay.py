@@ -0,0 +1,164 @@
+"""
+Measures per-request relay latency with a fresh socket per command (the
+old send_command behaviour) against the pooled, multiplexed RelayPool.
+Then streams --deltas deltas and a --result-kb result per request through
+the pool, once from a page replying in plain JSON and once from one using
+envelope frames. Starts an in-process relay and echo page clients, so it
+runs offline.
+
+    python benchmarks/bench_relay.py [--requests 500] [--concurrency 16]
+        [--deltas 50] [--result-kb 200]
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import time
+import uuid
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+sys.path.insert(0, str(ROOT.parent / "server"))
+
+import websockets
+import wormhole_server
+
+os.environ.setdefault("oai_log_level", "WARNING")
+from send import RelayPool
+
+
+async def echo_page_client(uri):
+    async with websockets.connect(uri) as websocket:
+        await websocket.send(json.dumps({"type": "page_client"}))
+        async for message in websocket:
+            parsed = json.loads(message)
+            await websocket.send(
+                json.dumps(
+                    {
+                        "success": True,
+                        "result": {"response": "ok"},
+                        "request_id": parsed["request_id"],
+                    }
+                )
+            )
+
+
+async def streaming_page_client(uri, deltas, result, envelope):
+    """Answers every command with deltas then a large result."""
+    async with websockets.connect(uri, max_size=None) as websocket:
+        await websocket.send(json.dumps({"type": "page_client"}))
+        async for message in websocket:
+            request_id = json.loads(message)["request_id"]
+            reply = {"success": True, "result": {"response": result}}
+            for index in range(deltas):
+                content = f"token {index} "
+                if envelope:
+                    await websocket.send(f"@{request_id} delta\n{content}")
+                else:
+                    await websocket.send(
+                        json.dumps(
+                            {
+                                "type": "delta",
+                                "content": content,
+                                "request_id": request_id,
+                            }
+                        )
+                    )
+            if envelope:
+                await websocket.send(f"@{request_id} result\n{json.dumps(reply)}")
+            else:
+                await websocket.send(json.dumps({**reply, "request_id": request_id}))
+
+
+async def fresh_socket_request(uri):
+    async with websockets.connect(uri) as websocket:
+        await websocket.send(
+            json.dumps(
+                {
+                    "type": "sender",
+                    "command": "sendMessage",
+                    "params": {"prompt": "ping"},
+                    "request_id": str(uuid.uuid4()),
+                }
+            )
+        )
+        return json.loads(await websocket.recv())
+
+
+async def run(name, make_request, total, concurrency):
+    latencies = []
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one():
+        async with semaphore:
+            start = time.perf_counter()
+            result = await make_request()
+            latencies.append(time.perf_counter() - start)
+            assert result.get("success"), result
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(total)))
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    p95 = latencies[int(len(latencies) * 0.95) - 1]
+    print(
+        f"{name:<8} req/s={total / elapsed:8.0f} "
+        f"p50={statistics.median(latencies) * 1000:6.2f}ms "
+        f"p95={p95 * 1000:6.2f}ms"
+    )
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--port", type=int, default=18765)
+    parser.add_argument("--deltas", type=int, default=50)
+    parser.add_argument("--result-kb", type=int, default=200)
+    args = parser.parse_args()
+
+    uri = f"ws://127.0.0.1:{args.port}"
+    async with websockets.serve(wormhole_server.handler, "127.0.0.1", args.port):
+        page = asyncio.create_task(echo_page_client(uri))
+        await asyncio.sleep(0.2)
+
+        await run(
+            "fresh", lambda: fresh_socket_request(uri), args.requests, args.concurrency
+        )
+        pool = RelayPool(uri)
+        await run(
+            "pooled",
+            lambda: pool.request("sendMessage", {"prompt": "ping"}),
+            args.requests,
+            args.concurrency,
+        )
+        await pool.close()
+        page.cancel()
+
+        async def on_delta(content):
+            pass
+
+        result = "x" * (args.result_kb * 1024)
+        for name, envelope in (("json", False), ("envelope", True)):
+            page = asyncio.create_task(
+                streaming_page_client(uri, args.deltas, result, envelope)
+            )
+            await asyncio.sleep(0.2)
+            pool = RelayPool(uri)
+            await run(
+                name,
+                lambda: pool.request("sendMessage", {"prompt": "ping"}, on_delta),
+                args.requests,
+                args.concurrency,
+            )
+            await pool.close()
+            page.cancel()
+            await asyncio.sleep(0.1)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,106 @@
+"""
+Compares the legacy per-character SSE stream against the batched,
+pre-serialized encoder.
+
+    python benchmarks/bench_sse.py [--size 20000] [--mode word] [--chars 64]
+"""
+
+import argparse
+import json
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from sse_chunker import SSEEncoder, ChunkBatcher
+
+SAMPLE = (
+    "The wormhole relays every prompt through the browser session, so the "
+    "answer arrives as a single block of text that has to be re-streamed.\n"
+)
+
+
+def legacy_stream(text, completion_id, created_time, model):
+    for char in text:
+        chunk = {
+            "id": completion_id,
+            "object": "chat.completion.chunk",
+            "created": created_time,
+            "model": model,
+            "system_fingerprint": None,
+            "choices": [
+                {
+                    "index": 0,
+                    "delta": {"content": char},
+                    "logprobs": None,
+                    "finish_reason": None,
+                }
+            ],
+        }
+        yield f"data: {json.dumps(chunk)}\n\n"
+
+
+def batched_stream(text, completion_id, created_time, model, mode, max_chars):
+    encoder = SSEEncoder(completion_id, created_time, model)
+    batcher = ChunkBatcher(mode=mode, max_chars=max_chars)
+    for batch in batcher.split(text):
+        yield encoder.content(batch)
+
+
+def measure(name, stream_factory, rounds):
+    best = None
+    for _ in range(rounds):
+        chunks = 0
+        wire_bytes = 0
+        start = time.perf_counter()
+        for chunk in stream_factory():
+            chunks += 1
+            wire_bytes += len(chunk.encode("utf-8"))
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best[0]:
+            best = (elapsed, chunks, wire_bytes)
+
+    elapsed, chunks, wire_bytes = best
+    print(
+        f"{name:<10} chunks={chunks:<7} bytes={wire_bytes:<9} "
+        f"time={elapsed * 1000:8.2f}ms chunks/s={chunks / elapsed:12.0f}"
+    )
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--size", type=int, default=20000)
+    parser.add_argument("--mode", default="word", choices=ChunkBatcher.MODES)
+    parser.add_argument("--chars", type=int, default=64)
+    parser.add_argument("--rounds", type=int, default=5)
+    args = parser.parse_args()
+
+    text = (SAMPLE * (args.size // len(SAMPLE) + 1))[: args.size]
+    completion_id = "chatcmpl-benchmark"
+    created_time = int(time.time())
+    model = "claude-sonnet-4-5-20250929"
+
+    print(f"Answer size: {len(text)} chars, mode={args.mode}, chars={args.chars}")
+    legacy = measure(
+        "legacy",
+        lambda: legacy_stream(text, completion_id, created_time, model),
+        args.rounds,
+    )
+    batched = measure(
+        "batched",
+        lambda: batched_stream(
+            text, completion_id, created_time, model, args.mode, args.chars
+        ),
+        args.rounds,
+    )
+    print(
+        f"speedup={legacy[0] / batched[0]:.1f}x "
+        f"chunks={legacy[1] / batched[1]:.1f}x fewer "
+        f"bytes={legacy[2] / batched[2]:.1f}x fewer"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+"""
+Checks that the msgspec request codec and the stdlib json path accept the
+same /v1/chat/completions payloads and that the chat handler reads the
+same values from either. Needs msgspec installed.
+
+    python benchmarks/check_codec.py
+"""
+
+import json
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import codec
+import fixtures
+
+USER = {"role": "user", "content": "Hi"}
+TOOL = {
+    "type": "function",
+    "function": {"name": "read_file", "parameters": {"type": "object"}},
+}
+
+PAYLOADS = {
+    "minimal": {"model": "m", "messages": [USER]},
+    "stream_true": {"model": "m", "messages": [USER], "stream": True},
+    "stream_null": {"model": "m", "messages": [USER], "stream": None},
+    "messages_null": {"model": "m", "messages": None},
+    "messages_missing": {"model": "m"},
+    "model_null": {"model": None, "messages": [USER]},
+    "tools_null": {"model": "m", "messages": [USER], "tools": None},
+    "tools_empty": {"model": "m", "messages": [USER], "tools": []},
+    "tool_choice_null": {
+        "model": "m",
+        "messages": [USER],
+        "tools": [TOOL],
+        "tool_choice": None,
+    },
+    "tool_choice_object": {
+        "model": "m",
+        "messages": [USER],
+        "tools": [TOOL],
+        "tool_choice": {"type": "function", "function": {"name": "read_file"}},
+    },
+    "message_nulls": {
+        "model": "m",
+        "messages": [
+            {
+                "role": "assistant",
+                "content": None,
+                "name": None,
+                "tool_calls": None,
+                "tool_call_id": None,
+            },
+            USER,
+        ],
+    },
+    "content_parts": {
+        "model": "m",
+        "messages": [
+            {"role": "user", "content": [{"type": "text", "text": "Hi"}]},
+        ],
+    },
+    "unknown_fields": {
+        "model": "m",
+        "messages": [{**USER, "cache_control": {"type": "ephemeral"}}],
+        "temperature": 0.2,
+        "max_tokens": None,
+        "stream_options": {"include_usage": True},
+    },
+    "agent_traffic": fixtures.completion_body(history_rounds=5, tool_count=5),
+}
+
+MESSAGE_FIELDS = ("role", "content", "name", "tool_calls", "tool_call_id")
+
+
+def handler_view(body) -> dict:
+    """What chat_completions reads from a decoded body."""
+    return {
+        "model": body.get("model"),
+        "stream": bool(body.get("stream")),
+        "tools": body.get("tools") or [],
+        "messages": [
+            {field: message.get(field) for field in MESSAGE_FIELDS}
+            for message in body.get("messages") or []
+        ],
+    }
+
+
+def decode_both(raw: bytes):
+    results = []
+    for decode in (json.loads, codec.msgspec.json.Decoder(codec.ChatRequest).decode):
+        try:
+            results.append(handler_view(decode(raw)))
+        except (ValueError, codec.msgspec.DecodeError) as e:
+            results.append(f"rejected: {e}")
+    return results
+
+
+def main():
+    if codec.msgspec is None:
+        sys.exit("msgspec is not installed")
+    mismatches = 0
+    for name, payload in PAYLOADS.items():
+        stdlib, fast = decode_both(json.dumps(payload).encode())
+        if stdlib == fast:
+            print(f"{name:<24} ok")
+            continue
+        mismatches += 1
+        print(f"{name:<24} MISMATCH\n    stdlib:  {stdlib}\n    msgspec: {fast}")
+    if mismatches:
+        print(f"{mismatches} payload(s) decode differently")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
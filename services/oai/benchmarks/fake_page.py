@@ -0,0 +1,206 @@
+"""
+Offline stand-in for the injected page script. Connects to the relay as a
+page client, the way inject_wormhole.js does, and answers
+createConversation / sendMessage with a scripted response instead of
+calling Outlier.
+
+    python benchmarks/fake_page.py [--uri ws://localhost:8765] [--ttft-ms 300]
+        [--tokens-per-sec 60] [--tool-call-rate 0.2] [--error-rate 0.01]
+
+Responses are streamed as deltas when the command asks for it, after
+--ttft-ms and at --tokens-per-sec (whitespace-separated words count as
+tokens). A --tool-call-rate share of responses end in invoke markup, and
+an --error-rate share fail, either before the first delta or halfway
+through the stream (--error-mode). Replies use envelope frames when the
+relay asks for them, or plain JSON with --json-frames.
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import re
+import time
+import uuid
+
+import websockets
+
+SAMPLE = (
+    "The wormhole relays every prompt through the browser session, so each "
+    "answer streams back token by token from the page to the relay and then "
+    "on to the client that asked for it. "
+)
+TOOL_CALL = (
+    '\n<invoke name="read_file">\n'
+    '<parameter name="path">src/main.py</parameter>\n'
+    '<parameter name="start_line">1</parameter>\n'
+    "</invoke>"
+)
+_TOKEN_RE = re.compile(r"\S+\s*")
+
+
+def now_ms():
+    return time.time() * 1000
+
+
+def scripted_text(words: int) -> str:
+    tokens = _TOKEN_RE.findall(SAMPLE)
+    return "".join(tokens[i % len(tokens)] for i in range(words)).rstrip()
+
+
+class FakePage:
+    def __init__(
+        self,
+        uri,
+        response_words=120,
+        ttft_ms=300.0,
+        tokens_per_sec=60.0,
+        chunk_tokens=4,
+        tool_call_rate=0.0,
+        error_rate=0.0,
+        error_mode="immediate",
+        seed=None,
+        envelope=True,
+    ):
+        self.uri = uri
+        self.text = scripted_text(response_words)
+        self.ttft = ttft_ms / 1000
+        self.tokens_per_sec = tokens_per_sec
+        self.chunk_tokens = max(1, chunk_tokens)
+        self.tool_call_rate = tool_call_rate
+        self.error_rate = error_rate
+        self.error_mode = error_mode
+        self.random = random.Random(seed)
+        self.envelope = envelope
+        self.served = 0
+        self.failed = 0
+
+    async def run(self, ready=None):
+        async with websockets.connect(self.uri, max_size=None) as websocket:
+            await websocket.send(json.dumps({"type": "page_client"}))
+            print(f"[FakePage] Connected to {self.uri}", flush=True)
+            if ready is not None:
+                ready.set()
+            async for message in websocket:
+                asyncio.create_task(self.handle(websocket, json.loads(message)))
+
+    async def handle(self, websocket, message):
+        trace = self._start_trace(message)
+        request_id = message.get("request_id")
+        params = message.get("params") or {}
+        envelope = bool(message.get("envelope")) and self.envelope
+
+        async def reply(payload):
+            if trace is not None:
+                trace["page_out"] = now_ms()
+                payload["trace"] = trace
+            if envelope:
+                await websocket.send(f"@{request_id} result\n{json.dumps(payload)}")
+            else:
+                await websocket.send(json.dumps({**payload, "request_id": request_id}))
+
+        command = message.get("command")
+        if command not in ("createConversation", "sendMessage"):
+            await reply({"success": False, "error": f"Unknown command: {command}"})
+            return
+
+        text = self.text
+        if self.random.random() < self.tool_call_rate:
+            text += TOOL_CALL
+        fail = self.random.random() < self.error_rate
+        if trace is not None:
+            trace["fetch_start"] = now_ms()
+        try:
+            await asyncio.sleep(self.ttft)
+            if fail and self.error_mode == "immediate":
+                raise RuntimeError("Failed to send message: 500")
+            if trace is not None:
+                trace["fetch_ttfb"] = now_ms()
+            await self._generate(websocket, request_id, params, text, fail, envelope)
+            if trace is not None:
+                trace["fetch_end"] = now_ms()
+        except RuntimeError as e:
+            self.failed += 1
+            await reply({"success": False, "error": str(e)})
+            return
+
+        result = {"success": True, "response": text}
+        if command == "createConversation":
+            result["conversationId"] = f"conv-{uuid.uuid4().hex[:12]}"
+        self.served += 1
+        await reply({"success": True, "result": result})
+
+    async def _generate(self, websocket, request_id, params, text, fail, envelope):
+        tokens = _TOKEN_RE.findall(text)
+        interval = self.chunk_tokens / self.tokens_per_sec if self.tokens_per_sec else 0
+        fail_at = len(tokens) // 2 if fail else None
+        for start in range(0, len(tokens), self.chunk_tokens):
+            if fail_at is not None and start >= fail_at:
+                raise RuntimeError("Stream interrupted")
+            if start and interval:
+                await asyncio.sleep(interval)
+            if params.get("stream"):
+                content = "".join(tokens[start : start + self.chunk_tokens])
+                if envelope:
+                    frame = f"@{request_id} delta\n{content}"
+                else:
+                    frame = json.dumps(
+                        {"type": "delta", "content": content, "request_id": request_id}
+                    )
+                await websocket.send(frame)
+
+    def _start_trace(self, message):
+        if not isinstance(message.get("trace"), dict):
+            return None
+        trace = dict(message["trace"])
+        for key in [key for key in message if key.startswith("trace_")]:
+            trace[key[len("trace_") :]] = message[key]
+        trace["page_in"] = now_ms()
+        return trace
+
+
+def add_arguments(parser):
+    parser.add_argument("--response-words", type=int, default=120)
+    parser.add_argument("--ttft-ms", type=float, default=300.0)
+    parser.add_argument("--tokens-per-sec", type=float, default=60.0)
+    parser.add_argument("--chunk-tokens", type=int, default=4)
+    parser.add_argument("--tool-call-rate", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument(
+        "--error-mode", choices=("immediate", "midstream"), default="immediate"
+    )
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument(
+        "--json-frames",
+        action="store_true",
+        help="Always reply with plain JSON messages, like pages before envelopes",
+    )
+
+
+def page_options(args) -> dict:
+    return {
+        "response_words": args.response_words,
+        "ttft_ms": args.ttft_ms,
+        "tokens_per_sec": args.tokens_per_sec,
+        "chunk_tokens": args.chunk_tokens,
+        "tool_call_rate": args.tool_call_rate,
+        "error_rate": args.error_rate,
+        "error_mode": args.error_mode,
+        "seed": args.seed,
+        "envelope": not args.json_frames,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--uri", default="ws://localhost:8765")
+    add_arguments(parser)
+    args = parser.parse_args()
+    try:
+        asyncio.run(FakePage(args.uri, **page_options(args)).run())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
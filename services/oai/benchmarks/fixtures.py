@@ -0,0 +1,187 @@
+"""
+Deterministic request and response fixtures sized like real agent traffic,
+shared by the hot-path benchmarks.
+"""
+
+import json
+import random
+
+_WORDS = (
+    "request response relay stream token prompt context tool schema parser "
+    "session template render buffer socket page model answer invoke delta "
+    "conversation history result argument parameter file line module"
+).split()
+
+
+def _sentence(rng, words=12):
+    return " ".join(rng.choice(_WORDS) for _ in range(words)).capitalize() + "."
+
+
+def source_file(rng, path, size):
+    lines = [f"# {path}"]
+    total = 0
+    number = 0
+    while total < size:
+        number += 1
+        name = f"{rng.choice(_WORDS)}_{rng.choice(_WORDS)}_{number}"
+        line = (
+            f"def {name}(value):\n"
+            f'    """{_sentence(rng, 10)}"""\n'
+            f"    return value * {number}\n"
+        )
+        lines.append(line)
+        total += len(line)
+    return "\n".join(lines)
+
+
+def context_block(size=100 * 1024, seed=1):
+    """A <context> block of roughly size bytes made of file excerpts."""
+    rng = random.Random(seed)
+    files = []
+    for index in range(max(1, size // 8192)):
+        path = f"src/{rng.choice(_WORDS)}/{rng.choice(_WORDS)}_{index}.py"
+        files.append(f'<file path="{path}">\n{source_file(rng, path, 8000)}\n</file>')
+    return "<context>\n" + "\n".join(files) + "\n</context>"
+
+
+def attachments_block(size=12 * 1024, seed=2):
+    rng = random.Random(seed)
+    return (
+        '<attachments>\n<attachment id="notes.md">\n'
+        + source_file(rng, "notes.md", size)
+        + "\n</attachment>\n</attachments>"
+    )
+
+
+def tools(count=60, seed=3):
+    rng = random.Random(seed)
+    definitions = []
+    for index in range(count):
+        properties = {}
+        for position in range(rng.randint(2, 6)):
+            name = f"{rng.choice(_WORDS)}_{position}"
+            kind = rng.choice(("string", "integer", "boolean", "array"))
+            schema = {"type": kind, "description": _sentence(rng, 8)}
+            if kind == "array":
+                schema["items"] = {"type": "string"}
+            elif kind == "string" and rng.random() < 0.3:
+                schema["enum"] = rng.sample(_WORDS, 4)
+            properties[name] = schema
+        definitions.append(
+            {
+                "type": "function",
+                "function": {
+                    "name": f"{rng.choice(_WORDS)}_{rng.choice(_WORDS)}_{index}",
+                    "description": " ".join(_sentence(rng) for _ in range(3)),
+                    "parameters": {
+                        "type": "object",
+                        "properties": properties,
+                        "required": list(properties)[:1],
+                    },
+                },
+            }
+        )
+    return definitions
+
+
+def multi_invoke_response(invokes=8, seed=4):
+    """Model output with reasoning text followed by several invoke blocks."""
+    rng = random.Random(seed)
+    parts = [" ".join(_sentence(rng) for _ in range(8)), "\n\n"]
+    for index in range(invokes):
+        content = source_file(rng, f"src/generated_{index}.py", 4000)
+        parts.append(
+            f'<invoke name="write_file">\n'
+            f'<parameter name="path">src/generated_{index}.py</parameter>\n'
+            f'<parameter name="content">{content}</parameter>\n'
+            f"</invoke>\n"
+        )
+    return "".join(parts)
+
+
+def tool_history(rounds=40, calls_per_round=3, result_size=2048, seed=5):
+    """Alternating assistant tool calls and tool results."""
+    rng = random.Random(seed)
+    messages = []
+    for round_index in range(rounds):
+        calls = []
+        for call_index in range(calls_per_round):
+            call_id = f"call_{round_index}_{call_index}"
+            calls.append(
+                {
+                    "id": call_id,
+                    "type": "function",
+                    "function": {
+                        "name": "read_file",
+                        "arguments": json.dumps(
+                            {"path": f"src/module_{round_index}_{call_index}.py"}
+                        ),
+                    },
+                }
+            )
+        messages.append({"role": "assistant", "content": None, "tool_calls": calls})
+        for call in calls:
+            messages.append(
+                {
+                    "role": "tool",
+                    "tool_call_id": call["id"],
+                    "name": "read_file",
+                    "content": source_file(rng, call["id"], result_size),
+                }
+            )
+    return messages
+
+
+def agent_request(history_rounds=40, seed=6):
+    """A continuing agent chat: big system prompt, long tool history, new turn."""
+    rng = random.Random(seed)
+    system = (
+        "You are a coding agent working in the user's repository.\n"
+        "<instructions>\n"
+        + "\n".join(_sentence(rng, 16) for _ in range(40))
+        + "\n</instructions>\n"
+        + context_block()
+    )
+    first_user = (
+        attachments_block() + "\n<userRequest>Refactor the relay module</userRequest>"
+    )
+    messages = [
+        {"role": "system", "content": system},
+        {"role": "user", "content": first_user},
+    ]
+    messages.extend(tool_history(rounds=history_rounds))
+    messages.append(
+        {"role": "assistant", "content": "<final_answer>Done.</final_answer>"}
+    )
+    messages.append(
+        {
+            "role": "user",
+            "content": [
+                {
+                    "type": "text",
+                    "text": attachments_block(seed=7)
+                    + "\n<userRequest>Now add tests for it</userRequest>",
+                }
+            ],
+        }
+    )
+    return messages
+
+
+def completion_body(history_rounds=40, tool_count=60):
+    """A /v1/chat/completions body, with the fields clients send but we ignore."""
+    messages = agent_request(history_rounds=history_rounds)
+    for message in messages:
+        message["cache_control"] = {"type": "ephemeral"}
+    return {
+        "model": "claude-sonnet-4-5-20250929",
+        "messages": messages,
+        "tools": tools(tool_count),
+        "tool_choice": "auto",
+        "stream": True,
+        "temperature": 0.2,
+        "top_p": 1,
+        "max_tokens": 8192,
+        "stream_options": {"include_usage": True},
+        "metadata": {"client": "benchmark", "session": "fixture"},
+    }
@@ -0,0 +1,418 @@
+"""
+Full-stack load test that runs offline. Starts the relay, a fake page
+client (benchmarks/fake_page.py) and the OAI app as subprocesses on free
+local ports, drives /v1/chat/completions at a fixed concurrency and
+reports latency, time to first token, requests/sec and CPU per request.
+
+    python benchmarks/load_test.py [--requests 200] [--concurrency 16]
+        [--mode both|stream|non-stream] [--tools 8] [--ttft-ms 50]
+        [--tokens-per-sec 400] [--tool-call-rate 0.2] [--error-rate 0]
+
+Needs the oai and server requirements installed. The OAI app runs in a
+temporary directory so its logs do not land in data/; response caching
+and single-flight are off unless set in the environment, and every
+request carries a unique prompt.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from fake_page import add_arguments
+
+ROOT = Path(__file__).resolve().parent.parent
+RELAY_SCRIPT = ROOT.parent / "server" / "wormhole_server.py"
+API_KEY = "load-test"
+_PERCENTILES = (("p50", 0.50), ("p95", 0.95), ("p99", 0.99))
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def cpu_seconds(pid):
+    """utime + stime of a process, or None where /proc is unavailable."""
+    try:
+        fields = Path(f"/proc/{pid}/stat").read_text().rsplit(")", 1)[1].split()
+    except OSError:
+        return None
+    return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+
+
+def percentile(values, fraction):
+    if not values:
+        return float("nan")
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def parse_server_timing(header: str) -> dict:
+    spans = {}
+    for entry in header.split(","):
+        name, _, params = entry.strip().partition(";")
+        if params.startswith("dur="):
+            spans[name] = float(params[4:])
+    return spans
+
+
+class HttpClient:
+    """Minimal keep-alive HTTP/1.1 client, so the test needs no extra packages."""
+
+    def __init__(self, host, port):
+        self.host = host
+        self.port = port
+        self.reader = None
+        self.writer = None
+
+    async def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            self.reader = self.writer = None
+
+    async def post(self, path, payload, on_chunk=None):
+        if self.writer is None:
+            self.reader, self.writer = await asyncio.open_connection(
+                self.host, self.port
+            )
+        body = json.dumps(payload).encode("utf-8")
+        self.writer.write(
+            (
+                f"POST {path} HTTP/1.1\r\n"
+                f"Host: {self.host}:{self.port}\r\n"
+                f"Authorization: Bearer {API_KEY}\r\n"
+                "Content-Type: application/json\r\n"
+                f"Content-Length: {len(body)}\r\n\r\n"
+            ).encode("ascii")
+            + body
+        )
+        try:
+            return await self._read_response(on_chunk)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            await self.close()
+            raise
+
+    async def _read_response(self, on_chunk):
+        status = int((await self.reader.readline()).split()[1])
+        headers = {}
+        while True:
+            line = (await self.reader.readline()).decode("latin-1").strip()
+            if not line:
+                break
+            name, _, value = line.partition(":")
+            headers[name.strip().lower()] = value.strip()
+
+        parts = []
+        if headers.get("transfer-encoding", "").lower() == "chunked":
+            while True:
+                size = int((await self.reader.readline()).split(b";")[0], 16)
+                if size == 0:
+                    while (await self.reader.readline()).strip():
+                        pass
+                    break
+                chunk = await self.reader.readexactly(size)
+                await self.reader.readexactly(2)
+                if on_chunk:
+                    on_chunk(chunk)
+                parts.append(chunk)
+        else:
+            length = int(headers.get("content-length", "0"))
+            parts.append(await self.reader.readexactly(length))
+        if headers.get("connection", "").lower() == "close":
+            await self.close()
+        return status, headers, b"".join(parts)
+
+
+def tool_definitions(count):
+    return [
+        {
+            "type": "function",
+            "function": {
+                "name": f"tool_{i}",
+                "description": f"Benchmark tool number {i}.",
+                "parameters": {
+                    "type": "object",
+                    "properties": {
+                        "path": {"type": "string", "description": "File path"},
+                        "line": {"type": "integer", "description": "Line number"},
+                    },
+                    "required": ["path"],
+                },
+            },
+        }
+        for i in range(count)
+    ]
+
+
+async def one_request(client, number, stream, tools, model):
+    payload = {
+        "model": model,
+        "stream": stream,
+        "messages": [
+            {"role": "system", "content": "You are a coding assistant."},
+            {
+                "role": "user",
+                "content": f"<userRequest>Summarise benchmark item {number}</userRequest>",
+            },
+        ],
+    }
+    if tools:
+        payload["tools"] = tools
+
+    first_token = None
+    started = time.perf_counter()
+
+    def on_chunk(chunk):
+        nonlocal first_token
+        if first_token is None and (
+            b'"content": ' in chunk or b'"tool_calls"' in chunk
+        ):
+            first_token = time.perf_counter()
+
+    status, headers, body = await client.post(
+        "/v1/chat/completions", payload, on_chunk if stream else None
+    )
+    finished = time.perf_counter()
+    if stream:
+        ok = status == 200 and b'"error"' not in body and b"[DONE]" in body
+    else:
+        parsed = json.loads(body)
+        # Error paths return an [error, status] pair serialized as a list.
+        ok = status == 200 and isinstance(parsed, dict) and "choices" in parsed
+    return {
+        "ok": ok,
+        "latency": finished - started,
+        "ttft": (first_token or finished) - started,
+        "server_timing": parse_server_timing(headers.get("server-timing", "")),
+    }
+
+
+async def run_phase(args, port, stream, pids, tools):
+    clients = [HttpClient("127.0.0.1", port) for _ in range(args.concurrency)]
+    numbers = iter(range(10**9))
+
+    async def drive(total):
+        results = []
+        remaining = total
+
+        async def worker(client):
+            nonlocal remaining
+            while remaining > 0:
+                remaining -= 1
+                try:
+                    result = await one_request(
+                        client, next(numbers), stream, tools, args.model
+                    )
+                except (OSError, ValueError, asyncio.IncompleteReadError) as e:
+                    result = {"ok": False, "latency": 0.0, "ttft": 0.0, "error": str(e)}
+                results.append(result)
+
+        await asyncio.gather(*(worker(client) for client in clients))
+        return results
+
+    await drive(args.concurrency)
+    cpu_before = {name: cpu_seconds(pid) for name, pid in pids.items()}
+    client_cpu = time.process_time()
+    started = time.perf_counter()
+    results = await drive(args.requests)
+    elapsed = time.perf_counter() - started
+    cpu = {
+        name: cpu_seconds(pid) - cpu_before[name]
+        for name, pid in pids.items()
+        if cpu_before[name] is not None
+    }
+    cpu["client"] = time.process_time() - client_cpu
+    for client in clients:
+        await client.close()
+    return results, elapsed, cpu
+
+
+def report(name, results, elapsed, cpu) -> dict:
+    succeeded = [r for r in results if r["ok"]]
+    latencies = [r["latency"] * 1000 for r in succeeded]
+    ttfts = [r["ttft"] * 1000 for r in succeeded]
+    hops = {}
+    for result in succeeded:
+        for span, duration in result.get("server_timing", {}).items():
+            hops.setdefault(span, []).append(duration)
+    summary = {
+        "requests": len(results),
+        "errors": len(results) - len(succeeded),
+        "rps": len(results) / elapsed,
+        "latency_ms": {p: percentile(latencies, q) for p, q in _PERCENTILES},
+        "ttft_ms": {p: percentile(ttfts, q) for p, q in _PERCENTILES},
+        "cpu_ms_per_request": {
+            process: seconds * 1000 / len(results) for process, seconds in cpu.items()
+        },
+        "server_timing_mean_ms": {
+            span: statistics.fmean(values) for span, values in hops.items()
+        },
+    }
+
+    print(f"\n{name}: {summary['requests']} requests, {summary['errors']} errors")
+    print(f"  req/s    {summary['rps']:10.1f}")
+    for label in ("latency_ms", "ttft_ms"):
+        values = summary[label]
+        print(
+            f"  {label[:-3]:<8} "
+            + " ".join(f"{p}={values[p]:8.1f}ms" for p, _ in _PERCENTILES)
+        )
+    print(
+        "  cpu/req  "
+        + " ".join(
+            f"{process}={ms:.2f}ms"
+            for process, ms in summary["cpu_ms_per_request"].items()
+        )
+    )
+    if summary["server_timing_mean_ms"]:
+        print("  hops (mean, from Server-Timing)")
+        for span, ms in summary["server_timing_mean_ms"].items():
+            print(f"    {span:<28} {ms:8.1f}ms")
+    return summary
+
+
+def wait_until(check, timeout, what):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if check():
+            return
+        time.sleep(0.1)
+    raise RuntimeError(f"Timed out waiting for {what}")
+
+
+def port_open(port) -> bool:
+    with socket.socket() as sock:
+        return sock.connect_ex(("127.0.0.1", port)) == 0
+
+
+def start_stack(args, workdir: Path, processes: dict) -> int:
+    """Start relay, fake page and OAI app into processes; returns the OAI port."""
+    relay_port, oai_port = free_port(), free_port()
+    env = {
+        **os.environ,
+        "wormhole_host": "127.0.0.1",
+        "wormhole_server_host": "127.0.0.1",
+        "wormhole_port": str(relay_port),
+        "wormhole_metrics_port": "0",
+        "oai_host": "127.0.0.1",
+        "oai_port": str(oai_port),
+        "OAI_API_KEY": API_KEY,
+        "PYTHONUNBUFFERED": "1",
+    }
+    env.setdefault("oai_response_cache", "false")
+    env.setdefault("oai_single_flight", "false")
+
+    (workdir / "templates").symlink_to(ROOT / "templates")
+    (workdir / "agent_prompts.yaml").symlink_to(ROOT / "agent_prompts.yaml")
+    page_args = [
+        "--uri",
+        f"ws://127.0.0.1:{relay_port}",
+        "--response-words",
+        str(args.response_words),
+        "--ttft-ms",
+        str(args.ttft_ms),
+        "--tokens-per-sec",
+        str(args.tokens_per_sec),
+        "--chunk-tokens",
+        str(args.chunk_tokens),
+        "--tool-call-rate",
+        str(args.tool_call_rate),
+        "--error-rate",
+        str(args.error_rate),
+        "--error-mode",
+        args.error_mode,
+    ]
+    if args.seed is not None:
+        page_args += ["--seed", str(args.seed)]
+
+    def spawn(name, command, cwd):
+        log = open(workdir / f"{name}.log", "w")
+        processes[name] = subprocess.Popen(
+            command, cwd=cwd, env=env, stdout=log, stderr=subprocess.STDOUT
+        )
+
+    spawn("relay", [sys.executable, str(RELAY_SCRIPT)], RELAY_SCRIPT.parent)
+    wait_until(lambda: port_open(relay_port), 15, "the relay")
+    spawn(
+        "page",
+        [sys.executable, str(Path(__file__).parent / "fake_page.py"), *page_args],
+        ROOT,
+    )
+    wait_until(
+        lambda: "Connected" in (workdir / "page.log").read_text(),
+        15,
+        "the fake page to connect",
+    )
+    spawn("oai", [sys.executable, str(ROOT / "wormhole-oai.py")], workdir)
+    wait_until(lambda: port_open(oai_port), 30, "the OAI app")
+    return oai_port
+
+
+def stop_stack(processes):
+    for process in processes.values():
+        process.terminate()
+    for process in processes.values():
+        try:
+            process.wait(timeout=5)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument(
+        "--mode", choices=("both", "stream", "non-stream"), default="both"
+    )
+    parser.add_argument("--tools", type=int, default=8)
+    parser.add_argument("--model", default="claude-sonnet-4-5-20250929")
+    parser.add_argument("--json", help="Write the summary to this file")
+    add_arguments(parser)
+    parser.set_defaults(ttft_ms=50.0, tokens_per_sec=400.0, response_words=80)
+    args = parser.parse_args()
+
+    modes = {"both": (False, True), "stream": (True,), "non-stream": (False,)}
+    tools = tool_definitions(args.tools)
+    summaries = {}
+    with tempfile.TemporaryDirectory(prefix="wormhole-load-") as workdir:
+        workdir = Path(workdir)
+        processes = {}
+        try:
+            oai_port = start_stack(args, workdir, processes)
+            pids = {name: process.pid for name, process in processes.items()}
+            print(
+                f"concurrency={args.concurrency} requests={args.requests} "
+                f"tools={args.tools} ttft={args.ttft_ms}ms "
+                f"tokens/s={args.tokens_per_sec} tool-calls={args.tool_call_rate} "
+                f"errors={args.error_rate}"
+            )
+            for stream in modes[args.mode]:
+                name = "stream" if stream else "non-stream"
+                results, elapsed, cpu = asyncio.run(
+                    run_phase(args, oai_port, stream, pids, tools)
+                )
+                summaries[name] = report(name, results, elapsed, cpu)
+        except Exception:
+            for log in sorted(workdir.glob("*.log")):
+                tail = log.read_text(errors="replace").splitlines()[-20:]
+                print(f"--- {log.name} ---\n" + "\n".join(tail), file=sys.stderr)
+            raise
+        finally:
+            stop_stack(processes)
+
+    if args.json:
+        Path(args.json).write_text(json.dumps(summaries, indent=2))
+
+
+if __name__ == "__main__":
+    main()
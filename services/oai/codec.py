@@ -0,0 +1,104 @@
+"""
+JSON codec for the /v1/chat/completions hot path.
+
+With oai_fast_codec=true and msgspec installed, request bodies are decoded
+straight from bytes into typed structs that skip every field the service
+does not read, and responses and SSE chunks are encoded with msgspec. Otherwise the stdlib json module is used and
+requests stay plain dicts.
+
+The structs answer .get() and [] like the dicts they replace, so code
+reading messages works with either. Every field is optional and accepts
+null, as the plain dicts do; benchmarks/check_codec.py checks that both
+paths accept the same payloads and read the same values from them.
+"""
+
+import json
+import os
+from typing import Any, Optional
+
+from fastapi import Request
+from fastapi.responses import JSONResponse, Response
+
+from app_log import get_log
+
+try:
+    import msgspec
+except ImportError:
+    msgspec = None
+
+
+class DecodeError(ValueError):
+    pass
+
+
+if msgspec is not None:
+
+    class _Record(msgspec.Struct):
+        def get(self, key, default=None):
+            value = getattr(self, key, None)
+            return default if value is None else value
+
+        def __getitem__(self, key):
+            try:
+                return getattr(self, key)
+            except AttributeError:
+                raise KeyError(key) from None
+
+    class ChatMessage(_Record):
+        role: Optional[str] = None
+        content: Any = None
+        name: Optional[str] = None
+        tool_calls: Optional[list] = None
+        tool_call_id: Optional[str] = None
+
+    class ChatRequest(_Record):
+        model: Optional[str] = None
+        messages: Optional[list[ChatMessage]] = None
+        stream: Optional[bool] = None
+        tools: Optional[list[dict]] = None
+        tool_choice: Any = None
+
+    _request_decoder = msgspec.json.Decoder(ChatRequest)
+    _encoder = msgspec.json.Encoder()
+
+
+def _fast_codec_enabled() -> bool:
+    if os.getenv("oai_fast_codec", "false").lower() != "true":
+        return False
+    if msgspec is None:
+        get_log("codec").warning("msgspec not installed, using stdlib json")
+        return False
+    return True
+
+
+FAST = _fast_codec_enabled()
+
+
+async def read_chat_request(request: Request):
+    """The completion request body, as a ChatRequest or a plain dict."""
+    if not FAST:
+        try:
+            return await request.json()
+        except ValueError as e:
+            raise DecodeError(str(e)) from None
+    try:
+        return _request_decoder.decode(await request.body())
+    except msgspec.DecodeError as e:
+        raise DecodeError(str(e)) from None
+
+
+def dumps(obj) -> str:
+    if FAST:
+        return _encoder.encode(obj).decode("utf-8")
+    return json.dumps(obj)
+
+
+def json_response(content, status_code: int = 200, headers: dict = None) -> Response:
+    if FAST:
+        return Response(
+            _encoder.encode(content),
+            status_code=status_code,
+            headers=headers,
+            media_type="application/json",
+        )
+    return JSONResponse(content, status_code=status_code, headers=headers)
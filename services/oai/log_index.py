@@ -0,0 +1,305 @@
+"""
+SQLite index over the conversation logs in data/.
+
+One row per turn with its conversation ID, turn index, timestamp, model,
+byte sizes, upstream latency and per-hop timing, kept in a WAL-mode database so the API can
+query it while the logger writes. An optional FTS5 table holds prompt and
+response text for full-text search.
+
+Run this module to rebuild the index from existing conversation folders
+and log segments:
+
+    python log_index.py rebuild [--data data] [--fts]
+"""
+
+import argparse
+import json
+import os
+import sqlite3
+import threading
+from pathlib import Path
+
+from app_log import get_log
+from log_store import content_hash, iter_records
+
+log = get_log("index")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS turns (
+    conversation_id TEXT NOT NULL,
+    turn_index INTEGER NOT NULL,
+    timestamp REAL NOT NULL,
+    model TEXT,
+    system_hash TEXT,
+    system_bytes INTEGER,
+    prompt_bytes INTEGER,
+    response_bytes INTEGER,
+    latency_ms REAL,
+    timing TEXT,
+    PRIMARY KEY (conversation_id, turn_index)
+);
+CREATE INDEX IF NOT EXISTS turns_timestamp ON turns (timestamp);
+CREATE INDEX IF NOT EXISTS turns_model ON turns (model, timestamp);
+"""
+
+_FTS_SCHEMA = """
+CREATE VIRTUAL TABLE IF NOT EXISTS turns_fts USING fts5(
+    conversation_id UNINDEXED, turn_index UNINDEXED, prompt, response
+);
+"""
+
+_COLUMNS = (
+    "conversation_id",
+    "turn_index",
+    "timestamp",
+    "model",
+    "system_hash",
+    "system_bytes",
+    "prompt_bytes",
+    "response_bytes",
+    "latency_ms",
+    "timing",
+)
+
+
+def turn_row(
+    conversation_id,
+    index,
+    timestamp,
+    system_message,
+    prompt,
+    response,
+    model=None,
+    latency=None,
+    timing=None,
+) -> dict:
+    return {
+        "conversation_id": conversation_id,
+        "turn_index": index,
+        "timestamp": timestamp,
+        "model": model,
+        "system_hash": content_hash(system_message),
+        "system_bytes": len(system_message.encode("utf-8")),
+        "prompt_bytes": len(prompt.encode("utf-8")),
+        "response_bytes": len(response.encode("utf-8")),
+        "latency_ms": None if latency is None else latency * 1000,
+        "timing": json.dumps(timing) if timing else None,
+        "prompt": prompt,
+        "response": response,
+    }
+
+
+class LogIndex:
+    def __init__(self, path: str = "data/index.sqlite3", fts: bool = False):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(turns)")}
+        if "timing" not in columns:
+            # Indexes created before hop timing was recorded.
+            self._conn.execute("ALTER TABLE turns ADD COLUMN timing TEXT")
+        existing_fts = self._conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE name = 'turns_fts'"
+        ).fetchone()
+        self.fts = fts or existing_fts is not None
+        if self.fts:
+            try:
+                self._conn.executescript(_FTS_SCHEMA)
+            except sqlite3.OperationalError as e:
+                log.warning("FTS5 unavailable, text search off: %s", e)
+                self.fts = False
+        self._conn.commit()
+
+    def add_turns(self, rows: list):
+        if not rows:
+            return
+        # The same turn can appear twice (files and segments); keep the last.
+        rows = list({(r["conversation_id"], r["turn_index"]): r for r in rows}.values())
+        placeholders = ", ".join("?" for _ in _COLUMNS)
+        with self._lock, self._conn:
+            self._conn.executemany(
+                f"INSERT OR REPLACE INTO turns ({', '.join(_COLUMNS)}) "
+                f"VALUES ({placeholders})",
+                [tuple(row[column] for column in _COLUMNS) for row in rows],
+            )
+            if self.fts:
+                self._conn.executemany(
+                    "DELETE FROM turns_fts WHERE conversation_id = ? AND turn_index = ?",
+                    [(row["conversation_id"], row["turn_index"]) for row in rows],
+                )
+                self._conn.executemany(
+                    "INSERT INTO turns_fts (conversation_id, turn_index, prompt, response) "
+                    "VALUES (?, ?, ?, ?)",
+                    [
+                        (
+                            row["conversation_id"],
+                            row["turn_index"],
+                            row["prompt"],
+                            row["response"],
+                        )
+                        for row in rows
+                    ],
+                )
+
+    def count(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM turns").fetchone()[0]
+
+    def clear(self):
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM turns")
+            if self.fts:
+                self._conn.execute("DELETE FROM turns_fts")
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def query_turns(
+    path: str = "data/index.sqlite3",
+    conversation_id: str = None,
+    model: str = None,
+    since: float = None,
+    until: float = None,
+    text: str = None,
+    limit: int = 100,
+) -> list:
+    """Read-only lookup, newest turns first."""
+    if not Path(path).exists():
+        return []
+    conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    conn.row_factory = sqlite3.Row
+    try:
+        clauses, params = [], []
+        table = "turns"
+        if text:
+            table = (
+                "turns JOIN turns_fts ON turns_fts.conversation_id = turns.conversation_id "
+                "AND turns_fts.turn_index = turns.turn_index"
+            )
+            clauses.append("turns_fts MATCH ?")
+            params.append(text)
+        for column, operator, value in (
+            ("turns.conversation_id", "=", conversation_id),
+            ("turns.model", "=", model),
+            ("turns.timestamp", ">=", since),
+            ("turns.timestamp", "<=", until),
+        ):
+            if value is not None:
+                clauses.append(f"{column} {operator} ?")
+                params.append(value)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        columns = ", ".join(f"turns.{column}" for column in _COLUMNS)
+        rows = conn.execute(
+            f"SELECT {columns} FROM {table} {where} "
+            "ORDER BY turns.timestamp DESC LIMIT ?",
+            [*params, limit],
+        ).fetchall()
+        turns = [dict(row) for row in rows]
+        for turn in turns:
+            if turn["timing"]:
+                turn["timing"] = json.loads(turn["timing"])
+        return turns
+    finally:
+        conn.close()
+
+
+def _folder_rows(base_folder: Path):
+    for conv_folder in base_folder.iterdir():
+        if not conv_folder.is_dir():
+            continue
+        for prompt_path in conv_folder.glob("*_prompt.md"):
+            index = prompt_path.name.split("_", 1)[0]
+            if not index.isdigit():
+                continue
+            system_path = conv_folder / f"{index}_system.md"
+            response_path = conv_folder / f"{index}_response.md"
+            timing_path = conv_folder / f"{index}_timing.json"
+            try:
+                timing = None
+                if timing_path.exists():
+                    timing = json.loads(timing_path.read_text(encoding="utf-8"))
+                yield turn_row(
+                    conv_folder.name,
+                    int(index),
+                    prompt_path.stat().st_mtime,
+                    system_path.read_text(encoding="utf-8"),
+                    prompt_path.read_text(encoding="utf-8"),
+                    response_path.read_text(encoding="utf-8"),
+                    timing=timing,
+                )
+            except (OSError, ValueError) as e:
+                log.warning("Skipping %s: %s", prompt_path, e)
+
+
+def _segment_rows(logs_folder: Path):
+    blobs = {}
+    for record in iter_records(str(logs_folder)):
+        if record.get("type") == "blob":
+            blobs[record["hash"]] = record["data"]
+        elif record.get("type") == "turn":
+            yield turn_row(
+                record["conversation_id"],
+                record["index"],
+                record["timestamp"],
+                blobs.get(record["system"], ""),
+                record["prompt"],
+                record["response"],
+                record.get("model"),
+                record.get("latency"),
+                record.get("timing"),
+            )
+
+
+def rebuild(base_folder: str = "data", fts: bool = False, batch_size: int = 500) -> int:
+    base_folder = Path(base_folder)
+    index = LogIndex(str(base_folder / "index.sqlite3"), fts=fts)
+    index.clear()
+    batch = []
+    for source in (_folder_rows(base_folder), _segment_rows(base_folder / "logs")):
+        for row in source:
+            batch.append(row)
+            if len(batch) >= batch_size:
+                index.add_turns(batch)
+                batch = []
+    index.add_turns(batch)
+    total = index.count()
+    index.close()
+    return total
+
+
+def index_path(base_folder: str = "data") -> str:
+    return str(Path(base_folder) / "index.sqlite3")
+
+
+def create_log_index(base_folder: str = "data"):
+    if os.getenv("oai_log_index", "true").lower() != "true":
+        return None
+    return LogIndex(
+        index_path(base_folder),
+        fts=os.getenv("oai_log_index_fts", "false").lower() == "true",
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Conversation log index tools")
+    subcommands = parser.add_subparsers(dest="command", required=True)
+    rebuild_parser = subcommands.add_parser(
+        "rebuild", help="Rebuild the index from conversation folders and segments"
+    )
+    rebuild_parser.add_argument("--data", default="data")
+    rebuild_parser.add_argument("--fts", action="store_true")
+    args = parser.parse_args()
+
+    if args.command == "rebuild":
+        count = rebuild(args.data, fts=args.fts)
+        print(f"Indexed {count} turns into {index_path(args.data)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,254 @@
+"""
+Append-only segmented store for conversation logs.
+
+Turns are appended as JSON lines to rotating segment files under
+data/logs instead of three .md files per turn. System messages are stored
+once per distinct content as a blob record and turns reference them by
+hash. Writes are buffered and committed in groups, optionally as zstd
+frames when the zstandard package is installed.
+
+Run this module to export a conversation back to the per-turn .md layout:
+
+    python log_store.py export <conversation_id> [--logs data/logs] [--out data]
+"""
+
+import argparse
+import hashlib
+import io
+import json
+import os
+import re
+import threading
+import time
+from pathlib import Path
+
+from app_log import get_log
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+log = get_log("storage")
+
+_SEGMENT_RE = re.compile(r"^segment-(\d+)\.jsonl(\.zst)?$")
+
+
+def content_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def _segment_paths(folder: Path) -> list:
+    segments = []
+    if folder.exists():
+        for path in folder.iterdir():
+            match = _SEGMENT_RE.match(path.name)
+            if match:
+                segments.append((int(match.group(1)), path))
+    return [path for _, path in sorted(segments)]
+
+
+class SegmentLogStore:
+    def __init__(
+        self,
+        folder: str = "data/logs",
+        segment_bytes: int = 64 * 1024 * 1024,
+        commit_bytes: int = 1024 * 1024,
+        compress: bool = False,
+        compression_level: int = 3,
+        fsync: bool = False,
+    ):
+        self.folder = Path(folder)
+        self.segment_bytes = segment_bytes
+        self.commit_bytes = commit_bytes
+        self.fsync = fsync
+        self.compress = compress and zstandard is not None
+        if compress and zstandard is None:
+            log.warning("zstandard not installed, writing plain segments")
+        self._compressor = (
+            zstandard.ZstdCompressor(level=compression_level) if self.compress else None
+        )
+        self._lock = threading.Lock()
+        self._pending = []
+        self._pending_bytes = 0
+        self._blobs = set()
+        self._file = None
+        self._segment_size = 0
+        self.folder.mkdir(parents=True, exist_ok=True)
+        existing = _segment_paths(self.folder)
+        last = _SEGMENT_RE.match(existing[-1].name).group(1) if existing else 0
+        self._segment_number = int(last)
+        self.commits = 0
+
+    def append_turn(
+        self,
+        conversation_id: str,
+        index: int,
+        system_message: str,
+        prompt: str,
+        response: str,
+        timestamp: float = None,
+        model: str = None,
+        latency: float = None,
+        timing: dict = None,
+    ):
+        system_hash = content_hash(system_message)
+        with self._lock:
+            if self._file is None or self._segment_size >= self.segment_bytes:
+                self._commit()
+                self._rotate()
+            if system_hash not in self._blobs:
+                self._blobs.add(system_hash)
+                self._add({"type": "blob", "hash": system_hash, "data": system_message})
+            self._add(
+                {
+                    "type": "turn",
+                    "conversation_id": conversation_id,
+                    "index": index,
+                    "timestamp": timestamp or time.time(),
+                    "system": system_hash,
+                    "prompt": prompt,
+                    "response": response,
+                    "model": model,
+                    "latency": latency,
+                    "timing": timing,
+                }
+            )
+            if self._pending_bytes >= self.commit_bytes:
+                self._commit()
+
+    def _add(self, record: dict):
+        line = (json.dumps(record, ensure_ascii=False) + "\n").encode("utf-8")
+        self._pending.append(line)
+        self._pending_bytes += len(line)
+
+    def flush(self):
+        with self._lock:
+            self._commit()
+
+    def _commit(self):
+        if not self._pending:
+            return
+        data = b"".join(self._pending)
+        self._pending = []
+        self._pending_bytes = 0
+        if self._compressor:
+            data = self._compressor.compress(data)
+        self._file.write(data)
+        self._file.flush()
+        if self.fsync:
+            os.fsync(self._file.fileno())
+        self._segment_size += len(data)
+        self.commits += 1
+
+    def _rotate(self):
+        if self._file is not None:
+            self._file.close()
+        self._segment_number += 1
+        suffix = ".jsonl.zst" if self.compress else ".jsonl"
+        path = self.folder / f"segment-{self._segment_number:06d}{suffix}"
+        self._file = open(path, "ab")
+        self._segment_size = 0
+        # Every segment carries the blobs its turns reference, so old
+        # segments can be archived or deleted independently.
+        self._blobs = set()
+
+    def close(self):
+        with self._lock:
+            self._commit()
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+def iter_records(folder: str = "data/logs"):
+    for path in _segment_paths(Path(folder)):
+        if path.suffix == ".zst":
+            if zstandard is None:
+                log.warning("Skipping %s, zstandard missing", path.name)
+                continue
+            try:
+                with open(path, "rb") as f:
+                    reader = zstandard.ZstdDecompressor().stream_reader(
+                        f, read_across_frames=True
+                    )
+                    lines = io.TextIOWrapper(reader, encoding="utf-8")
+                    yield from _parse_lines(lines, path)
+            except (zstandard.ZstdError, UnicodeDecodeError) as e:
+                # A crash mid-commit can cut the last frame short.
+                log.warning("Stopped reading %s at a damaged frame: %s", path.name, e)
+        else:
+            with open(path, "r", encoding="utf-8") as f:
+                yield from _parse_lines(f, path)
+
+
+def _parse_lines(lines, path):
+    for line in lines:
+        if not line.strip():
+            continue
+        try:
+            yield json.loads(line)
+        except json.JSONDecodeError:
+            # A crash can leave a partial last line behind.
+            log.warning("Skipping truncated record in %s", path.name)
+
+
+def export_conversation(
+    conversation_id: str, folder: str = "data/logs", out_folder: str = "data"
+) -> int:
+    """Write a conversation's turns back as {index}_system/prompt/response.md."""
+    blobs = {}
+    conv_folder = Path(out_folder) / conversation_id
+    exported = 0
+    for record in iter_records(folder):
+        if record.get("type") == "blob":
+            blobs[record["hash"]] = record["data"]
+            continue
+        if record.get("conversation_id") != conversation_id:
+            continue
+        conv_folder.mkdir(parents=True, exist_ok=True)
+        index = record["index"]
+        (conv_folder / f"{index}_system.md").write_text(
+            blobs.get(record["system"], ""), encoding="utf-8"
+        )
+        (conv_folder / f"{index}_prompt.md").write_text(
+            record["prompt"], encoding="utf-8"
+        )
+        (conv_folder / f"{index}_response.md").write_text(
+            record["response"], encoding="utf-8"
+        )
+        if record.get("timing"):
+            (conv_folder / f"{index}_timing.json").write_text(
+                json.dumps(record["timing"]), encoding="utf-8"
+            )
+        exported += 1
+    return exported
+
+
+def create_log_store(base_folder: str = "data"):
+    if os.getenv("oai_log_backend", "files").lower() not in ("segments", "both"):
+        return None
+    return SegmentLogStore(
+        folder=str(Path(base_folder) / "logs"),
+        segment_bytes=int(os.getenv("oai_log_segment_mb", "64")) * 1024 * 1024,
+        compress=os.getenv("oai_log_compress", "false").lower() == "true",
+        fsync=os.getenv("oai_log_fsync", "false").lower() == "true",
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Conversation log segment tools")
+    subcommands = parser.add_subparsers(dest="command", required=True)
+    export = subcommands.add_parser("export", help="Export a conversation to .md")
+    export.add_argument("conversation_id")
+    export.add_argument("--logs", default="data/logs")
+    export.add_argument("--out", default="data")
+    args = parser.parse_args()
+
+    if args.command == "export":
+        count = export_conversation(args.conversation_id, args.logs, args.out)
+        print(f"Exported {count} turns to {Path(args.out) / args.conversation_id}")
+
+
+if __name__ == "__main__":
+    main()
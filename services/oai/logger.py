@@ -4,19 +4,82 @@ and gracefully handles errors without interrupting the main server.
 """
 
 import asyncio
+import hashlib
+import json
+import os
 import threading
+import time
 from pathlib import Path
 from datetime import datetime
-from queue import Queue
+from queue import Empty, Full, Queue
 from typing import Optional
-import traceback
+from app_log import get_log
+from log_index import create_log_index, turn_row
+from log_store import create_log_store
+
+log = get_log("storage")
 
 
 class SafeLogger:
-    def __init__(self, base_folder: str = "data"):
+    """
+    Writes are queued on a bounded queue and drained in batches by one
+    worker thread. When the queue is full, overflow_policy decides:
+
+    "block"       wait up to block_timeout seconds for room, then drop;
+                  called from the event loop, the wait runs in its
+                  default executor so the loop keeps serving, and at
+                  most max_blocked_waits entries wait at once; past
+                  that, new entries are dropped
+    "drop_oldest" discard the oldest queued entry to make room
+    "sample"      past half full keep only every sample_every-th entry,
+                  drop new entries once full
+    """
+
+    OVERFLOW_POLICIES = ("block", "drop_oldest", "sample")
+
+    def __init__(
+        self,
+        base_folder: str = "data",
+        max_queue: int = 10000,
+        batch_size: int = 256,
+        overflow_policy: str = "drop_oldest",
+        block_timeout: float = 0.05,
+        max_blocked_waits: int = 8,
+        sample_every: int = 10,
+        raw_dump_every: int = 1,
+        raw_dump_min_bytes: int = 0,
+    ):
+        if overflow_policy not in self.OVERFLOW_POLICIES:
+            raise ValueError(f"Unknown overflow policy: {overflow_policy}")
         self.base_folder = Path(base_folder)
         self.raw_dumps_folder = self.base_folder / "raw_dumps"
-        self.queue = Queue()
+        self.raw_dump_every = max(1, raw_dump_every)
+        self.raw_dump_min_bytes = raw_dump_min_bytes
+        self._raw_dump_counter = 0
+        self._known_blobs = set()
+        self.write_files = os.getenv("oai_log_backend", "files").lower() in (
+            "files",
+            "both",
+        )
+        self.log_store = None
+        self.log_index = None
+        self._index_rows = []
+        self.queue = Queue(maxsize=max_queue)
+        self.batch_size = max(1, batch_size)
+        self.overflow_policy = overflow_policy
+        self.block_timeout = block_timeout
+        self.max_blocked_waits = max(0, max_blocked_waits)
+        self._blocked_waits = 0
+        self.sample_every = max(1, sample_every)
+        self._stats_lock = threading.Lock()
+        self._sample_counter = 0
+        self.enqueued = 0
+        self.written = 0
+        self.dropped = 0
+        self.batches = 0
+        self.max_depth = 0
+        self.write_seconds_total = 0.0
+        self.write_seconds_max = 0.0
         self.worker_thread = None
         self.running = False
         self._ensure_folders()
@@ -26,53 +89,215 @@ class SafeLogger:
         try:
             self.base_folder.mkdir(parents=True, exist_ok=True)
             self.raw_dumps_folder.mkdir(parents=True, exist_ok=True)
-            print(f"[SafeLogger] Initialized folders: {self.base_folder}")
+            log.debug("Initialized folders: %s", self.base_folder)
         except Exception as e:
-            print(f"[SafeLogger] WARNING: Failed to create folders: {e}")
+            log.warning("Failed to create folders: %s", e)
+        try:
+            self.log_store = create_log_store(str(self.base_folder))
+        except Exception as e:
+            log.warning("Failed to open log segments: %s", e)
+        try:
+            self.log_index = create_log_index(str(self.base_folder))
+        except Exception as e:
+            log.warning("Failed to open log index: %s", e)
 
     def _start_worker(self):
         self.running = True
         self.worker_thread = threading.Thread(target=self._worker, daemon=True)
         self.worker_thread.start()
-        print(f"[SafeLogger] Worker thread started")
+        log.debug("Worker thread started")
 
     def _worker(self):
         while self.running:
             try:
-                task = self.queue.get(timeout=1.0)
-                if task is None:
+                batch = [self.queue.get(timeout=1.0)]
+            except Empty:
+                continue
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except Empty:
                     break
 
-                task_type, args = task
+            started = time.perf_counter()
+            stop = False
+            for task in batch:
+                if task is None:
+                    stop = True
+                    continue
+                try:
+                    task_type, args = task
+                    if task_type == "raw_dump":
+                        self._write_raw_dump(*args)
+                    elif task_type == "conversation_log":
+                        self._write_conversation_log(*args)
+                except Exception as e:
+                    log.exception("Worker error: %s", e)
+            self._commit_batch()
+            elapsed = time.perf_counter() - started
 
-                if task_type == "raw_dump":
-                    self._write_raw_dump(*args)
-                elif task_type == "conversation_log":
-                    self._write_conversation_log(*args)
+            with self._stats_lock:
+                self.batches += 1
+                self.written += len(batch) - stop
+                self.write_seconds_total += elapsed
+                self.write_seconds_max = max(self.write_seconds_max, elapsed)
+            for _ in batch:
+                self.queue.task_done()
+            if stop:
+                break
 
+    def _enqueue(self, task) -> bool:
+        if self.overflow_policy == "sample" and self._over_sampling_mark():
+            return self._count_drop()
+        try:
+            self.queue.put_nowait(task)
+        except Full:
+            if self.overflow_policy == "block":
+                return self._put_blocking(task)
+            if self.overflow_policy != "drop_oldest":
+                return self._count_drop()
+            try:
+                self.queue.get_nowait()
                 self.queue.task_done()
+                self._count_drop()
+            except Empty:
+                pass
+            try:
+                self.queue.put_nowait(task)
+            except Full:
+                return self._count_drop()
+        self._count_enqueued()
+        return True
 
-            except Exception as e:
-                if "Empty" not in str(type(e).__name__):
-                    print(f"[SafeLogger] Worker error: {e}")
-                    traceback.print_exc()
+    def _put_blocking(self, task) -> bool:
+        """
+        Wait for room in the queue. On the event loop the wait is deferred
+        to the executor and False is returned: the entry is only counted
+        as enqueued, or as dropped, once the wait is over.
+        """
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return self._wait_for_room(task)
+        with self._stats_lock:
+            if self._blocked_waits >= self.max_blocked_waits:
+                self.dropped += 1
+                return False
+            self._blocked_waits += 1
+        try:
+            future = loop.run_in_executor(None, self._wait_for_room, task)
+        except RuntimeError as e:
+            log.warning("Cannot wait for log queue room: %s", e)
+            self._blocked_wait_done(None)
+            return self._count_drop()
+        future.add_done_callback(self._blocked_wait_done)
+        return False
+
+    def _blocked_wait_done(self, future):
+        with self._stats_lock:
+            self._blocked_waits -= 1
+        if future is None or future.cancelled():
+            return
+        if future.exception() is not None:
+            log.error("Failed waiting for log queue room: %s", future.exception())
+            self._count_drop()
 
-    def _write_raw_dump(self, system_message: str, user_prompt: str):
+    def _wait_for_room(self, task) -> bool:
         try:
-            # Ensure folder exists
-            self.raw_dumps_folder.mkdir(parents=True, exist_ok=True)
+            self.queue.put(task, timeout=self.block_timeout)
+        except Full:
+            return self._count_drop()
+        self._count_enqueued()
+        return True
+
+    def _count_enqueued(self):
+        with self._stats_lock:
+            self.enqueued += 1
+            self.max_depth = max(self.max_depth, self.queue.qsize())
 
-            timestamp = int(datetime.now().timestamp())
-            system_file = self.raw_dumps_folder / f"system_{timestamp}.md"
-            user_file = self.raw_dumps_folder / f"user_{timestamp}.md"
+    def _over_sampling_mark(self) -> bool:
+        if self.queue.qsize() < self.queue.maxsize // 2:
+            return False
+        with self._stats_lock:
+            self._sample_counter += 1
+            return self._sample_counter % self.sample_every != 0
 
-            system_file.write_text(system_message, encoding="utf-8")
-            user_file.write_text(user_prompt, encoding="utf-8")
+    def _count_drop(self) -> bool:
+        with self._stats_lock:
+            self.dropped += 1
+        return False
 
-            print(f"[SafeLogger] Raw dump saved: {timestamp}")
+    def stats(self) -> dict:
+        with self._stats_lock:
+            return {
+                "queue_depth": self.queue.qsize(),
+                "queue_max_depth": self.max_depth,
+                "queue_capacity": self.queue.maxsize,
+                "overflow_policy": self.overflow_policy,
+                "enqueued": self.enqueued,
+                "written": self.written,
+                "dropped": self.dropped,
+                "blocked_waits": self._blocked_waits,
+                "batches": self.batches,
+                "write_seconds_total": self.write_seconds_total,
+                "write_seconds_max": self.write_seconds_max,
+            }
+
+    def _commit_batch(self):
+        if self.log_store is not None:
+            try:
+                self.log_store.flush()
+            except Exception as e:
+                log.error("Failed committing log segment: %s", e)
+        if self.log_index is not None and self._index_rows:
+            rows, self._index_rows = self._index_rows, []
+            try:
+                self.log_index.add_turns(rows)
+            except Exception as e:
+                log.error("Failed updating log index: %s", e)
+
+    def _store_blob(self, content: str) -> str:
+        """Write content once under raw_dumps/blobs, named by its sha256."""
+        digest = hashlib.sha256(content.encode("utf-8")).hexdigest()
+        path = self.raw_dumps_folder / "blobs" / digest[:2] / f"{digest}.md"
+        if digest in self._known_blobs or path.exists():
+            # Refresh the mtime so the janitor's age check keeps blobs that
+            # are still in use.
+            try:
+                os.utime(path)
+            except FileNotFoundError:
+                self._known_blobs.discard(digest)
+                return self._store_blob(content)
+        else:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = path.with_suffix(".tmp")
+            tmp_path.write_text(content, encoding="utf-8")
+            os.replace(tmp_path, path)
+        self._known_blobs.add(digest)
+        return digest
+
+    def _write_raw_dump(
+        self, system_message: str, user_prompt: str, timestamp: float = None
+    ):
+        try:
+            timestamp = timestamp or time.time()
+            manifest = {
+                "timestamp": timestamp,
+                "system": self._store_blob(system_message),
+                "system_bytes": len(system_message),
+                "user": self._store_blob(user_prompt),
+                "user_bytes": len(user_prompt),
+            }
+            day = datetime.fromtimestamp(timestamp).strftime("%Y-%m-%d")
+            manifests_folder = self.raw_dumps_folder / "manifests"
+            manifests_folder.mkdir(parents=True, exist_ok=True)
+            with open(manifests_folder / f"{day}.jsonl", "a", encoding="utf-8") as f:
+                f.write(json.dumps(manifest) + "\n")
+
+            log.debug("Raw dump saved: %s", manifest["user"][:12])
 
         except Exception as e:
-            print(f"[SafeLogger] ERROR writing raw dump: {e}")
+            log.error("Failed writing raw dump: %s", e)
 
     def _write_conversation_log(
         self,
@@ -81,7 +306,43 @@ class SafeLogger:
         system_message: str,
         prompt: str,
         response: str,
+        timestamp: float = None,
+        model: str = None,
+        latency: float = None,
+        timing: dict = None,
     ):
+        timestamp = timestamp or time.time()
+        if self.log_index is not None:
+            self._index_rows.append(
+                turn_row(
+                    conversation_id,
+                    index,
+                    timestamp,
+                    system_message,
+                    prompt,
+                    response,
+                    model,
+                    latency,
+                    timing,
+                )
+            )
+        if self.log_store is not None:
+            try:
+                self.log_store.append_turn(
+                    conversation_id,
+                    index,
+                    system_message,
+                    prompt,
+                    response,
+                    timestamp,
+                    model,
+                    latency,
+                    timing,
+                )
+            except Exception as e:
+                log.error("Failed appending conversation log: %s", e)
+        if not self.write_files:
+            return
         try:
             conv_folder = self.base_folder / conversation_id
             conv_folder.mkdir(parents=True, exist_ok=True)
@@ -93,17 +354,27 @@ class SafeLogger:
             (conv_folder / f"{index}_response.md").write_text(
                 response, encoding="utf-8"
             )
+            if timing:
+                (conv_folder / f"{index}_timing.json").write_text(
+                    json.dumps(timing), encoding="utf-8"
+                )
 
-            print(f"[SafeLogger] Conversation log saved: {conversation_id}/{index}")
+            log.debug("Conversation log saved: %s/%s", conversation_id, index)
 
         except Exception as e:
-            print(f"[SafeLogger] ERROR writing conversation log: {e}")
+            log.error("Failed writing conversation log: %s", e)
 
     def dump_raw_prompts(self, system_message: str, user_prompt: str):
         try:
-            self.queue.put(("raw_dump", (system_message, user_prompt)))
+            if len(system_message) + len(user_prompt) < self.raw_dump_min_bytes:
+                return
+            with self._stats_lock:
+                self._raw_dump_counter += 1
+                if (self._raw_dump_counter - 1) % self.raw_dump_every:
+                    return
+            self._enqueue(("raw_dump", (system_message, user_prompt, time.time())))
         except Exception as e:
-            print(f"[SafeLogger] ERROR queuing raw dump: {e}")
+            log.error("Failed queuing raw dump: %s", e)
 
     def log_conversation(
         self,
@@ -112,24 +383,43 @@ class SafeLogger:
         system_message: str,
         prompt: str,
         response: str,
+        model: str = None,
+        latency: float = None,
+        timing: dict = None,
     ):
         try:
-            self.queue.put(
+            self._enqueue(
                 (
                     "conversation_log",
-                    (conversation_id, index, system_message, prompt, response),
+                    (
+                        conversation_id,
+                        index,
+                        system_message,
+                        prompt,
+                        response,
+                        time.time(),
+                        model,
+                        latency,
+                        timing,
+                    ),
                 )
             )
         except Exception as e:
-            print(f"[SafeLogger] ERROR queuing conversation log: {e}")
+            log.error("Failed queuing conversation log: %s", e)
 
     def shutdown(self):
-        print(f"[SafeLogger] Shutting down...")
-        self.running = False
-        self.queue.put(None)
+        log.info("Shutting down...")
+        try:
+            self.queue.put(None, timeout=5.0)
+        except Full:
+            self.running = False
         if self.worker_thread:
             self.worker_thread.join(timeout=5.0)
-        print(f"[SafeLogger] Shutdown complete")
+        if self.log_store is not None:
+            self.log_store.close()
+        if self.log_index is not None:
+            self.log_index.close()
+        log.info("Shutdown complete")
 
 
 _logger_instance: Optional[SafeLogger] = None
@@ -138,13 +428,25 @@ _logger_instance: Optional[SafeLogger] = None
 def get_logger() -> SafeLogger:
     global _logger_instance
     if _logger_instance is None:
-        _logger_instance = SafeLogger()
+        _logger_instance = SafeLogger(
+            max_queue=int(os.getenv("oai_log_queue_size", "10000")),
+            batch_size=int(os.getenv("oai_log_batch_size", "256")),
+            overflow_policy=os.getenv("oai_log_overflow", "drop_oldest"),
+            max_blocked_waits=int(os.getenv("oai_log_max_blocked_waits", "8")),
+            sample_every=int(os.getenv("oai_log_sample_every", "10")),
+            raw_dump_every=int(os.getenv("oai_raw_dump_every", "1")),
+            raw_dump_min_bytes=int(os.getenv("oai_raw_dump_min_bytes", "0")),
+        )
     return _logger_instance
 
 
+def logger_stats() -> dict:
+    return get_logger().stats()
+
+
 def dump_raw_prompts(system_message: str, user_prompt: str):
     try:
         logger = get_logger()
         logger.dump_raw_prompts(system_message, user_prompt)
     except Exception as e:
-        print(f"[SafeLogger] CRITICAL: Failed to log raw prompts: {e}")
+        log.error("Failed to log raw prompts: %s", e)
@@ -0,0 +1,100 @@
+"""
+Prometheus metrics for the OAI service, served on /metrics behind the
+same API key as the rest of the API.
+
+Stage histograms cover the path of a completion: template composition,
+the relay round trip, upstream time to first delta and the rest of the
+generation, and parsing of the response.
+"""
+
+import threading
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+)
+
+_FAST_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0)
+_UPSTREAM_BUCKETS = (0.1, 0.25, 0.5, 1, 2, 4, 8, 15, 30, 60, 120, 300)
+
+REQUEST_SECONDS = Histogram(
+    "wormhole_oai_request_seconds",
+    "Total HTTP request latency, including streamed bodies",
+    ["path"],
+    buckets=_UPSTREAM_BUCKETS,
+)
+TEMPLATE_SECONDS = Histogram(
+    "wormhole_oai_template_seconds",
+    "Time spent composing prompts from templates",
+    buckets=_FAST_BUCKETS,
+)
+RELAY_SECONDS = Histogram(
+    "wormhole_oai_relay_round_trip_seconds",
+    "Time from sending a command to the relay until its result arrives",
+    ["command"],
+    buckets=_UPSTREAM_BUCKETS,
+)
+UPSTREAM_TTFB_SECONDS = Histogram(
+    "wormhole_oai_upstream_ttfb_seconds",
+    "Time from sending a command until the first streamed delta",
+    ["command"],
+    buckets=_UPSTREAM_BUCKETS,
+)
+GENERATION_SECONDS = Histogram(
+    "wormhole_oai_upstream_generation_seconds",
+    "Time from the first streamed delta until the final result",
+    ["command"],
+    buckets=_UPSTREAM_BUCKETS,
+)
+PARSE_SECONDS = Histogram(
+    "wormhole_oai_parse_seconds",
+    "Time spent parsing model responses for tool calls and answers",
+    buckets=_FAST_BUCKETS,
+)
+
+REQUESTS = Counter(
+    "wormhole_oai_requests_total",
+    "HTTP requests by model and status code",
+    ["path", "model", "status"],
+)
+CACHE_LOOKUPS = Counter(
+    "wormhole_oai_cache_lookups_total",
+    "Response cache lookups",
+    ["result"],
+)
+TOOL_CALLS = Counter(
+    "wormhole_oai_tool_calls_total",
+    "Tool calls returned to clients",
+    ["model"],
+)
+IN_FLIGHT = Gauge(
+    "wormhole_oai_in_flight_requests",
+    "HTTP requests currently being served",
+)
+LOGGER_QUEUE_DEPTH = Gauge(
+    "wormhole_oai_logger_queue_depth",
+    "Entries waiting in the logger queue",
+)
+LOGGER_DROPPED = Counter(
+    "wormhole_oai_logger_dropped",
+    "Log entries dropped by the logger overflow policy",
+)
+
+_logger_dropped_lock = threading.Lock()
+_logger_dropped_seen = 0
+
+
+def sync_logger_dropped(total: int):
+    """Advance LOGGER_DROPPED to the logger's running drop count."""
+    global _logger_dropped_seen
+    with _logger_dropped_lock:
+        if total > _logger_dropped_seen:
+            LOGGER_DROPPED.inc(total - _logger_dropped_seen)
+            _logger_dropped_seen = total
+
+
+def render() -> tuple:
+    return generate_latest(), CONTENT_TYPE_LATEST
@@ -1,36 +1,200 @@
+import hashlib
+import json
+import os
 import re
-from jinja2 import Template, StrictUndefined
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from jinja2 import meta
+from jinja2 import (
+    Environment,
+    FileSystemBytecodeCache,
+    FunctionLoader,
+    StrictUndefined,
+    Template,
+)
 
+_template_sources = {}
+_compiled_templates = {}
+_template_variables = {}
+_file_cache = {}
 
-def extract_client_instructions(raw_system: str) -> str:
-    if not raw_system:
-        return ""
 
-    pattern = r"<instructions>(.*?)</instructions>"
-    matches = list(re.finditer(pattern, raw_system, re.DOTALL))
+def _load_template_source(name):
+    source = _template_sources.get(name)
+    if source is None:
+        return None
+    return source, None, lambda: True
 
-    if not matches:
-        return ""
 
-    last_match = matches[-1]
-    return last_match.group(0)
+def _bytecode_cache():
+    cache_dir = os.getenv("oai_jinja_bytecode_cache")
+    if not cache_dir:
+        return None
+    Path(cache_dir).mkdir(parents=True, exist_ok=True)
+    return FileSystemBytecodeCache(cache_dir)
 
 
-def extract_context_tag(raw_system: str) -> str:
-    if not raw_system:
-        return ""
+_environment = Environment(
+    loader=FunctionLoader(_load_template_source),
+    undefined=StrictUndefined,
+    cache_size=256,
+    bytecode_cache=_bytecode_cache(),
+)
+
+
+_TAG_OPEN_RE = re.compile(r"<(context|attachments|userRequest|instructions)>")
+# Tags whose last element counts; for the others the first one does.
+_LAST_WINS = frozenset({"instructions"})
 
-    pattern = r"<context>(.*?)</context>"
-    match = re.search(pattern, raw_system, re.DOTALL)
 
-    if not match:
+def find_tags(text: str) -> dict:
+    """
+    Offsets of the <context>, <attachments>, <userRequest> and <instructions>
+    elements in text, found in one left-to-right pass.
+
+    Maps each tag to (start, end, inner_start, inner_end); slice text with
+    them only for the parts that are needed. Text inside a matched element
+    is not searched for further tags. scan_messages() finds the tags of a
+    request's prompts once; pass its spans to the helpers below instead of
+    scanning the same prompt again.
+    """
+    spans = {}
+    unclosed = set()
+    position = 0
+    while True:
+        match = _TAG_OPEN_RE.search(text, position)
+        if match is None:
+            return spans
+        tag = match.group(1)
+        if tag in unclosed:
+            position = match.end()
+            continue
+        close = text.find(f"</{tag}>", match.end())
+        if close < 0:
+            unclosed.add(tag)
+            position = match.end()
+            continue
+        end = close + len(tag) + 3
+        if tag not in spans or tag in _LAST_WINS:
+            spans[tag] = (match.start(), end, match.end(), close)
+        position = end
+
+
+def tag_element(text: str, tag: str, tags: dict = None) -> str:
+    if not text:
         return ""
+    span = (find_tags(text) if tags is None else tags).get(tag)
+    return text[span[0] : span[1]] if span else ""
+
+
+def extract_client_instructions(raw_system: str, tags: dict = None) -> str:
+    return tag_element(raw_system, "instructions", tags)
+
+
+def extract_context_tag(raw_system: str, tags: dict = None) -> str:
+    return tag_element(raw_system, "context", tags)
+
+
+def scan_messages(messages: list, has_final_answer) -> dict:
+    """
+    Pull the system prompt, the latest user request and its tags out of a chat.
+
+    Only the last system and last user message are read: earlier ones are
+    superseded. Context comes from the system prompt, else from the user.
+    Each prompt is scanned for tags once; "system_tags" keeps the spans
+    found in raw_system for later extract_* calls.
+    """
+    last_system = last_user = last_assistant = None
+    has_tool_results = False
+    for msg in messages:
+        role = msg.get("role")
+        if role == "system":
+            last_system = msg
+        elif role == "user":
+            last_user = msg
+            has_tool_results = False
+        elif role == "assistant":
+            last_assistant = msg
+        elif role == "tool":
+            has_tool_results = True
+
+    raw_system = last_system.get("content", "") if last_system else ""
+    raw_user = _message_text(last_user.get("content", "")) if last_user else ""
+    assistant_content = last_assistant.get("content", "") if last_assistant else ""
+
+    system_tags = find_tags(raw_system) if raw_system else {}
+    user_tags = find_tags(raw_user) if raw_user else {}
+    user_request = raw_user
+    if "userRequest" in user_tags:
+        _, _, inner_start, inner_end = user_tags["userRequest"]
+        user_request = raw_user[inner_start:inner_end].strip()
+
+    return {
+        "raw_system": raw_system,
+        "system_tags": system_tags,
+        "raw_user": raw_user,
+        "user_request": user_request,
+        "attachments": tag_element(raw_user, "attachments", user_tags),
+        "context": tag_element(raw_system, "context", system_tags)
+        or tag_element(raw_user, "context", user_tags),
+        "has_tool_results": has_tool_results,
+        "last_assistant_had_final_answer": bool(
+            assistant_content and has_final_answer(assistant_content)
+        ),
+    }
+
 
-    return match.group(0)
+def _message_text(content) -> str:
+    if isinstance(content, str):
+        return content
+    if isinstance(content, list):
+        text_parts = [
+            item.get("text", "")
+            for item in content
+            if isinstance(item, dict) and item.get("type") == "text"
+        ]
+        return " ".join(text_parts) if text_parts else str(content)
+    return str(content)
+
+
+def compile_template(template: str) -> Template:
+    compiled_template = _compiled_templates.get(template)
+    if compiled_template is None:
+        name = hashlib.sha1(template.encode("utf-8")).hexdigest()
+        _template_sources[name] = template
+        compiled_template = _environment.get_template(name)
+        _compiled_templates[template] = compiled_template
+    return compiled_template
+
+
+def template_variables(template: str) -> frozenset:
+    """Names of the variables a template references."""
+    names = _template_variables.get(template)
+    if names is None:
+        names = frozenset(meta.find_undeclared_variables(_environment.parse(template)))
+        _template_variables[template] = names
+    return names
+
+
+def read_text_cached(path, default=None):
+    """Read a text file, re-reading it only when its mtime or size changes."""
+    path = Path(path)
+    try:
+        stat = path.stat()
+    except OSError:
+        _file_cache.pop(path, None)
+        return default
+    cached = _file_cache.get(path)
+    if cached and cached[0] == (stat.st_mtime_ns, stat.st_size):
+        return cached[1]
+    content = path.read_text(encoding="utf-8")
+    _file_cache[path] = ((stat.st_mtime_ns, stat.st_size), content)
+    return content
 
 
 def populate_template(template: str, variables: dict) -> str:
-    compiled_template = Template(template, undefined=StrictUndefined)
+    compiled_template = compile_template(template)
     try:
         return compiled_template.render(**variables)
     except Exception as e:
@@ -62,6 +226,86 @@ def to_simple_tool_prompt(tool: dict) -> str:
     return f"- {name}({params_str})"
 
 
+def _type_key(prop_type):
+    # JSON Schema allows a list of types, e.g. ["string", "null"].
+    if isinstance(prop_type, (str, type(None))):
+        return prop_type
+    return json.dumps(prop_type, sort_keys=True, default=str)
+
+
+def tool_schema_key(tools: list) -> tuple:
+    """
+    Canonical key over the parts of each tool the prompt renderers read.
+    Building it is far cheaper than serializing and hashing the full schema,
+    and edits to fields the prompts never show keep hitting the cache.
+    """
+    key = []
+    for tool in tools:
+        function = tool.get("function", {})
+        properties = function.get("parameters", {}).get("properties", {})
+        key.append(
+            (
+                function.get("name", "unknown"),
+                function.get("description", ""),
+                tuple(
+                    (prop_name, _type_key(prop_info.get("type")))
+                    for prop_name, prop_info in properties.items()
+                ),
+            )
+        )
+    return tuple(key)
+
+
+class ToolPromptCache:
+    """Bounded LRU of rendered tool lists keyed by tool_schema_key()."""
+
+    def __init__(self, max_entries: int = 64):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def render(self, tools: list) -> tuple:
+        """Return (tools_list, simple_tools_list) for the given tools."""
+        if not tools:
+            return [], []
+        try:
+            key = tool_schema_key(tools)
+            hash(key)
+        except (AttributeError, TypeError):
+            # Schemas the key cannot describe are rendered uncached.
+            return self._render(tools)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry
+            self.misses += 1
+        entry = self._render(tools)
+        with self._lock:
+            self._entries[key] = entry
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return entry
+
+    @staticmethod
+    def _render(tools: list) -> tuple:
+        return (
+            [to_tool_calling_prompt(tool) for tool in tools],
+            [to_simple_tool_prompt(tool) for tool in tools],
+        )
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+
 def to_code_prompt(tool: dict) -> str:
     function = tool.get("function", {})
     name = function.get("name", "unknown")
@@ -0,0 +1,206 @@
+"""
+Exact-match cache for Outlier responses.
+
+Keys include the Outlier conversation id, so a hit is a prompt resent
+into the same conversation, e.g. a client retrying a turn after a
+timeout. Replaying a chat in a fresh conversation never hits: serving
+its turns from here would leave the new conversation without them.
+
+Entries live in a bounded in-memory LRU and, optionally, as one JSON file
+per key under data/cache so they survive restarts. Disk reads and writes
+run in a worker thread, off the event loop. Both tiers expire entries
+after their TTL. A background sweep, at most every
+sweep_interval_seconds, deletes expired files and then the oldest ones
+until the disk tier fits in max_disk_bytes.
+"""
+
+import asyncio
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Optional
+
+from app_log import get_log
+
+log = get_log("cache")
+
+
+class ResponseCache:
+    def __init__(
+        self,
+        folder: str = "data/cache",
+        max_entries: int = 512,
+        ttl_seconds: float = 3600,
+        disk_ttl_seconds: float = 24 * 3600,
+        disk_enabled: bool = True,
+        max_disk_bytes: int = 256 * 1024 * 1024,
+        sweep_interval_seconds: float = 300,
+    ):
+        self.folder = Path(folder)
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.disk_ttl_seconds = disk_ttl_seconds
+        self.disk_enabled = disk_enabled
+        self.max_disk_bytes = max_disk_bytes
+        self.sweep_interval_seconds = sweep_interval_seconds
+        self.disk_bytes = 0
+        self._last_sweep = 0.0
+        self._sweeping = False
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits_memory = 0
+        self.hits_disk = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions_disk = 0
+        if disk_enabled:
+            self._maybe_sweep(time.time())
+
+    @staticmethod
+    def make_key(model, prompt, system_message, conversation_id=None) -> str:
+        payload = json.dumps([model, conversation_id or "", system_message, prompt])
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _disk_path(self, key: str) -> Path:
+        return self.folder / key[:2] / f"{key}.json"
+
+    async def get(self, key: str) -> Optional[dict]:
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                created, value = entry
+                if now - created <= self.ttl_seconds:
+                    self._memory.move_to_end(key)
+                    self.hits_memory += 1
+                    return value
+                del self._memory[key]
+
+        value = None
+        if self.disk_enabled:
+            value = await asyncio.to_thread(self._read_disk, key, now)
+        with self._lock:
+            if value is None:
+                self.misses += 1
+                return None
+            self.hits_disk += 1
+            self._remember(key, now, value)
+        return value
+
+    async def put(self, key: str, value: dict):
+        now = time.time()
+        with self._lock:
+            self._remember(key, now, value)
+            self.stores += 1
+        if self.disk_enabled:
+            await asyncio.to_thread(self._write_disk, key, now, value)
+        self._maybe_sweep(now)
+
+    def _remember(self, key: str, created: float, value: dict):
+        self._memory[key] = (created, value)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def _read_disk(self, key: str, now: float) -> Optional[dict]:
+        if not self.disk_enabled:
+            return None
+        path = self._disk_path(key)
+        try:
+            entry = json.loads(path.read_text(encoding="utf-8"))
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            log.warning("Unreadable cache entry %s: %s", key, e)
+            return None
+        if now - entry.get("created", 0) > self.disk_ttl_seconds:
+            path.unlink(missing_ok=True)
+            return None
+        return entry.get("value")
+
+    def _write_disk(self, key: str, created: float, value: dict):
+        if not self.disk_enabled:
+            return
+        path = self._disk_path(key)
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = path.with_suffix(f".{os.getpid()}.tmp")
+            tmp_path.write_text(
+                json.dumps({"created": created, "value": value}), encoding="utf-8"
+            )
+            os.replace(tmp_path, path)
+        except Exception as e:
+            log.warning("Failed to persist cache entry: %s", e)
+
+    def _maybe_sweep(self, now: float):
+        if not self.disk_enabled:
+            return
+        with self._lock:
+            if self._sweeping or now - self._last_sweep < self.sweep_interval_seconds:
+                return
+            self._sweeping = True
+            self._last_sweep = now
+        threading.Thread(target=self._sweep_worker, daemon=True).start()
+
+    def _sweep_worker(self):
+        try:
+            self.sweep()
+        except Exception as e:
+            log.warning("Cache sweep failed: %s", e)
+        finally:
+            self._sweeping = False
+
+    def sweep(self):
+        """Delete expired disk entries, then the oldest until under the limit."""
+        cutoff = time.time() - self.disk_ttl_seconds
+        files = []
+        for path in self.folder.glob("*/*"):
+            try:
+                stat = path.stat()
+                if stat.st_mtime < cutoff:
+                    path.unlink()
+                    self.evictions_disk += 1
+                    continue
+            except OSError:
+                continue
+            files.append((stat.st_mtime, stat.st_size, path))
+        total = sum(size for _, size, _ in files)
+        if self.max_disk_bytes and total > self.max_disk_bytes:
+            files.sort()
+            for _, size, path in files:
+                if total <= self.max_disk_bytes:
+                    break
+                path.unlink(missing_ok=True)
+                self.evictions_disk += 1
+                total -= size
+        self.disk_bytes = total
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self._memory),
+                "hits_memory": self.hits_memory,
+                "hits_disk": self.hits_disk,
+                "misses": self.misses,
+                "stores": self.stores,
+                "disk_bytes": self.disk_bytes,
+                "evictions_disk": self.evictions_disk,
+            }
+
+
+def create_response_cache(base_folder: str = "data") -> Optional[ResponseCache]:
+    if os.getenv("oai_response_cache", "true").lower() != "true":
+        return None
+    return ResponseCache(
+        folder=str(Path(base_folder) / "cache"),
+        max_entries=int(os.getenv("oai_cache_max_entries", "512")),
+        ttl_seconds=float(os.getenv("oai_cache_ttl_seconds", "3600")),
+        disk_ttl_seconds=float(os.getenv("oai_cache_disk_ttl_seconds", "86400")),
+        disk_enabled=os.getenv("oai_cache_disk", "true").lower() == "true",
+        max_disk_bytes=int(os.getenv("oai_cache_disk_max_mb", "256")) * 1024 * 1024,
+        sweep_interval_seconds=float(os.getenv("oai_cache_sweep_seconds", "300")),
+    )
@@ -1,36 +1,250 @@
 import asyncio
 import websockets
 import json
+import os
 import sys
+import time
 import uuid
 
+import tracing
+from app_log import get_log, payload
+from metrics import GENERATION_SECONDS, RELAY_SECONDS, UPSTREAM_TTFB_SECONDS
 
-async def send_command(command, params):
-    import os
+log = get_log("relay")
+# Envelope headers are "@", a request id, a kind and a newline.
+ENVELOPE_HEADER_MAX = 128
 
-    wormhole_host = os.getenv("wormhole_server_host", "localhost")
-    wormhole_port = os.getenv("wormhole_port", "8765")
-    uri = f"ws://{wormhole_host}:{wormhole_port}"
-    request_id = str(uuid.uuid4())
-    try:
-        async with websockets.connect(uri) as websocket:
-            message = json.dumps(
-                {
-                    "type": "sender",
-                    "command": command,
-                    "params": params,
-                    "request_id": request_id,
-                }
-            )
+
+def parse_envelope(message):
+    """
+    Split an envelope frame, "@<request_id> <kind>\n<body>", into request id,
+    kind and body. Deltas carry the raw text as body, results a JSON object.
+    Returns None for plain JSON messages.
+    """
+    if not isinstance(message, str) or not message.startswith("@"):
+        return None
+    header_end = message.find("\n", 0, ENVELOPE_HEADER_MAX)
+    if header_end < 0:
+        return None
+    request_id, _, kind = message[1:header_end].partition(" ")
+    return request_id, kind, message[header_end + 1 :]
+
+
+class RelayConnection:
+    """
+    One long-lived sender socket to the relay. Requests are multiplexed over
+    it and matched to responses by request_id. When the reader stops, the
+    socket is closed and only the requests sent over it are failed.
+    """
+
+    def __init__(self, uri, unix_path=None, ping_interval=20.0, request_timeout=600.0):
+        self.uri = uri
+        self.unix_path = unix_path
+        self.ping_interval = ping_interval
+        self.request_timeout = request_timeout
+        self.websocket = None
+        self.pending = {}
+        self._reader_task = None
+        self._connect_lock = asyncio.Lock()
+
+    @property
+    def is_open(self):
+        return self.websocket is not None and self.websocket.open
+
+    async def connect(self):
+        async with self._connect_lock:
+            if self.is_open:
+                return
+            options = {
+                "ping_interval": self.ping_interval,
+                "ping_timeout": self.ping_interval,
+                "max_size": None,
+            }
+            if self.unix_path:
+                self.websocket = await websockets.unix_connect(
+                    self.unix_path, uri=self.uri, **options
+                )
+            else:
+                self.websocket = await websockets.connect(self.uri, **options)
+            self._reader_task = asyncio.create_task(self._reader(self.websocket))
+            log.info("Connected to relay: %s", self.unix_path or self.uri)
+
+    async def _reader(self, websocket):
+        try:
+            async for message in websocket:
+                envelope = parse_envelope(message)
+                if envelope is not None:
+                    request_id, kind, body = envelope
+                else:
+                    try:
+                        body = json.loads(message)
+                    except json.JSONDecodeError:
+                        log.warning("Ignoring non-JSON relay message")
+                        continue
+                    request_id, kind = body.get("request_id"), body.get("type")
+                entry = self.pending.get(request_id)
+                if entry is None:
+                    continue
+                future, on_delta, _ = entry
+                if kind == "delta":
+                    if on_delta:
+                        try:
+                            await on_delta(
+                                body if envelope else body.get("content", "")
+                            )
+                        except Exception as e:
+                            log.warning(
+                                "Delta callback failed, dropping request: %s", e
+                            )
+                            self.pending.pop(request_id, None)
+                            if not future.done():
+                                future.set_result({"success": False, "error": str(e)})
+                    continue
+                try:
+                    result = json.loads(body) if envelope else body
+                except json.JSONDecodeError:
+                    result = {"success": False, "error": "Malformed relay result"}
+                self.pending.pop(request_id, None)
+                result["trace"] = tracing.finish_trace(result)
+                if not future.done():
+                    future.set_result(result)
+        except websockets.exceptions.ConnectionClosed:
+            pass
+        finally:
+            if self.websocket is websocket:
+                self.websocket = None
+            owned = [
+                request_id
+                for request_id, (_, _, owner) in self.pending.items()
+                if owner is websocket
+            ]
+            log.info("Relay connection closed, %d pending", len(owned))
+            for request_id in owned:
+                future = self.pending.pop(request_id)[0]
+                if not future.done():
+                    future.set_result(
+                        {"success": False, "error": "Relay connection closed"}
+                    )
+            await websocket.close()
+
+    async def request(self, command, params, on_delta=None):
+        await self.connect()
+        websocket = self.websocket
+        request_id = str(uuid.uuid4())
+        future = asyncio.get_running_loop().create_future()
+        self.pending[request_id] = (future, on_delta, websocket)
+        message = json.dumps(
+            {
+                "type": "sender",
+                "command": command,
+                "params": params,
+                "request_id": request_id,
+                "trace": tracing.start_trace(),
+                "envelope": 1,
+            }
+        )
+        try:
             await websocket.send(message)
-            response = await websocket.recv()
-            result = json.loads(response)
-            return result
+            return await asyncio.wait_for(future, self.request_timeout)
+        except asyncio.TimeoutError:
+            return {
+                "success": False,
+                "error": f"Relay request timed out after {self.request_timeout:g}s",
+            }
+        finally:
+            self.pending.pop(request_id, None)
+
+
+class RelayPool:
+    """
+    A small set of RelayConnections. Each request goes to the connection
+    with the fewest requests in flight; closed connections reconnect on the
+    next request with exponential backoff.
+    """
+
+    def __init__(
+        self, uri, unix_path=None, size=2, ping_interval=20.0, request_timeout=600.0
+    ):
+        self.connections = [
+            RelayConnection(uri, unix_path, ping_interval, request_timeout)
+            for _ in range(size)
+        ]
+        self.max_backoff = 5.0
+        self._backoff = 0.0
+
+    def _pick(self):
+        return min(
+            self.connections,
+            key=lambda conn: (len(conn.pending), not conn.is_open),
+        )
+
+    async def request(self, command, params, on_delta=None):
+        connection = self._pick()
+        if not connection.is_open:
+            if self._backoff:
+                await asyncio.sleep(self._backoff)
+            try:
+                await connection.connect()
+                self._backoff = 0.0
+            except Exception:
+                self._backoff = min(self.max_backoff, max(0.1, self._backoff * 2))
+                raise
+        return await connection.request(command, params, on_delta)
+
+    async def close(self):
+        for connection in self.connections:
+            if connection.websocket is not None:
+                await connection.websocket.close()
+
+
+_pool = None
+_pool_loop = None
+
+
+def get_pool():
+    global _pool, _pool_loop
+    loop = asyncio.get_running_loop()
+    if _pool is None or _pool_loop is not loop:
+        wormhole_host = os.getenv("wormhole_server_host", "localhost")
+        wormhole_port = os.getenv("wormhole_port", "8765")
+        _pool = RelayPool(
+            f"ws://{wormhole_host}:{wormhole_port}",
+            unix_path=os.getenv("wormhole_unix_socket") or None,
+            size=int(os.getenv("wormhole_pool_size", "2")),
+            ping_interval=float(os.getenv("wormhole_ping_interval", "20")),
+            request_timeout=float(os.getenv("wormhole_request_timeout", "600")),
+        )
+        _pool_loop = loop
+    return _pool
+
+
+async def send_command(command, params, on_delta=None):
+    started = time.perf_counter()
+    first_delta = None
+
+    async def timed_delta(content):
+        nonlocal first_delta
+        if first_delta is None:
+            first_delta = time.perf_counter()
+            UPSTREAM_TTFB_SECONDS.labels(command).observe(first_delta - started)
+        await on_delta(content)
+
+    try:
+        result = await get_pool().request(
+            command, params, timed_delta if on_delta else None
+        )
+        tracing.record(result.get("trace"))
+        return result
     except Exception as e:
         return {"success": False, "error": str(e)}
+    finally:
+        finished = time.perf_counter()
+        RELAY_SECONDS.labels(command).observe(finished - started)
+        if first_delta is not None:
+            GENERATION_SECONDS.labels(command).observe(finished - first_delta)
 
 
-async def send_script_async(script_file, input_data=None):
+async def send_script_async(script_file, input_data=None, on_delta=None):
     try:
         if "create_conversation" in script_file:
             command = "createConversation"
@@ -40,9 +254,10 @@ async def send_script_async(script_file, input_data=None):
             params = input_data or {}
         else:
             return {"success": False, "error": f"Unknown script: {script_file}"}
-        print(f"[send.py] Sending command: {command}")
-        print(f"[send.py] Params: {json.dumps(params, indent=2)}")
-        result = await send_command(command, params)
+        if on_delta:
+            params = {**params, "stream": True}
+        log.debug("Sending %s: %s", command, payload(params))
+        result = await send_command(command, params, on_delta)
         return result
     except FileNotFoundError:
         return {"success": False, "error": f"File not found: {script_file}"}
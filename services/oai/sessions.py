@@ -0,0 +1,91 @@
+"""
+Per-client conversation sessions.
+
+A session is identified by a fingerprint of the start of the client's
+message history plus its API key, so every request of one chat maps to the
+same Outlier conversation while independent chats get their own.
+"""
+
+import asyncio
+import hashlib
+import json
+import time
+from collections import OrderedDict
+
+
+def message_text(content) -> str:
+    if isinstance(content, str):
+        return content
+    if isinstance(content, list):
+        return " ".join(
+            item.get("text", "")
+            for item in content
+            if isinstance(item, dict) and item.get("type") == "text"
+        )
+    return "" if content is None else str(content)
+
+
+def session_fingerprint(messages: list, api_key: str = "") -> str:
+    """
+    Hash everything up to and including the first user message. System
+    messages are skipped because clients often re-render them every turn
+    (dates, open files), while the opening user turn is replayed verbatim.
+    """
+    digest = hashlib.sha256(api_key.encode("utf-8"))
+    for msg in messages:
+        role = msg.get("role")
+        if role == "system":
+            continue
+        digest.update(
+            json.dumps([role, message_text(msg.get("content"))]).encode("utf-8")
+        )
+        if role == "user":
+            break
+    return digest.hexdigest()
+
+
+class Session:
+    def __init__(self, key: str):
+        self.key = key
+        self.conversation_id = None
+        self.step_number = 0
+        self.sent_blocks = {}
+        self.last_used = time.time()
+        self.lock = asyncio.Lock()
+
+    def reset(self):
+        self.conversation_id = None
+        self.step_number = 0
+        self.sent_blocks = {}
+
+
+class SessionStore:
+    def __init__(self, max_sessions: int = 1024, ttl_seconds: float = 6 * 3600):
+        self.max_sessions = max_sessions
+        self.ttl_seconds = ttl_seconds
+        self._sessions = OrderedDict()
+
+    def get(self, key: str, reset: bool = False) -> Session:
+        now = time.time()
+        session = self._sessions.get(key)
+        if session is None or now - session.last_used > self.ttl_seconds:
+            session = Session(key)
+            self._sessions[key] = session
+        elif reset:
+            session.reset()
+        session.last_used = now
+        self._sessions.move_to_end(key)
+        self._evict(now)
+        return session
+
+    def _evict(self, now: float):
+        while len(self._sessions) > self.max_sessions:
+            self._sessions.popitem(last=False)
+        while self._sessions:
+            key, oldest = next(iter(self._sessions.items()))
+            if now - oldest.last_used <= self.ttl_seconds:
+                break
+            del self._sessions[key]
+
+    def __len__(self):
+        return len(self._sessions)
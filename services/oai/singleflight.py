@@ -0,0 +1,122 @@
+"""
+Single-flight coalescing of identical in-flight completions.
+
+The first request for a key starts the upstream call; requests with the
+same key that arrive while it is running attach to it, replay the deltas
+streamed so far and then receive the rest live, and share its result.
+"""
+
+import asyncio
+import hashlib
+
+from app_log import get_log
+
+log = get_log("singleflight")
+
+
+def flight_key(body: bytes, *parts) -> str:
+    """
+    Key a request by its raw body plus the parts that come from elsewhere
+    (API key, cache opt-out). Retries resend the same bytes, and hashing
+    them is far cheaper than re-encoding the decoded history.
+    """
+    digest = hashlib.sha256(repr(parts).encode("utf-8"))
+    digest.update(b"\n")
+    digest.update(body)
+    return digest.hexdigest()
+
+
+class _Flight:
+    def __init__(self, streaming: bool):
+        # Deltas are kept for replay only while someone streams the flight.
+        self.streaming = streaming
+        self.deltas = []
+        self.subscribers = []
+        self.replaying = 0
+        self.task = None
+
+    async def broadcast(self, content):
+        if not self.streaming:
+            return
+        self.deltas.append(content)
+        for subscriber in list(self.subscribers):
+            await subscriber(content)
+
+    async def subscribe(self, on_delta):
+        self.replaying += 1
+        try:
+            replayed = 0
+            while replayed < len(self.deltas):
+                await on_delta(self.deltas[replayed])
+                replayed += 1
+            self.subscribers.append(on_delta)
+        finally:
+            self.replaying -= 1
+
+    def unsubscribe(self, on_delta):
+        if on_delta in self.subscribers:
+            self.subscribers.remove(on_delta)
+        if not self.subscribers and not self.replaying:
+            self.streaming = False
+            self.deltas = []
+
+
+class SingleFlight:
+    def __init__(self, enabled: bool = True):
+        self.enabled = enabled
+        self._flights = {}
+        self.leaders = 0
+        self.joined = 0
+
+    async def run(self, key, run_workflow, on_delta=None):
+        """
+        run_workflow(on_delta) is only invoked for the first caller of a
+        key. Streaming callers get a flight that streams upstream and fans
+        its deltas out to every attached streaming caller; non-streaming
+        callers can join either kind but only start non-streaming ones.
+        """
+        if not self.enabled or key is None:
+            return await run_workflow(on_delta)
+
+        streaming = on_delta is not None
+        flight = self._find(key, streaming)
+        if flight is None:
+            flight = _Flight(streaming)
+            slot = (key, streaming)
+            flight.task = asyncio.create_task(
+                run_workflow(flight.broadcast if streaming else None)
+            )
+            flight.task.add_done_callback(lambda _: self._forget(slot, flight))
+            self._flights[slot] = flight
+            self.leaders += 1
+        else:
+            self.joined += 1
+            log.info("Attached to in-flight request (%s)", key[:12])
+
+        if streaming:
+            await flight.subscribe(on_delta)
+        try:
+            return await asyncio.shield(flight.task)
+        finally:
+            if streaming:
+                flight.unsubscribe(on_delta)
+
+    def _find(self, key, streaming):
+        flight = self._flights.get((key, True))
+        if flight is not None and (flight.streaming or not streaming):
+            return flight
+        if streaming:
+            # A streaming flight everyone stopped streaming can't replay.
+            return None
+        return self._flights.get((key, False))
+
+    def _forget(self, slot, flight):
+        if self._flights.get(slot) is flight:
+            del self._flights[slot]
+
+    def stats(self) -> dict:
+        return {
+            "in_flight": len(self._flights),
+            "leaders": self.leaders,
+            "joined": self.joined,
+        }
@@ -0,0 +1,149 @@
+"""
+SSE chunk encoding for /v1/chat/completions streams.
+
+Completion chunks only differ in their delta, so the JSON envelope around
+the delta is serialized once per completion and every content chunk is a
+prefix + dumps(text) + suffix concatenation. ChunkBatcher groups the
+content into word or size bounded batches so a long answer becomes a few
+hundred writes instead of one per character.
+"""
+
+import os
+import time
+
+from codec import dumps
+
+_MARKER = "\x00delta\x00"
+
+
+class SSEEncoder:
+    def __init__(self, completion_id: str, created_time: int, model: str):
+        self.completion_id = completion_id
+        self.created_time = created_time
+        self.model = model
+        envelope = self._envelope(_MARKER, None)
+        prefix, suffix = envelope.split(dumps(_MARKER))
+        self._content_prefix = f'data: {prefix}{{"content": '
+        self._content_suffix = f"}}{suffix}\n\n"
+        self._role_chunk = f"data: {self._envelope({'role': 'assistant'}, None)}\n\n"
+
+    def _envelope(self, delta, finish_reason) -> str:
+        return dumps(
+            {
+                "id": self.completion_id,
+                "object": "chat.completion.chunk",
+                "created": self.created_time,
+                "model": self.model,
+                "system_fingerprint": None,
+                "choices": [
+                    {
+                        "index": 0,
+                        "delta": delta,
+                        "logprobs": None,
+                        "finish_reason": finish_reason,
+                    }
+                ],
+            }
+        )
+
+    def role(self) -> str:
+        return self._role_chunk
+
+    def content(self, text: str) -> str:
+        return self._content_prefix + dumps(text) + self._content_suffix
+
+    def tool_calls(self, tool_calls: list) -> str:
+        return f"data: {self._envelope({'tool_calls': tool_calls}, None)}\n\n"
+
+    def finish(self, finish_reason: str) -> str:
+        return f"data: {self._envelope({}, finish_reason)}\n\n"
+
+    def error(self, message: str, error_type: str = "server_error") -> str:
+        error = {"error": {"message": message, "type": error_type}}
+        return f"data: {dumps(error)}\n\n"
+
+    @staticmethod
+    def done() -> str:
+        return "data: [DONE]\n\n"
+
+
+class ChunkBatcher:
+    """
+    Groups streamed text into batches.
+
+    mode "char" reproduces the legacy one-chunk-per-character stream,
+    "size" cuts batches at max_chars and "word" cuts at the last whitespace
+    before max_chars. Text held for longer than flush_interval seconds is
+    released on the next push or by flush_due().
+    """
+
+    MODES = ("char", "word", "size")
+
+    def __init__(
+        self, mode: str = "word", max_chars: int = 64, flush_interval: float = 0.05
+    ):
+        if mode not in self.MODES:
+            raise ValueError(f"Unknown chunk mode: {mode}")
+        self.mode = mode
+        self.max_chars = max(1, max_chars)
+        self.flush_interval = flush_interval
+        self._buffer = ""
+        self._held_since = None
+
+    def split(self, text: str) -> list:
+        """Batch a complete text in one go."""
+        batches = self.push(text, now=None)
+        tail = self.flush()
+        if tail:
+            batches.append(tail)
+        return batches
+
+    def push(self, text: str, now=time.monotonic) -> list:
+        if not text:
+            return []
+        if self.mode == "char":
+            return list(text)
+
+        if not self._buffer:
+            self._held_since = now() if now else None
+        self._buffer += text
+
+        batches = []
+        while len(self._buffer) >= self.max_chars:
+            cut = self.max_chars
+            if self.mode == "word":
+                space = max(
+                    self._buffer.rfind(" ", 0, cut),
+                    self._buffer.rfind("\n", 0, cut),
+                )
+                if space > 0:
+                    cut = space + 1
+            batches.append(self._buffer[:cut])
+            self._buffer = self._buffer[cut:]
+
+        if self._buffer and now and self._held_since is not None:
+            if now() - self._held_since >= self.flush_interval:
+                batches.append(self.flush())
+        elif not self._buffer:
+            self._held_since = None
+        return batches
+
+    def time_until_flush(self):
+        """Seconds until held text is due, or None when nothing is held."""
+        if not self._buffer or self._held_since is None:
+            return None
+        return max(0.0, self._held_since + self.flush_interval - time.monotonic())
+
+    def flush(self) -> str:
+        batch = self._buffer
+        self._buffer = ""
+        self._held_since = None
+        return batch
+
+
+def get_chunk_config() -> dict:
+    return {
+        "mode": os.getenv("oai_sse_chunk_mode", "word"),
+        "max_chars": int(os.getenv("oai_sse_chunk_chars", "64")),
+        "flush_interval": int(os.getenv("oai_sse_flush_ms", "50")) / 1000,
+    }
@@ -0,0 +1,229 @@
+"""
+Push-based parser for the invoke / final_answer markup the agent prompts
+ask models to produce.
+
+Deltas are fed in as they arrive and each one is scanned once, so parsing a
+whole response stays linear in its size. Plain text is released as soon as
+it cannot be the start of a tag, tool calls are emitted when their
+</invoke> closes, and everything after a completed final answer is dropped.
+"""
+
+import json
+import re
+import uuid
+
+INVOKE_OPEN = '<invoke name="'
+INVOKE_CLOSE = "</invoke>"
+FINAL_OPEN = "<final_answer>"
+FINAL_CLOSE = "</final_answer>"
+PARAM_CLOSE = "</parameter>"
+ANSWER_OPEN = '<parameter name="answer">'
+FINAL_ANSWER_TOOL = "final_answer"
+
+_PARAM_RE = re.compile(r'<parameter name="([^"]+)">(.*?)</parameter>', re.DOTALL)
+_ANSWER_OPEN_RE = re.compile(r'\s*<parameter name="answer">')
+_OPENER_LENGTH = max(len(INVOKE_OPEN), len(FINAL_OPEN))
+
+TEXT = "text"
+INVOKE_NAME = "invoke_name"
+INVOKE_BODY = "invoke_body"
+ANSWER_START = "answer_start"
+ANSWER = "answer"
+FINAL_TAG = "final_tag"
+DONE = "done"
+
+
+def build_tool_call(tool_name: str, params_block: str) -> dict:
+    arguments = {name: value for name, value in _PARAM_RE.findall(params_block)}
+    return {
+        "id": f"call_{uuid.uuid4().hex[:24]}",
+        "type": "function",
+        "function": {"name": tool_name, "arguments": json.dumps(arguments)},
+    }
+
+
+class ToolCallStreamParser:
+    """
+    feed() and close() return lists of events:
+
+    ("text", str)       plain text outside of any markup
+    ("answer", str)     a piece of the final answer
+    ("tool_call", dict) an OpenAI tool call, once its </invoke> closes
+    """
+
+    def __init__(self):
+        self.state = TEXT
+        self.text_parts = []
+        self.answer_parts = None
+        self.tool_calls = []
+        self._buffer = ""
+        self._held = []
+        self._window = ""
+        self._scan_from = 0
+        self._tool_name = None
+
+    @property
+    def finished(self) -> bool:
+        return self.state == DONE
+
+    @property
+    def text(self) -> str:
+        return "".join(self.text_parts)
+
+    @property
+    def final_answer(self):
+        if self.answer_parts is None:
+            return None
+        return "".join(self.answer_parts)
+
+    def feed(self, delta: str) -> list:
+        if self.state == DONE or not delta:
+            return []
+        if self.state == INVOKE_BODY:
+            # Tool arguments can be large; hold them unjoined until a delta
+            # could complete the closing tag.
+            window = self._window + delta
+            if INVOKE_CLOSE not in window:
+                self._held.append(delta)
+                self._window = window[-(len(INVOKE_CLOSE) - 1) :]
+                return []
+        self._buffer += "".join(self._held) + delta
+        self._held = []
+        events = []
+        while self._step(events):
+            pass
+        return events
+
+    def close(self) -> list:
+        events = []
+        leftover = self._buffer + "".join(self._held)
+        self._buffer, self._held = "", []
+        if self.state == TEXT:
+            self._emit_text(events, leftover)
+        elif self.state == INVOKE_NAME:
+            self._emit_text(events, INVOKE_OPEN + leftover)
+        elif self.state == INVOKE_BODY:
+            if self._tool_name == FINAL_ANSWER_TOOL:
+                self._emit_answer(events, leftover)
+            else:
+                self._emit_text(events, f'{INVOKE_OPEN}{self._tool_name}">{leftover}')
+        elif self.state in (ANSWER_START, ANSWER, FINAL_TAG):
+            self._emit_answer(events, leftover)
+        self.state = DONE
+        return events
+
+    def _emit_text(self, events, text):
+        if text:
+            self.text_parts.append(text)
+            events.append(("text", text))
+
+    def _emit_answer(self, events, text):
+        if self.answer_parts is None:
+            self.answer_parts = []
+        if text:
+            self.answer_parts.append(text)
+            events.append(("answer", text))
+
+    def _step(self, events) -> bool:
+        """Advance the state machine once; False means more input is needed."""
+        buffer = self._buffer
+
+        if self.state == TEXT:
+            lowered = buffer.lower()
+            candidates = [
+                (index, opener)
+                for index, opener in (
+                    (buffer.find(INVOKE_OPEN), INVOKE_OPEN),
+                    (lowered.find(FINAL_OPEN), FINAL_OPEN),
+                )
+                if index >= 0
+            ]
+            if not candidates:
+                keep = len(buffer)
+                tag_start = buffer.rfind("<", max(0, len(buffer) - _OPENER_LENGTH))
+                if tag_start >= 0 and (
+                    INVOKE_OPEN.startswith(buffer[tag_start:])
+                    or FINAL_OPEN.startswith(lowered[tag_start:])
+                ):
+                    keep = tag_start
+                self._emit_text(events, buffer[:keep])
+                self._buffer = buffer[keep:]
+                return False
+            index, opener = min(candidates)
+            self._emit_text(events, buffer[:index])
+            self._buffer = buffer[index + len(opener) :]
+            self.state = INVOKE_NAME if opener == INVOKE_OPEN else FINAL_TAG
+            return True
+
+        if self.state == INVOKE_NAME:
+            quote = buffer.find('"')
+            if quote < 0 or quote + 1 >= len(buffer):
+                return False
+            if quote == 0 or buffer[quote + 1] != ">":
+                self._emit_text(events, INVOKE_OPEN)
+                self.state = TEXT
+                return True
+            self._tool_name = buffer[:quote]
+            self._buffer = buffer[quote + 2 :]
+            self._scan_from = 0
+            if self._tool_name == FINAL_ANSWER_TOOL:
+                self.state = ANSWER_START
+            else:
+                self.state = INVOKE_BODY
+            return True
+
+        if self.state == INVOKE_BODY:
+            end = buffer.find(INVOKE_CLOSE, self._scan_from)
+            if end < 0:
+                self._scan_from = max(0, len(buffer) - len(INVOKE_CLOSE) + 1)
+                self._window = buffer[self._scan_from :]
+                return False
+            body = buffer[:end]
+            self._buffer = buffer[end + len(INVOKE_CLOSE) :]
+            self._scan_from = 0
+            if self._tool_name == FINAL_ANSWER_TOOL:
+                match = _PARAM_RE.search(body)
+                self._emit_answer(events, match.group(2) if match else body)
+                self.state = DONE
+                self._buffer = ""
+                return False
+            tool_call = build_tool_call(self._tool_name, body)
+            self.tool_calls.append(tool_call)
+            events.append(("tool_call", tool_call))
+            self.state = TEXT
+            return True
+
+        if self.state == ANSWER_START:
+            match = _ANSWER_OPEN_RE.match(buffer)
+            if match:
+                self._buffer = buffer[match.end() :]
+                self.state = ANSWER
+                return True
+            if ANSWER_OPEN.startswith(buffer.lstrip()):
+                return False
+            self.state = INVOKE_BODY
+            return True
+
+        if self.state in (ANSWER, FINAL_TAG):
+            closer = PARAM_CLOSE if self.state == ANSWER else FINAL_CLOSE
+            haystack = buffer if self.state == ANSWER else buffer.lower()
+            end = haystack.find(closer)
+            if end >= 0:
+                self._emit_answer(events, buffer[:end])
+                self._buffer = ""
+                self.state = DONE
+                return False
+            keep = max(0, len(buffer) - len(closer) + 1)
+            self._emit_answer(events, buffer[:keep])
+            self._buffer = buffer[keep:]
+            return False
+
+        self._buffer = ""
+        return False
+
+
+def parse_response(response_text: str) -> ToolCallStreamParser:
+    parser = ToolCallStreamParser()
+    parser.feed(response_text)
+    parser.close()
+    return parser
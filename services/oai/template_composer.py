@@ -1,12 +1,70 @@
+import hashlib
+import os
+import re
 import yaml
 from pathlib import Path
+from app_log import get_log
 from prompt_utils import (
+    ToolPromptCache,
+    compile_template,
     populate_template,
-    to_tool_calling_prompt,
+    read_text_cached,
+    template_variables,
     to_code_prompt,
-    to_simple_tool_prompt,
 )
 
+log = get_log("templates")
+
+_PLACEHOLDER_RE = re.compile(r"\{\{(\w+)\}\}")
+
+DELTA_BLOCKS = (
+    "tools",
+    "simple_tools",
+    "custom_instructions",
+    "rules",
+    "attachments",
+    "context",
+)
+UNCHANGED_MARKER = "[{name} unchanged since earlier in this conversation]"
+
+
+class PromptDelta:
+    """
+    Replaces prompt blocks the Outlier conversation has already received
+    with a short marker. sent_blocks maps block names to the hash of what
+    was last sent; hashes of blocks sent in full are only recorded by
+    commit(), once the prompt has actually been delivered.
+    """
+
+    def __init__(self, sent_blocks: dict, enabled: bool = True):
+        self.sent_blocks = sent_blocks
+        self.enabled = enabled
+        self.pending = {}
+        self.elided_chars = 0
+
+    def apply(self, template: str, variables: dict) -> dict:
+        if not self.enabled:
+            return variables
+        used = template_variables(template)
+        variables = dict(variables)
+        for name in DELTA_BLOCKS:
+            value = variables.get(name) if name in used else None
+            if not value:
+                continue
+            text = "\n".join(value) if isinstance(value, list) else str(value)
+            digest = hashlib.sha1(text.encode("utf-8")).hexdigest()
+            if self.sent_blocks.get(name) == digest:
+                marker = UNCHANGED_MARKER.format(name=name.replace("_", " "))
+                variables[name] = [marker] if isinstance(value, list) else marker
+                self.elided_chars += len(text)
+            else:
+                self.pending[name] = digest
+        return variables
+
+    def commit(self):
+        self.sent_blocks.update(self.pending)
+        self.pending = {}
+
 
 class TemplateComposer:
     def __init__(
@@ -14,23 +72,40 @@ class TemplateComposer:
     ):
         self.templates_dir = Path(templates_dir)
         self.prompts_file = Path(prompts_file)
-        self._system_cache = None
-        self.prompt_templates = self._load_prompts()
+        self._prompts_source = None
+        self._prompt_templates = {}
+        self.tool_prompts = ToolPromptCache(
+            max_entries=int(os.getenv("oai_tool_prompt_cache_size", "64"))
+        )
 
-    def _load_prompts(self):
-        if self.prompts_file.exists():
-            with open(self.prompts_file, "r", encoding="utf-8") as f:
-                return yaml.safe_load(f)
-        return {}
+    @property
+    def prompt_templates(self):
+        source = read_text_cached(self.prompts_file)
+        if source is None:
+            return {}
+        if source is not self._prompts_source:
+            self._prompt_templates = yaml.safe_load(source) or {}
+            self._prompts_source = source
+        return self._prompt_templates
 
     def get_system(self):
-        if self._system_cache is None:
-            system_path = self.templates_dir / "system.mdx"
-            if system_path.exists():
-                self._system_cache = system_path.read_text(encoding="utf-8")
-            else:
-                self._system_cache = "You are a helpful assistant."
-        return self._system_cache
+        return read_text_cached(
+            self.templates_dir / "system.mdx", "You are a helpful assistant."
+        )
+
+    def get_rules(self):
+        return read_text_cached(self.templates_dir / "rules.mdx", "")
+
+    def warm_up(self):
+        """Load template files and compile every prompt template up front."""
+        self.get_system()
+        self.get_rules()
+        compiled = 0
+        for template in self.prompt_templates.values():
+            if isinstance(template, str):
+                compile_template(template)
+                compiled += 1
+        log.info("Warmed up %d prompt templates", compiled)
 
     def initialize_system_prompt(
         self,
@@ -42,13 +117,9 @@ class TemplateComposer:
         context=None,
         user_request=None,
         is_first=False,
+        delta=None,
     ):
-        tools_list = []
-        simple_tools_list = []
-        if tools:
-            for tool in tools:
-                tools_list.append(to_tool_calling_prompt(tool))
-                simple_tools_list.append(to_simple_tool_prompt(tool))
+        tools_list, simple_tools_list = self.tool_prompts.render(tools)
         variables = {
             "system_content": self.get_system(),
             "tools": tools_list,
@@ -62,18 +133,20 @@ class TemplateComposer:
         }
         template_key = "first_system_prompt" if is_first else "system_prompt"
         system_prompt_template = self.prompt_templates.get(template_key, "")
+        if delta:
+            variables = delta.apply(system_prompt_template, variables)
         return populate_template(system_prompt_template, variables)
 
-    def compose_tool_response(self, tool_output, context=None):
+    def compose_tool_response(self, tool_output, context=None, delta=None):
         template = self.prompt_templates.get("tool_response", "{{tool_output}}")
-        return populate_template(
-            template,
-            {
-                "system_content": self.get_system(),
-                "tool_output": tool_output,
-                "context": context or "",
-            },
-        )
+        variables = {
+            "system_content": self.get_system(),
+            "tool_output": tool_output,
+            "context": context or "",
+        }
+        if delta:
+            variables = delta.apply(template, variables)
+        return populate_template(template, variables)
 
     def compose_simple_user(
         self,
@@ -82,6 +155,7 @@ class TemplateComposer:
         context=None,
         user_request=None,
         is_first=False,
+        delta=None,
     ):
         template_key = "first_simple_user" if is_first else "simple_user"
         template = self.prompt_templates.get(template_key, "{{user_request}}")
@@ -91,21 +165,17 @@ class TemplateComposer:
             "context": context or "",
             "user_request": user_request or "",
         }
+        if delta:
+            variables = delta.apply(template, variables)
         return populate_template(template, variables)
 
     def compose(self, template_name: str, **variables):
-        template_path = self.templates_dir / f"{template_name}.mdx"
-        if template_path.exists():
-            template_content = template_path.read_text(encoding="utf-8")
-            result = template_content
-            for key, value in variables.items():
-                placeholder = f"{{{{{key}}}}}"
-                result = result.replace(placeholder, str(value) if value else "")
-            import re
-
-            for remaining_key in re.findall(r"\{\{(\w+)\}\}", result):
-                result = result.replace(f"{{{{{remaining_key}}}}}", "")
-            return result
+        template_content = read_text_cached(self.templates_dir / f"{template_name}.mdx")
+        if template_content is not None:
+            return _PLACEHOLDER_RE.sub(
+                lambda match: str(variables.get(match.group(1)) or ""),
+                template_content,
+            )
         if template_name in self.prompt_templates:
             return populate_template(self.prompt_templates[template_name], variables)
         raise ValueError(f"Template not found: {template_name}")
@@ -0,0 +1,93 @@
+"""
+Per-hop timing for relay commands.
+
+send.py starts a trace on each command it sends: a dict of wall-clock
+marks in epoch milliseconds, carried in the message's "trace" field. The
+relay and the page add their own marks as the command passes through and
+the page returns the trace with its result. Hops that forward messages
+without decoding them (the browser proxy, and the relay on the way back)
+add a top-level "trace_<mark>" key instead, folded in here on arrival.
+
+The marks of a completed trace become spans between consecutive hops,
+reported in the Server-Timing header and stored with the conversation log.
+"""
+
+import time
+from contextvars import ContextVar
+
+# Marks in the order a command passes them; missing hops are skipped.
+MARKS = (
+    "oai_send",
+    "relay_in",
+    "relay_out",
+    "proxy_down",
+    "page_in",
+    "fetch_start",
+    "fetch_ttfb",
+    "fetch_end",
+    "page_out",
+    "proxy_up",
+    "relay_result",
+    "oai_recv",
+)
+_PREFIX = "trace_"
+
+_collected = ContextVar("wormhole_traces", default=None)
+
+
+def now_ms() -> float:
+    return time.time() * 1000
+
+
+def start_trace() -> dict:
+    return {"oai_send": now_ms()}
+
+
+def finish_trace(result: dict) -> dict:
+    trace = result.get("trace")
+    trace = dict(trace) if isinstance(trace, dict) else {}
+    for key in [key for key in result if key.startswith(_PREFIX)]:
+        trace[key[len(_PREFIX) :]] = result.pop(key)
+    trace["oai_recv"] = now_ms()
+    return trace
+
+
+def collect(traces: list):
+    """Route traces finished in this context (and tasks it starts) to traces."""
+    _collected.set(traces)
+
+
+def record(trace):
+    traces = _collected.get()
+    if traces is not None and trace:
+        traces.append(trace)
+
+
+def spans(trace) -> dict:
+    """Milliseconds between consecutive marks, named "<from>-<to>"."""
+    if not trace:
+        return {}
+    present = [(name, trace[name]) for name in MARKS if name in trace]
+    return {
+        f"{start}-{end}": round(end_ms - start_ms, 1)
+        for (start, start_ms), (end, end_ms) in zip(present, present[1:])
+    }
+
+
+def summarize(traces: list, total_ms: float = None) -> dict:
+    """Sum the spans of every trace of a request; "app" is the rest of total_ms."""
+    summary = {}
+    relay_ms = 0.0
+    for trace in traces:
+        for name, duration in spans(trace).items():
+            summary[name] = round(summary.get(name, 0.0) + duration, 1)
+        if "oai_send" in trace and "oai_recv" in trace:
+            relay_ms += trace["oai_recv"] - trace["oai_send"]
+    if total_ms is not None:
+        summary["app"] = round(max(0.0, total_ms - relay_ms), 1)
+        summary["total"] = round(total_ms, 1)
+    return summary
+
+
+def server_timing(summary: dict) -> str:
+    return ", ".join(f"{name};dur={duration}" for name, duration in summary.items())
@@ -1,34 +1,51 @@
 from fastapi import FastAPI, Request
-from fastapi.responses import StreamingResponse, JSONResponse
-import json
+from fastapi.responses import Response, StreamingResponse, JSONResponse
+import asyncio
+import logging
 import time
 import uuid
 import os
-import re
+import sqlite3
 from pathlib import Path
 from template_composer import TemplateComposer
 from logger import get_logger, dump_raw_prompts
+from prompt_utils import scan_messages
+from log_index import index_path, query_turns
 from agent_workflow import AgentWorkflow
+from sse_chunker import SSEEncoder, ChunkBatcher, get_chunk_config
+from sessions import SessionStore, session_fingerprint
+from response_cache import create_response_cache
+from singleflight import SingleFlight, flight_key
+from stream_parser import ToolCallStreamParser
+from app_log import elapsed_ms, get_log, new_request_id
+import codec
+import metrics
+import tracing
 
 app = FastAPI()
 
 REQUIRED_API_KEY = os.getenv("OAI_API_KEY")
+UPSTREAM_STREAMING = os.getenv("oai_upstream_streaming", "true").lower() == "true"
+CHUNK_CONFIG = get_chunk_config()
+SSE_TIMING_COMMENT = os.getenv("oai_sse_timing_comment", "false").lower() == "true"
+
+log_request = get_log("request")
+log_auth = get_log("auth")
+log_chat = get_log("chat")
 
 
 @app.middleware("http")
 async def authenticate_and_log(request: Request, call_next):
+    started = time.perf_counter()
+    request_id = new_request_id(request.headers.get("x-request-id"))
     auth_header = request.headers.get("authorization", "")
 
     if request.url.path in ["/api/version", "/v1/models"]:
-        print(
-            f"[Request] {request.method} {request.url.path} | Auth: Skipped (public endpoint)"
-        )
         response = await call_next(request)
-        print(f"[Response] Status: {response.status_code}")
-        return response
+        return logged(request, response, started, request_id, "public")
 
     if not auth_header.startswith("Bearer "):
-        print(f"[Auth] Missing or invalid authorization header")
+        log_auth.warning("Missing or invalid authorization header")
         return JSONResponse(
             status_code=401,
             content={
@@ -42,7 +59,7 @@ async def authenticate_and_log(request: Request, call_next):
     provided_key = auth_header.replace("Bearer ", "")
 
     if not REQUIRED_API_KEY:
-        print(f"[Auth] WARNING: No API key configured (OAI_API_KEY not set)")
+        log_auth.error("No API key configured (OAI_API_KEY not set)")
         return JSONResponse(
             status_code=500,
             content={
@@ -54,7 +71,7 @@ async def authenticate_and_log(request: Request, call_next):
         )
 
     if provided_key != REQUIRED_API_KEY:
-        print(f"[Auth] Invalid API key attempt: {provided_key[:10]}...")
+        log_auth.warning("Invalid API key attempt: %s...", provided_key[:10])
         return JSONResponse(
             status_code=403,
             content={
@@ -62,30 +79,99 @@ async def authenticate_and_log(request: Request, call_next):
             },
         )
 
-    print(f"[Request] {request.method} {request.url.path} | Auth: Valid")
     response = await call_next(request)
-    print(f"[Response] Status: {response.status_code}")
+    return logged(request, response, started, request_id, "valid")
+
+
+def logged(request, response, started, request_id, auth):
+    response.headers["X-Request-ID"] = request_id
+    log_request.info(
+        "%s %s %s auth=%s %sms",
+        request.method,
+        request.url.path,
+        response.status_code,
+        auth,
+        elapsed_ms(started),
+    )
+    return response
+
+
+METRIC_PATHS = {
+    "/v1/chat/completions",
+    "/chat/completions",
+    "/v1/models",
+    "/api/version",
+    "/api/show",
+    "/v1/logs/turns",
+    "/metrics",
+}
+
+
+def metric_model(model) -> str:
+    """Model label for metrics; unlisted names share one series."""
+    if not model:
+        return ""
+    return model if model in MODEL_IDS else "other"
+
+
+@app.middleware("http")
+async def record_metrics(request: Request, call_next):
+    path = request.url.path if request.url.path in METRIC_PATHS else "other"
+    started = time.perf_counter()
+    metrics.IN_FLIGHT.inc()
+
+    def finish(status):
+        metrics.IN_FLIGHT.dec()
+        metrics.REQUEST_SECONDS.labels(path).observe(time.perf_counter() - started)
+        model = metric_model(getattr(request.state, "model", None))
+        metrics.REQUESTS.labels(path, model, str(status)).inc()
+
+    try:
+        response = await call_next(request)
+    except Exception:
+        finish(500)
+        raise
+
+    # Streamed bodies outlive call_next, so finish once the body is sent.
+    body_iterator = response.body_iterator
+
+    async def tracked_body():
+        try:
+            async for chunk in body_iterator:
+                yield chunk
+        finally:
+            finish(response.status_code)
+
+    response.body_iterator = tracked_body()
     return response
 
 
-active_conversation_id = None
 composer = TemplateComposer()
 DATA_FOLDER = Path("data")
 DATA_FOLDER.mkdir(exist_ok=True)
 conversation_logs = {}
+sessions = SessionStore(
+    max_sessions=int(os.getenv("oai_max_sessions", "1024")),
+    ttl_seconds=float(os.getenv("oai_session_ttl_seconds", str(6 * 3600))),
+)
 agent_workflow = AgentWorkflow(
-    lambda: active_conversation_id,
-    lambda cid: set_active_conversation(cid),
-    lambda cid, p, s, r: log_to_data_folder(cid, p, s, r),
+    lambda *args, **kwargs: log_to_data_folder(*args, **kwargs),
+    response_cache=create_response_cache(str(DATA_FOLDER)),
 )
-
-
-def set_active_conversation(conversation_id):
-    global active_conversation_id
-    active_conversation_id = conversation_id
-
-
-def log_to_data_folder(conversation_id, prompt, system_message, response):
+agent_workflow.composer.warm_up()
+metrics.LOGGER_QUEUE_DEPTH.set_function(lambda: get_logger().queue.qsize())
+flights = SingleFlight(enabled=os.getenv("oai_single_flight", "true").lower() == "true")
+
+
+def log_to_data_folder(
+    conversation_id,
+    prompt,
+    system_message,
+    response,
+    model=None,
+    latency=None,
+    timing=None,
+):
     try:
         timestamp = int(time.time())
         if conversation_id not in conversation_logs:
@@ -99,11 +185,126 @@ def log_to_data_folder(conversation_id, prompt, system_message, response):
 
         logger = get_logger()
         logger.log_conversation(
-            conversation_id, index, system_message, prompt, response
+            conversation_id,
+            index,
+            system_message,
+            prompt,
+            response,
+            model,
+            latency,
+            timing,
         )
 
     except Exception as e:
-        print(f"[log_to_data_folder] CRITICAL: Failed to queue log: {e}")
+        log_chat.error("Failed to queue conversation log: %s", e)
+
+
+def cache_opt_out(request: Request) -> bool:
+    cache_control = request.headers.get("cache-control", "").lower()
+    return (
+        "no-cache" in cache_control
+        or "no-store" in cache_control
+        or request.headers.get("x-wormhole-cache", "").lower() == "bypass"
+    )
+
+
+def timing_comment(traces, started) -> str:
+    summary = tracing.summarize(traces, (time.perf_counter() - started) * 1000)
+    return f": server-timing {tracing.server_timing(summary)}\n\n"
+
+
+def stream_upstream_completion(
+    model,
+    run_workflow,
+    parse_tools=False,
+    error_message="Failed to get response from Outlier",
+    traces=None,
+    started=None,
+):
+    completion_id = f"chatcmpl-{uuid.uuid4().hex[:29]}"
+    encoder = SSEEncoder(completion_id, int(time.time()), model)
+    batcher = ChunkBatcher(**CHUNK_CONFIG)
+    deltas = asyncio.Queue()
+
+    async def on_delta(content):
+        await deltas.put(content)
+
+    async def run():
+        if traces is not None:
+            tracing.collect(traces)
+        try:
+            return await run_workflow(on_delta)
+        finally:
+            await deltas.put(None)
+
+    async def generate():
+        task = asyncio.create_task(run())
+        parser = ToolCallStreamParser() if parse_tools else None
+        sent_tool_calls = []
+
+        def render(events):
+            chunks = []
+            for kind, value in events:
+                if kind != "tool_call":
+                    chunks.extend(encoder.content(b) for b in batcher.push(value))
+                    continue
+                tail = batcher.flush()
+                if tail:
+                    chunks.append(encoder.content(tail))
+                chunks.append(
+                    encoder.tool_calls([{"index": len(sent_tool_calls), **value}])
+                )
+                sent_tool_calls.append(value)
+            return chunks
+
+        yield encoder.role()
+        streamed = False
+        while True:
+            try:
+                content = await asyncio.wait_for(
+                    deltas.get(), batcher.time_until_flush()
+                )
+            except asyncio.TimeoutError:
+                yield encoder.content(batcher.flush())
+                continue
+            if content is None:
+                break
+            if content:
+                streamed = True
+                events = parser.feed(content) if parser else [("text", content)]
+                for chunk in render(events):
+                    yield chunk
+        if parser:
+            for chunk in render(parser.close()):
+                yield chunk
+        tail = batcher.flush()
+        if tail:
+            yield encoder.content(tail)
+
+        clean_text, tool_calls, conversation_id = await task
+        if conversation_id is None:
+            yield encoder.error(error_message)
+            yield encoder.done()
+            return
+
+        if not streamed:
+            if tool_calls:
+                for tool_call in tool_calls:
+                    yield encoder.tool_calls(
+                        [{"index": len(sent_tool_calls), **tool_call}]
+                    )
+                    sent_tool_calls.append(tool_call)
+            elif clean_text:
+                for batch in batcher.split(clean_text):
+                    yield encoder.content(batch)
+        if sent_tool_calls:
+            metrics.TOOL_CALLS.labels(metric_model(model)).inc(len(sent_tool_calls))
+        yield encoder.finish("tool_calls" if sent_tool_calls else "stop")
+        if SSE_TIMING_COMMENT and traces is not None:
+            yield timing_comment(traces, started)
+        yield encoder.done()
+
+    return StreamingResponse(generate(), media_type="text/event-stream")
 
 
 @app.get("/api/version")
@@ -115,7 +316,7 @@ async def api_version():
 async def ollama_show(request: Request):
     body = await request.json()
     model_name = body.get("name", "")
-    print(f"Received /api/show request for model: {model_name}")
+    log_request.debug("/api/show for model %s", model_name)
     return {
         "modelfile": f"# Modelfile for {model_name}",
         "parameters": "",
@@ -130,143 +331,187 @@ async def ollama_show(request: Request):
     }
 
 
+@app.get("/metrics")
+def prometheus_metrics():
+    metrics.sync_logger_dropped(get_logger().dropped)
+    body, content_type = metrics.render()
+    return Response(content=body, media_type=content_type)
+
+
+@app.get("/v1/logs/turns")
+def log_turns(
+    conversation_id: str = None,
+    model: str = None,
+    since: float = None,
+    until: float = None,
+    q: str = None,
+    limit: int = 100,
+):
+    try:
+        turns = query_turns(
+            index_path(str(DATA_FOLDER)),
+            conversation_id=conversation_id,
+            model=model,
+            since=since,
+            until=until,
+            text=q,
+            limit=max(1, min(limit, 1000)),
+        )
+    except sqlite3.OperationalError as e:
+        return JSONResponse(
+            status_code=400,
+            content={"error": {"message": str(e), "type": "invalid_request_error"}},
+        )
+    return {"object": "list", "data": turns}
+
+
 @app.post("/chat/completions")
 async def ollama_chat(request: Request):
     return await chat_completions(request)
 
 
+MODELS = [
+    {
+        "id": "gpt-5-chat",
+        "object": "model",
+        "created": 1730419200,
+        "owned_by": "openai",
+    },
+    {
+        "id": "gpt-5-2025-08-07",
+        "object": "model",
+        "created": 1730419200,
+        "owned_by": "openai",
+    },
+    {
+        "id": "GPT-4o",
+        "object": "model",
+        "created": 1715367600,
+        "owned_by": "openai",
+    },
+    {
+        "id": "gpt-4o-audio-preview-2025-06-03",
+        "object": "model",
+        "created": 1730419200,
+        "owned_by": "openai",
+    },
+    {
+        "id": "gpt-4o-mini-audio-preview-2024-12-17",
+        "object": "model",
+        "created": 1730419200,
+        "owned_by": "openai",
+    },
+    {
+        "id": "GPT-4.1",
+        "object": "model",
+        "created": 1715367600,
+        "owned_by": "openai",
+    },
+    {
+        "id": "o3",
+        "object": "model",
+        "created": 1730419200,
+        "owned_by": "openai",
+    },
+    {
+        "id": "o4-mini",
+        "object": "model",
+        "created": 1730419200,
+        "owned_by": "openai",
+    },
+    {
+        "id": "claude-sonnet-4-5-20250929",
+        "object": "model",
+        "created": 1730419200,
+        "owned_by": "anthropic",
+    },
+    {
+        "id": "claude-haiku-4-5-20251001",
+        "object": "model",
+        "created": 1730419200,
+        "owned_by": "anthropic",
+    },
+    {
+        "id": "claude-opus-4-1-20250805",
+        "object": "model",
+        "created": 1730419200,
+        "owned_by": "anthropic",
+    },
+    {
+        "id": "claude-opus-4-20250514",
+        "object": "model",
+        "created": 1730419200,
+        "owned_by": "anthropic",
+    },
+    {
+        "id": "claude-sonnet-4-20250514",
+        "object": "model",
+        "created": 1730419200,
+        "owned_by": "anthropic",
+    },
+    {
+        "id": "gemini-2.5-pro-preview-06-05",
+        "object": "model",
+        "created": 1730419200,
+        "owned_by": "google",
+    },
+    {
+        "id": "gemini-2.5-flash-preview-05-20",
+        "object": "model",
+        "created": 1730419200,
+        "owned_by": "google",
+    },
+    {
+        "id": "Grok 3",
+        "object": "model",
+        "created": 1730419200,
+        "owned_by": "xai",
+    },
+    {
+        "id": "Llama 4 Maverick",
+        "object": "model",
+        "created": 1730419200,
+        "owned_by": "meta",
+    },
+    {
+        "id": "qwen3-235b-a22b-2507-v1",
+        "object": "model",
+        "created": 1730419200,
+        "owned_by": "alibaba",
+    },
+    {
+        "id": "deepseek-r1-0528",
+        "object": "model",
+        "created": 1730419200,
+        "owned_by": "deepseek",
+    },
+]
+MODEL_IDS = frozenset(model["id"] for model in MODELS)
+
+
 @app.get("/v1/models")
 async def list_models():
-    print(f"Received /v1/models request")
-    return {
-        "object": "list",
-        "data": [
-            {
-                "id": "gpt-5-chat",
-                "object": "model",
-                "created": 1730419200,
-                "owned_by": "openai",
-            },
-            {
-                "id": "gpt-5-2025-08-07",
-                "object": "model",
-                "created": 1730419200,
-                "owned_by": "openai",
-            },
-            {
-                "id": "GPT-4o",
-                "object": "model",
-                "created": 1715367600,
-                "owned_by": "openai",
-            },
-            {
-                "id": "gpt-4o-audio-preview-2025-06-03",
-                "object": "model",
-                "created": 1730419200,
-                "owned_by": "openai",
-            },
-            {
-                "id": "gpt-4o-mini-audio-preview-2024-12-17",
-                "object": "model",
-                "created": 1730419200,
-                "owned_by": "openai",
-            },
-            {
-                "id": "GPT-4.1",
-                "object": "model",
-                "created": 1715367600,
-                "owned_by": "openai",
-            },
-            {
-                "id": "o3",
-                "object": "model",
-                "created": 1730419200,
-                "owned_by": "openai",
-            },
-            {
-                "id": "o4-mini",
-                "object": "model",
-                "created": 1730419200,
-                "owned_by": "openai",
-            },
-            {
-                "id": "claude-sonnet-4-5-20250929",
-                "object": "model",
-                "created": 1730419200,
-                "owned_by": "anthropic",
-            },
-            {
-                "id": "claude-haiku-4-5-20251001",
-                "object": "model",
-                "created": 1730419200,
-                "owned_by": "anthropic",
-            },
-            {
-                "id": "claude-opus-4-1-20250805",
-                "object": "model",
-                "created": 1730419200,
-                "owned_by": "anthropic",
-            },
-            {
-                "id": "claude-opus-4-20250514",
-                "object": "model",
-                "created": 1730419200,
-                "owned_by": "anthropic",
-            },
-            {
-                "id": "claude-sonnet-4-20250514",
-                "object": "model",
-                "created": 1730419200,
-                "owned_by": "anthropic",
-            },
-            {
-                "id": "gemini-2.5-pro-preview-06-05",
-                "object": "model",
-                "created": 1730419200,
-                "owned_by": "google",
-            },
-            {
-                "id": "gemini-2.5-flash-preview-05-20",
-                "object": "model",
-                "created": 1730419200,
-                "owned_by": "google",
-            },
-            {
-                "id": "Grok 3",
-                "object": "model",
-                "created": 1730419200,
-                "owned_by": "xai",
-            },
-            {
-                "id": "Llama 4 Maverick",
-                "object": "model",
-                "created": 1730419200,
-                "owned_by": "meta",
-            },
-            {
-                "id": "qwen3-235b-a22b-2507-v1",
-                "object": "model",
-                "created": 1730419200,
-                "owned_by": "alibaba",
-            },
-            {
-                "id": "deepseek-r1-0528",
-                "object": "model",
-                "created": 1730419200,
-                "owned_by": "deepseek",
-            },
-        ],
-    }
+    return {"object": "list", "data": MODELS}
 
 
 @app.post("/v1/chat/completions")
 async def chat_completions(request: Request):
-    body = await request.json()
-    print(f"Received /v1/chat/completions request")
-    print(f"Model: {body.get('model')}")
-    print(f"Stream: {body.get('stream')}")
-    print(f"Tools: {len(body.get('tools', []))} tools")
+    started = time.perf_counter()
+    traces = []
+    try:
+        body = await codec.read_chat_request(request)
+    except codec.DecodeError as e:
+        return JSONResponse(
+            status_code=400,
+            content={
+                "error": {
+                    "message": f"Invalid request body: {e}",
+                    "type": "invalid_request_error",
+                }
+            },
+        )
     model = body.get("model")
+    request.state.model = model
 
     if not model:
         return {
@@ -277,104 +522,54 @@ async def chat_completions(request: Request):
             }
         }, 400
 
-    messages = body.get("messages", [])
-    stream = body.get("stream", False)
-    tools = body.get("tools", [])
-    tool_choice = body.get("tool_choice", "auto")
-
-    print(f"Message roles in request: {[msg.get('role') for msg in messages]}")
-
-    raw_system = ""
-    raw_user = ""
-    user_request = ""
-    attachments = ""
-    context = ""
-    has_tool_results = False
-    last_assistant_had_final_answer = False
-
-    for i, msg in enumerate(messages):
-        role = msg.get("role")
-        content = msg.get("content", "")
-
-        if role == "system":
-            raw_system = content
-            context_match = re.search(
-                r"<context>(.*?)</context>", raw_system, re.DOTALL
-            )
-            if context_match:
-                context = context_match.group(0)
-
-        elif role == "user":
-            if isinstance(content, str):
-                raw_user = content
-            elif isinstance(content, list):
-                text_parts = [
-                    item.get("text", "")
-                    for item in content
-                    if isinstance(item, dict) and item.get("type") == "text"
-                ]
-                raw_user = " ".join(text_parts) if text_parts else str(content)
-            else:
-                raw_user = str(content)
-
-            if not context:
-                context_match = re.search(
-                    r"<context>(.*?)</context>", raw_user, re.DOTALL
-                )
-                if context_match:
-                    context = context_match.group(0)
-
-            attachments_match = re.search(
-                r"<attachments>(.*?)</attachments>", raw_user, re.DOTALL
-            )
-            if attachments_match:
-                attachments = attachments_match.group(0)
-            user_request_match = re.search(
-                r"<userRequest>(.*?)</userRequest>", raw_user, re.DOTALL
-            )
-            if user_request_match:
-                user_request = user_request_match.group(1).strip()
-            else:
-                user_request = raw_user
-            has_tool_results = False
-
-        elif role == "assistant":
-            assistant_content = msg.get("content", "")
-            if assistant_content and agent_workflow.has_final_answer_marker(
-                assistant_content
-            ):
-                last_assistant_had_final_answer = True
-            else:
-                last_assistant_had_final_answer = False
-
-        elif role == "tool":
-            has_tool_results = True
+    # Explicit nulls fall back to the defaults, whichever codec decoded.
+    messages = body.get("messages") or []
+    stream = bool(body.get("stream"))
+    tools = body.get("tools") or []
+
+    scan = scan_messages(messages, agent_workflow.has_final_answer_marker)
+    raw_system = scan["raw_system"]
+    system_tags = scan["system_tags"]
+    raw_user = scan["raw_user"]
+    user_request = scan["user_request"]
+    attachments = scan["attachments"]
+    context = scan["context"]
+    has_tool_results = scan["has_tool_results"]
+    last_assistant_had_final_answer = scan["last_assistant_had_final_answer"]
 
     if raw_system or raw_user:
         dump_raw_prompts(raw_system, raw_user)
-        print(
-            f"aved raw prompts - system: {len(raw_system)} chars, user: {len(raw_user)} chars"
-        )
-    else:
-        print(f"No system/user messages to dump")
 
     has_assistant_messages = any(msg.get("role") == "assistant" for msg in messages)
     is_new_conversation = not has_assistant_messages
 
-    if is_new_conversation:
-        global active_conversation_id
-        active_conversation_id = None
-        print(
-            f"New conversation detected (no assistant messages, total messages: {len(messages)})"
-        )
-    else:
-        print(
-            f"Continuing conversation (has assistant messages, total messages: {len(messages)})"
+    api_key = request.headers.get("authorization", "").replace("Bearer ", "")
+    session = sessions.get(session_fingerprint(messages, api_key))
+
+    use_cache = not cache_opt_out(request)
+
+    log_chat.info(
+        "model=%s stream=%s tools=%d messages=%d %s",
+        model,
+        stream,
+        len(tools),
+        len(messages),
+        "new" if is_new_conversation else "continuing",
+    )
+    if log_chat.isEnabledFor(logging.DEBUG):
+        log_chat.debug(
+            "roles=%s system=%d chars user=%d chars",
+            [msg.get("role") for msg in messages],
+            len(raw_system),
+            len(raw_user),
         )
 
     if tools and (not has_tool_results or last_assistant_had_final_answer):
-        clean_text, tool_calls, conversation_id = (
-            await agent_workflow.handle_initial_tool_request(
+        error_message = "Failed to create conversation"
+
+        async def start_workflow(on_delta):
+            return await agent_workflow.handle_initial_tool_request(
+                session,
                 model,
                 user_request,
                 tools,
@@ -382,121 +577,91 @@ async def chat_completions(request: Request):
                 context,
                 raw_system,
                 is_first=is_new_conversation,
+                on_delta=on_delta if UPSTREAM_STREAMING else None,
+                use_cache=use_cache,
+                system_tags=system_tags,
             )
-        )
-        if conversation_id is None:
-            return {
-                "error": {
-                    "message": "Failed to create conversation",
-                    "type": "server_error",
-                }
-            }, 500
-    else:
-        if has_tool_results and not last_assistant_had_final_answer:
-            clean_text, tool_calls, conversation_id = (
-                await agent_workflow.handle_tool_response(model, messages, raw_system)
+
+    elif has_tool_results and not last_assistant_had_final_answer:
+        error_message = "Failed to create conversation"
+
+        async def start_workflow(on_delta):
+            return await agent_workflow.handle_tool_response(
+                session,
+                model,
+                messages,
+                raw_system,
+                on_delta=on_delta if UPSTREAM_STREAMING else None,
+                use_cache=use_cache,
+                system_tags=system_tags,
             )
-            if conversation_id is None:
-                return {
-                    "error": {
-                        "message": "Failed to create conversation",
-                        "type": "server_error",
-                    }
-                }, 500
-        else:
-            clean_text, tool_calls, conversation_id = (
-                await agent_workflow.handle_simple_user_message(
-                    model,
-                    user_request,
-                    attachments,
-                    raw_system,
-                    is_first=is_new_conversation,
-                )
+
+    else:
+        error_message = "Failed to get response from Outlier"
+
+        async def start_workflow(on_delta):
+            return await agent_workflow.handle_simple_user_message(
+                session,
+                model,
+                user_request,
+                attachments,
+                raw_system,
+                is_first=is_new_conversation,
+                on_delta=on_delta if UPSTREAM_STREAMING else None,
+                use_cache=use_cache,
+                system_tags=system_tags,
             )
-            if conversation_id is None:
-                return {
-                    "error": {
-                        "message": "Failed to get response from Outlier",
-                        "type": "server_error",
-                    }
-                }, 500
+
+    async def run_workflow(on_delta):
+        # Runs only for the request that starts the flight. A retry that
+        # joins one must not wipe the conversation its leader is creating.
+        if is_new_conversation:
+            session.reset()
+        return await start_workflow(on_delta)
+
+    key = flight_key(await request.body(), api_key, use_cache)
+    if stream and UPSTREAM_STREAMING:
+        return stream_upstream_completion(
+            model,
+            lambda on_delta: flights.run(key, run_workflow, on_delta),
+            parse_tools=bool(tools),
+            error_message=error_message,
+            traces=traces,
+            started=started,
+        )
+
+    tracing.collect(traces)
+    clean_text, tool_calls, conversation_id = await flights.run(key, run_workflow)
+    if conversation_id is None:
+        return {
+            "error": {
+                "message": error_message,
+                "type": "server_error",
+            }
+        }, 500
+    if tool_calls:
+        metrics.TOOL_CALLS.labels(metric_model(model)).inc(len(tool_calls))
 
     completion_id = f"chatcmpl-{uuid.uuid4().hex[:29]}"
     created_time = int(time.time())
 
     if stream:
 
+        encoder = SSEEncoder(completion_id, created_time, model)
+
         async def generate():
-            chunk_id = completion_id
-            first_chunk = {
-                "id": chunk_id,
-                "object": "chat.completion.chunk",
-                "created": created_time,
-                "model": model,
-                "system_fingerprint": None,
-                "choices": [
-                    {
-                        "index": 0,
-                        "delta": {"role": "assistant"},
-                        "logprobs": None,
-                        "finish_reason": None,
-                    }
-                ],
-            }
-            yield f"data: {json.dumps(first_chunk)}\n\n"
+            yield encoder.role()
             if tool_calls:
-                for tool_call in tool_calls:
-                    tool_chunk = {
-                        "id": chunk_id,
-                        "object": "chat.completion.chunk",
-                        "created": created_time,
-                        "model": model,
-                        "system_fingerprint": None,
-                        "choices": [
-                            {
-                                "index": 0,
-                                "delta": {"tool_calls": [tool_call]},
-                                "logprobs": None,
-                                "finish_reason": None,
-                            }
-                        ],
-                    }
-                    yield f"data: {json.dumps(tool_chunk)}\n\n"
+                for index, tool_call in enumerate(tool_calls):
+                    yield encoder.tool_calls([{"index": index, **tool_call}])
             elif clean_text:
-                for char in clean_text:
-                    chunk = {
-                        "id": chunk_id,
-                        "object": "chat.completion.chunk",
-                        "created": created_time,
-                        "model": model,
-                        "system_fingerprint": None,
-                        "choices": [
-                            {
-                                "index": 0,
-                                "delta": {"content": char},
-                                "logprobs": None,
-                                "finish_reason": None,
-                            }
-                        ],
-                    }
-                    yield f"data: {json.dumps(chunk)}\n\n"
-            final_chunk = {
-                "id": chunk_id,
-                "object": "chat.completion.chunk",
-                "created": created_time,
-                "model": model,
-                "system_fingerprint": None,
-                "choices": [
-                    {
-                        "index": 0,
-                        "delta": {},
-                        "logprobs": None,
-                        "finish_reason": "tool_calls" if tool_calls else "stop",
-                    }
-                ],
-            }
-            yield f"data: {json.dumps(final_chunk)}\n\n"
-            yield "data: [DONE]\n\n"
+                batcher = ChunkBatcher(**CHUNK_CONFIG)
+                for batch in batcher.split(clean_text):
+                    yield encoder.content(batch)
+            yield encoder.finish("tool_calls" if tool_calls else "stop")
+            if SSE_TIMING_COMMENT:
+                yield timing_comment(traces, started)
+            yield encoder.done()
 
         return StreamingResponse(generate(), media_type="text/event-stream")
     else:
@@ -534,7 +699,10 @@ async def chat_completions(request: Request):
                 "total_tokens": prompt_tokens + completion_tokens,
             },
         }
-        return response
+        summary = tracing.summarize(traces, (time.perf_counter() - started) * 1000)
+        return codec.json_response(
+            response, headers={"Server-Timing": tracing.server_timing(summary)}
+        )
 
 
 if __name__ == "__main__":
@@ -557,8 +725,12 @@ if __name__ == "__main__":
     print("   ├─ Gemini 2.5 Pro/Flash")
     print("   ├─ Grok 3, Llama 4 Maverick")
     print("   └─ Qwen3, DeepSeek-R1")
+    if codec.FAST:
+        print("Fast codec: msgspec")
     uvicorn.run(
         app,
         host=host,
         port=port,
+        loop=os.getenv("oai_loop", "auto"),
+        http=os.getenv("oai_http", "auto"),
     )
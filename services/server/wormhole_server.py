@@ -2,72 +2,241 @@ import asyncio
 import websockets
 import json
 import os
+import time
 from dotenv import load_dotenv
+from prometheus_client import Gauge, start_http_server
 
 load_dotenv()
 
 connected_clients = set()
 pending_responses = {}
+client_in_flight = {}
+client_latency = {}
+
+LATENCY_SMOOTHING = 0.2
+# Envelope headers are "@", a request id, a kind and a newline.
+ENVELOPE_HEADER_MAX = 128
+
+Gauge(
+    "wormhole_relay_connected_clients", "Page clients connected to the relay"
+).set_function(lambda: len(connected_clients))
+Gauge(
+    "wormhole_relay_pending_responses", "Commands waiting for a page client result"
+).set_function(lambda: len(pending_responses))
+
+
+def pick_client(exclude=()):
+    candidates = [client for client in connected_clients if client not in exclude]
+    if not candidates:
+        return None
+    return min(
+        candidates,
+        key=lambda client: (
+            client_in_flight.get(client, 0),
+            client_latency.get(client, 0.0),
+        ),
+    )
+
+
+def now_ms():
+    return time.time() * 1000
+
+
+def parse_envelope(message):
+    """
+    Split an envelope frame, "@<request_id> <kind>\n<body>", into its parts
+    without touching the body. Returns None for plain JSON messages.
+    """
+    if not isinstance(message, str) or not message.startswith("@"):
+        return None
+    header_end = message.find("\n", 0, ENVELOPE_HEADER_MAX)
+    if header_end < 0:
+        return None
+    request_id, _, kind = message[1:header_end].partition(" ")
+    return request_id, kind, header_end + 1
+
+
+def legacy_message(message, request_id, kind, body_start):
+    """The plain JSON form of an envelope frame, for senders without envelopes."""
+    body = message[body_start:]
+    if kind == "delta":
+        return json.dumps({"type": "delta", "content": body, "request_id": request_id})
+    tail = f'"request_id":{json.dumps(request_id)}}}'
+    return f"{body[:-1]}{tail}" if body == "{}" else f"{body[:-1]},{tail}"
+
+
+def add_trace_mark(message, name):
+    """Add a hop mark to an encoded message without decoding it again."""
+    if not isinstance(message, str) or not message.endswith("}"):
+        return message
+    mark = f'"trace_{name}":{now_ms()}}}'
+    return (
+        f"{message[:-1]}{mark}" if message.endswith("{}") else f"{message[:-1]},{mark}"
+    )
+
+
+async def send_to_client(request_id):
+    pending = pending_responses[request_id]
+    while True:
+        client = pick_client(exclude=pending["tried"])
+        if client is None:
+            pending_responses.pop(request_id, None)
+            await reply_error(pending["sender"], request_id, "No clients connected")
+            return
+        pending["tried"].add(client)
+        payload = pending["payload"]
+        if "trace" in payload:
+            payload["trace"]["relay_out"] = now_ms()
+        try:
+            await client.send(json.dumps(payload))
+        except:
+            connected_clients.discard(client)
+            continue
+        pending["client"] = client
+        pending["started"] = time.monotonic()
+        client_in_flight[client] = client_in_flight.get(client, 0) + 1
+        print(
+            f"│   └─ Sent command '{pending['command']}' to page client "
+            f"(in flight: {client_in_flight[client]})"
+        )
+        return
+
+
+def complete_request(request_id, record_latency=True):
+    pending = pending_responses.pop(request_id)
+    client = pending["client"]
+    if client in client_in_flight:
+        client_in_flight[client] = max(0, client_in_flight[client] - 1)
+        if record_latency:
+            elapsed = time.monotonic() - pending["started"]
+            previous = client_latency.get(client)
+            client_latency[client] = (
+                elapsed
+                if previous is None
+                else previous + LATENCY_SMOOTHING * (elapsed - previous)
+            )
+    return pending["sender"]
+
+
+async def reply_error(sender_ws, request_id, error):
+    try:
+        await sender_ws.send(
+            json.dumps({"success": False, "error": error, "request_id": request_id})
+        )
+    except websockets.exceptions.ConnectionClosed:
+        pass
+
+
+async def fail_over(client):
+    for request_id, pending in list(pending_responses.items()):
+        if pending["client"] is not client:
+            continue
+        if pending["streamed"]:
+            pending_responses.pop(request_id, None)
+            await reply_error(
+                pending["sender"],
+                request_id,
+                "Page client disconnected while streaming",
+            )
+            continue
+        print(f"│   └─ Re-routing request {request_id} to another page client")
+        await send_to_client(request_id)
+
+
+async def dispatch_command(websocket, parsed):
+    command = parsed.get("command")
+    request_id = parsed.get("request_id")
+
+    if not connected_clients:
+        await reply_error(websocket, request_id, "No clients connected")
+        return
+
+    payload = {
+        "command": command,
+        "params": parsed.get("params"),
+        "request_id": request_id,
+        "envelope": 1,
+    }
+    if isinstance(parsed.get("trace"), dict):
+        payload["trace"] = {**parsed["trace"], "relay_in": now_ms()}
+
+    pending_responses[request_id] = {
+        "sender": websocket,
+        "command": command,
+        "payload": payload,
+        "client": None,
+        "started": None,
+        "streamed": False,
+        "tried": set(),
+        "envelope": bool(parsed.get("envelope")),
+    }
+    await send_to_client(request_id)
+
+
+async def forward_envelope(message, request_id, kind, body_start):
+    """Route an envelope frame by its header; the body is never decoded."""
+    pending = pending_responses.get(request_id)
+    if pending is None:
+        print(f"│   └─ Dropping {kind} for unknown request {request_id}")
+        return
+    sender_ws = pending["sender"]
+    if kind == "delta":
+        pending["streamed"] = True
+    else:
+        complete_request(request_id)
+        if "trace" in pending["payload"]:
+            message = add_trace_mark(message, "relay_result")
+    if not pending["envelope"]:
+        message = legacy_message(message, request_id, kind, body_start)
+    try:
+        await sender_ws.send(message)
+    except websockets.exceptions.ConnectionClosed:
+        pass
 
 
 async def handler(websocket):
-    first_message = True
     is_page_client = False
     is_sender = False
 
     try:
         async for message in websocket:
-            if first_message:
-                first_message = False
+            if not is_page_client:
                 try:
                     parsed = json.loads(message)
-                    if parsed.get("type") == "sender":
-                        is_sender = True
-                        command = parsed.get("command")
-                        params = parsed.get("params")
-                        request_id = parsed.get("request_id")
-
-                        if not connected_clients:
-                            await websocket.send(
-                                json.dumps(
-                                    {"success": False, "error": "No clients connected"}
-                                )
-                            )
-                            return
-                        else:
-                            message_to_send = json.dumps(
-                                {
-                                    "command": command,
-                                    "params": params,
-                                    "request_id": request_id,
-                                }
-                            )
-                            for client in list(connected_clients):
-                                try:
-                                    await client.send(message_to_send)
-                                    print(
-                                        f"│   └─ Sent command '{command}' to page client"
-                                    )
-                                except:
-                                    connected_clients.discard(client)
-
-                            pending_responses[request_id] = websocket
-                        continue
                 except:
-                    pass
+                    parsed = None
+                if isinstance(parsed, dict) and parsed.get("type") == "sender":
+                    is_sender = True
+                    await dispatch_command(websocket, parsed)
+                    continue
+                if is_sender:
+                    print("│   └─ Ignoring non-command message from sender")
+                    continue
 
-            if not is_page_client and not is_sender:
+            if not is_page_client:
                 is_page_client = True
                 connected_clients.add(websocket)
                 print(
                     f"├─ Page client connected. Total clients: {len(connected_clients)}"
                 )
 
+            envelope = parse_envelope(message)
+            if envelope is not None:
+                await forward_envelope(message, *envelope)
+                continue
+
             try:
                 parsed = json.loads(message)
                 request_id = parsed.get("request_id")
                 if request_id and request_id in pending_responses:
-                    sender_ws = pending_responses.pop(request_id)
+                    if parsed.get("type") == "delta":
+                        pending = pending_responses[request_id]
+                        pending["streamed"] = True
+                        sender_ws = pending["sender"]
+                    else:
+                        sender_ws = complete_request(request_id)
+                        if "trace" in parsed:
+                            message = add_trace_mark(message, "relay_result")
                     await sender_ws.send(message)
                 else:
                     print(f"│   └─ Response from page: {message}")
@@ -82,14 +251,32 @@ async def handler(websocket):
             print(
                 f"├─ Page client disconnected. Total clients: {len(connected_clients)}"
             )
+            await fail_over(websocket)
+            client_in_flight.pop(websocket, None)
+            client_latency.pop(websocket, None)
+        if is_sender:
+            for request_id, pending in list(pending_responses.items()):
+                if pending["sender"] is websocket:
+                    complete_request(request_id, record_latency=False)
 
 
 async def main():
     port = int(os.getenv("wormhole_port", 8765))
     host = os.getenv("wormhole_host", "0.0.0.0")
+    unix_path = os.getenv("wormhole_unix_socket")
+    metrics_port = int(os.getenv("wormhole_metrics_port", "9108"))
 
     print(f"┌─ ws://{host}:{port}")
-    async with websockets.serve(handler, host, port):
+    if metrics_port:
+        start_http_server(metrics_port)
+        print(f"├─ http://{host}:{metrics_port}/metrics")
+    async with websockets.serve(handler, host, port, max_size=None):
+        if unix_path:
+            if os.path.exists(unix_path):
+                os.unlink(unix_path)
+            print(f"├─ ws+unix://{unix_path}")
+            async with websockets.unix_serve(handler, unix_path, max_size=None):
+                await asyncio.Future()
         await asyncio.Future()
 
 